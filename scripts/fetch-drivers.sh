@@ -67,11 +67,21 @@ if [[ "${1:-}" == "--clean" ]]; then
     exit 0
 fi
 
-if [[ -d "$DRIVERS_DIR" ]] && [[ -n "$(ls -A "$DRIVERS_DIR" 2>/dev/null)" ]]; then
+# Prefer the concurrent, content-addressed fetcher (tools/fetch_drivers.py,
+# driven by tools/driver_manifest.json). Extra options such as
+# "--mirror DIR" can be passed through FETCH_DRIVERS_ARGS.
+if command -v python3 >/dev/null 2>&1 && [[ "${FETCH_DRIVERS_LEGACY:-0}" != "1" ]]; then
+    log "Fetching driver sources with tools/fetch_drivers.py..."
+    # shellcheck disable=SC2086
+    python3 "$REPO_DIR/tools/fetch_drivers.py" --out-dir "$DRIVERS_DIR" ${FETCH_DRIVERS_ARGS:-}
+    SKIP_LEGACY_FETCH=1
+elif [[ -d "$DRIVERS_DIR" ]] && [[ -n "$(ls -A "$DRIVERS_DIR" 2>/dev/null)" ]]; then
     log "extracted-drivers/ already exists. Use --clean to re-fetch."
     exit 0
 fi
 
+# Legacy sequential fetch (no python3, or FETCH_DRIVERS_LEGACY=1)
+if [[ "${SKIP_LEGACY_FETCH:-0}" != "1" ]]; then
 mkdir -p "$DRIVERS_DIR"
 
 # ──────────────────────────────────────────────
@@ -164,11 +174,20 @@ mkdir -p "$DRIVERS_DIR/axp20x_ac_power"
 download "$MAINLINE_RAW/drivers/power/supply/axp20x_ac_power.c" "$DRIVERS_DIR/axp20x_ac_power/axp20x_ac_power.c"
 make_simple_makefile "$DRIVERS_DIR/axp20x_ac_power" "axp20x_ac_power"
 
+fi # legacy fetch
+
 # ──────────────────────────────────────────────
 # 6. Apply CM5-specific patches
 # ──────────────────────────────────────────────
 PATCHES_DIR="$REPO_DIR/patches"
-if [[ -d "$PATCHES_DIR" ]] && ls "$PATCHES_DIR"/*.patch >/dev/null 2>&1; then
+if [[ -d "$PATCHES_DIR" ]] && ls "$PATCHES_DIR"/*.patch >/dev/null 2>&1 && \
+   command -v python3 >/dev/null 2>&1 && [[ "${FETCH_DRIVERS_LEGACY:-0}" != "1" ]]; then
+    # Parses every patch once, skips the ones recorded as applied and writes
+    # each target file once (see tools/patch_engine.py)
+    log "Applying CM5-specific patches with tools/patch_engine.py..."
+    python3 "$REPO_DIR/tools/patch_engine.py" --root "$REPO_DIR" --patches-dir "$PATCHES_DIR" || \
+        err "  Some patches did not apply — files may have changed upstream"
+elif [[ -d "$PATCHES_DIR" ]] && ls "$PATCHES_DIR"/*.patch >/dev/null 2>&1; then
     log "Applying CM5-specific patches..."
     for p in "$PATCHES_DIR"/*.patch; do
         if patch --dry-run -p1 -d "$REPO_DIR" < "$p" >/dev/null 2>&1; then
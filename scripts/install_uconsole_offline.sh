@@ -90,6 +90,14 @@ fi
 sudo cp $(which qemu-aarch64-static) "$ROOT_DIR/usr/bin/"
 sudo cp -r "$REPO_DIR/extracted-drivers" "$ROOT_DIR/tmp/"
 
+if command -v python3 >/dev/null 2>&1; then
+    echo "=== Compiling Drivers for ARM64 ==="
+    # Builds the driver directories in parallel (only make runs in the chroot)
+    # and reuses modules cached for unchanged sources, patches and kernel
+    sudo python3 "$REPO_DIR/tools/build_modules.py" --root "$ROOT_DIR" \
+        --drivers-dir /tmp/extracted-drivers --out-dir /tmp/built-modules \
+        --cache-dir "${UCONSOLE_MODULE_CACHE:-$HOME/.cache/uconsole-modules}"
+else
 # Create the compilation script to run inside the chroot
 sudo bash -c "cat << 'EOF' > $ROOT_DIR/tmp/build.sh
 #!/bin/bash
@@ -117,6 +125,7 @@ sudo chmod +x "$ROOT_DIR/tmp/build.sh"
 
 echo "=== Compiling Drivers for ARM64 (Takes 1-2 minutes) ==="
 sudo chroot "$ROOT_DIR" /bin/bash /tmp/build.sh
+fi
 
 echo "=== Installing Drivers ==="
 sudo mkdir -p "$ROOT_DIR/var/lib/modules-overlay"
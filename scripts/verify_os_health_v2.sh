@@ -0,0 +1,105 @@
+#!/usr/bin/env bash
+# verify_os_health_v2.sh — Offline health check of a flashed uConsole CM5 image
+#
+# Mounts the EFI and root partitions of a device or image read-only and runs
+# tools/os_health.py over them: dtoverlay= lines vs. the .dtbo files on the
+# EFI partition, cmdline.txt root= vs. /etc/fstab, os-release, the installed
+# kernels and the modules in /var/lib/modules-overlay.
+#
+# Usage: ./scripts/verify_os_health_v2.sh <device|image> [boot_dir root_dir]
+#
+# Environment:
+#   EXTRACT_ONLY=1   Do not mount anything; inspect partition trees that were
+#                    already extracted (default ./boot-sim and ./root-sim, or
+#                    boot_dir/root_dir). Useful in CI and for copied images.
+#   HEALTH_ARGS      Extra options for tools/os_health.py (e.g. --json)
+#
+# Exit status: 0 healthy, 2 warnings or errors found, 1 could not inspect.
+
+set -euo pipefail
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_DIR="$(dirname "$SCRIPT_DIR")"
+INSPECTOR="$REPO_DIR/tools/os_health.py"
+
+log() { echo -e "\033[0;32m[HEALTH]\033[0m $1" >&2; }
+err() { echo -e "\033[0;31m[ERROR]\033[0m $1" >&2; }
+
+if [[ $# -lt 1 ]]; then
+    echo "Usage: $0 <device|image> [boot_dir root_dir]" >&2
+    exit 1
+fi
+
+TARGET="$1"
+
+if [[ "${EXTRACT_ONLY:-0}" == "1" ]]; then
+    BOOT_DIR="${2:-$PWD/boot-sim}"
+    ROOT_DIR="${3:-$PWD/root-sim}"
+    log "Inspecting extracted trees $BOOT_DIR and $ROOT_DIR"
+    # shellcheck disable=SC2086
+    exec python3 "$INSPECTOR" --boot "$BOOT_DIR" --root "$ROOT_DIR" ${HEALTH_ARGS:-}
+fi
+
+WORK_DIR="$(mktemp -d)"
+LOOP_DEV=""
+MOUNTS=()
+
+cleanup() {
+    for ((i=${#MOUNTS[@]}-1; i>=0; i--)); do
+        sudo umount "${MOUNTS[$i]}" 2>/dev/null || true
+    done
+    if [[ -n "$LOOP_DEV" ]]; then
+        sudo losetup -d "$LOOP_DEV" 2>/dev/null || true
+    fi
+    rm -rf "$WORK_DIR"
+}
+trap cleanup EXIT
+
+DEVICE="$TARGET"
+if [[ -f "$TARGET" ]]; then
+    LOOP_DEV="$(sudo losetup --find --show --read-only --partscan "$TARGET")"
+    DEVICE="$LOOP_DEV"
+elif [[ ! -b "$TARGET" ]]; then
+    err "$TARGET is neither a block device nor an image file"
+    exit 1
+fi
+
+# Partitions are <dev>1, <dev>2, ... or <dev>p1, ... (mmcblk, nvme, loop)
+part() {
+    if [[ -b "${DEVICE}p$1" ]]; then echo "${DEVICE}p$1"; else echo "${DEVICE}$1"; fi
+}
+
+BOOT_DIR="$WORK_DIR/boot"
+ROOT_DIR="$WORK_DIR/root"
+mkdir -p "$BOOT_DIR" "$ROOT_DIR"
+
+if ! sudo mount -o ro "$(part 1)" "$BOOT_DIR"; then
+    err "Could not mount the EFI partition $(part 1)"
+    exit 1
+fi
+MOUNTS+=("$BOOT_DIR")
+
+# The root filesystem is the first later partition with an os-release
+for n in 2 3 4; do
+    dev="$(part "$n")"
+    [[ -b "$dev" ]] || continue
+    if sudo mount -o ro "$dev" "$ROOT_DIR" 2>/dev/null; then
+        if [[ -e "$ROOT_DIR/etc/os-release" || -e "$ROOT_DIR/usr/lib/os-release" ]]; then
+            MOUNTS+=("$ROOT_DIR")
+            break
+        fi
+        sudo umount "$ROOT_DIR"
+    fi
+done
+if [[ ${#MOUNTS[@]} -lt 2 ]]; then
+    err "Could not find the root partition on $DEVICE"
+    exit 1
+fi
+
+log "Inspecting $(part 1) and the root partition of $DEVICE"
+set +e
+# shellcheck disable=SC2086
+sudo python3 "$INSPECTOR" --boot "$BOOT_DIR" --root "$ROOT_DIR" ${HEALTH_ARGS:-}
+RC=$?
+set -e
+exit "$RC"
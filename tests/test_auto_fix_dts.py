@@ -1,7 +1,12 @@
+import io
 import unittest
 import tempfile
 import shutil
+import os
+import subprocess
+import sys
 from pathlib import Path
+from unittest import mock
 
 # import module using regular package import
 from tools import auto_fix_dts as af
@@ -44,6 +49,8 @@ class TestAutoFixDts(unittest.TestCase):
             # reg should have been added and a backup created; allow for either <0> or <0 0> etc
             self.assertRegex(txt, r'reg\s*=\s*<\s*0(?:\s+0)*\s*>;')
             self.assertTrue((fpath.with_suffix('.dts.orig')).exists())
+            # applying writes only the output and the backup
+            self.assertFalse(fpath.with_suffix('.fixed.dts').exists())
         finally:
             shutil.rmtree(td)
 
@@ -121,6 +128,179 @@ class TestAutoFixDts(unittest.TestCase):
         finally:
             shutil.rmtree(td)
 
+    def test_multiple_add_reg_and_nested_reg(self):
+        content = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__  {
+            #address-cells = <1>;
+            first@1 {
+                compatible = "foo";
+            };
+            second@2 {
+                compatible = "bar";
+                child@5 {
+                    reg = <5>;
+                };
+            };
+        };
+    };
+};
+"""
+        fpath, report, changed, summary, td = self.run_helper_with_file(content, apply=True)
+        try:
+            self.assertTrue(changed)
+            txt = fpath.read_text()
+            # each node gets its own reg, even though the first edit shifts the second node
+            self.assertRegex(txt, r'first@1 \{\n\s+reg = <1>;\n\s+compatible = "foo";')
+            self.assertRegex(txt, r'second@2 \{\n\s+reg = <2>;\n\s+compatible = "bar";')
+        finally:
+            shutil.rmtree(td)
+
+    def test_reg_format_check_follows_fragment_target(self):
+        content = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__  {
+            wide: bus@0 {
+                #address-cells = <2>;
+                #size-cells = <0>;
+            };
+        };
+    };
+    fragment@1 {
+        target = <&wide>;
+        __overlay__  {
+            dev@5 {
+                compatible = "foo";
+            };
+        };
+    };
+};
+"""
+        fpath, report, changed, summary, td = self.run_helper_with_file(content, apply=True)
+        try:
+            self.assertTrue(changed)
+            # the cells of &wide are only known through the fragment target
+            self.assertIn('reg = <0 5>;', fpath.read_text())
+            self.assertIn('pad-reg-check', report.read_text())
+        finally:
+            shutil.rmtree(td)
+
+    def test_assumed_cells_are_not_padded(self):
+        # &i2c1 is not defined here, so its cells are unknown: padding the
+        # one-cell I2C address to dtc's default of 2 would corrupt it
+        content = """/dts-v1/;
+/plugin/;
+
+&i2c1 {
+    rtc@51 {
+        compatible = "nxp,pcf8563";
+        reg = <0x51>;
+    };
+};
+"""
+        td = Path(tempfile.mkdtemp())
+        try:
+            fpath = td / 'rtc.dts'
+            fpath.write_text(content)
+            result = af.process_file(str(fpath), apply=True)
+            self.assertFalse(result[0])
+            self.assertEqual(fpath.read_text(), content)
+            self.assertEqual(result.stats.unresolved, 1)
+            out = io.StringIO()
+            result = af.process_stream(io.StringIO(content), out)
+            self.assertFalse(result[0])
+            self.assertEqual(out.getvalue(), content)
+            self.assertEqual(result.stats.unresolved, 1)
+        finally:
+            shutil.rmtree(td)
+
+    def test_dtc_reads_stdin_and_failed_compile_is_not_applied(self):
+        content = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__  {
+            battery: battery@0 {
+                compatible = "simple-battery";
+            };
+        };
+    };
+};
+"""
+        td = Path(tempfile.mkdtemp())
+        try:
+            bindir = td / 'bin'
+            bindir.mkdir()
+            # fake dtc: record the argv and stdin, then fail the compile
+            (bindir / 'dtc').write_text('#!/bin/sh\necho "$@" > "$DTC_ARGS"\ncat > "$DTC_STDIN"\nexit 1\n')
+            (bindir / 'dtc').chmod(0o755)
+            fpath = td / 'test-overlay.dts'
+            fpath.write_text(content)
+            env = {'PATH': f"{bindir}{os.pathsep}{os.environ['PATH']}",
+                   'DTC_ARGS': str(td / 'args'), 'DTC_STDIN': str(td / 'stdin')}
+            with mock.patch.dict(os.environ, env):
+                result = af.process_file(str(fpath), apply=True, backup=True, report=str(td / 'report.txt'))
+            self.assertEqual(tuple(result), (False, 'not applied due to dtc compile failure'))
+            self.assertFalse(result.ok)
+            self.assertTrue((td / 'args').read_text().strip().endswith(' -'))
+            self.assertIn('reg = <', (td / 'stdin').read_text())
+            # nothing was written: no backup, no .fixed.dts, original untouched
+            self.assertEqual(fpath.read_text(), content)
+            self.assertEqual(sorted(x.name for x in td.iterdir()),
+                             ['args', 'bin', 'report.txt', 'stdin', 'test-overlay.dts'])
+        finally:
+            shutil.rmtree(td)
+
+    def test_batch_mode_isolates_failures(self):
+        content = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__  {
+            battery: battery@0 {
+                compatible = "simple-battery";
+            };
+        };
+    };
+};
+"""
+        td = Path(tempfile.mkdtemp())
+        try:
+            (td / 'a.dts').write_text(content)
+            (td / 'b.dts').write_text('/dts-v1/;\n/ { compatible = "none"; };\n')
+            missing = str(td / 'missing.dts')
+            report = td / 'report.txt'
+            paths = af.collect_dts_files([missing], [str(td)])
+            self.assertEqual([Path(x).name for x in paths], ['missing.dts', 'a.dts', 'b.dts'])
+            results = af.process_files(paths, jobs=2, report=str(report), apply=False)
+            self.assertEqual([r['ok'] for r in results], [False, True, True])
+            self.assertEqual([r['changed'] for r in results], [False, True, False])
+            self.assertIn('File not found', results[0]['error'])
+            text = report.read_text()
+            self.assertIn('missing.dts: auto-fix failed', text)
+            self.assertIn('a.dts: modified 1 nodes', text)
+
+            # the CLI merges the results and fails when any file fails
+            tool = Path(__file__).resolve().parent.parent / 'tools' / 'auto_fix_dts.py'
+            proc = subprocess.run([sys.executable, str(tool), '--dir', str(td), '--file', missing, '-j', '2'],
+                                  capture_output=True, text=True)
+            self.assertEqual(proc.returncode, 1)
+            self.assertIn('3 files processed, 1 failed', proc.stdout)
+        finally:
+            shutil.rmtree(td)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,111 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools import battery_sampler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BatterySamplerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.root = self.tmp / 'axp20x-battery'
+        self.root.mkdir()
+        self.set(status='Discharging', capacity=80, voltage_now=3950000, current_now=-420000, present=1)
+        self.clock = FakeClock()
+
+    def set(self, **values):
+        # Rewrite in place so kept-open handles see the new value, like sysfs
+        for name, value in values.items():
+            with open(self.root / name, 'r+' if (self.root / name).exists() else 'w') as fh:
+                fh.truncate()
+                fh.write(f"{value}\n")
+
+    def sampler(self, size=8):
+        sampler = battery_sampler.Sampler(self.root, size=size, clock=self.clock)
+        self.addCleanup(sampler.close)
+        return sampler
+
+    def test_kept_open_handles_and_ring(self):
+        sampler = self.sampler(size=3)
+        self.assertEqual(sampler.open(), 5)
+        fds = dict(sampler._fds)
+        for capacity in (80, 79, 78, 77):
+            self.set(capacity=capacity)
+            sample = sampler.sample()
+            self.clock.now += 30
+        self.assertEqual(sampler._fds, fds)
+        self.assertEqual(sample.values, {'status': 'Discharging', 'capacity': 77, 'voltage_now': 3950000,
+                                         'current_now': -420000, 'online': None, 'present': 1,
+                                         'health': None, 'temp': None})
+        self.assertEqual([s.get('capacity') for s in sampler.ring], [79, 78, 77])
+        self.assertIs(sampler.latest(), sample)
+        # A handle that stops working is reopened once; if that fails too the value is None
+        os.close(sampler._fds['capacity'])
+        self.assertEqual(sampler.sample().get('capacity'), 77)
+        os.close(sampler._fds['capacity'])
+        (self.root / 'capacity').unlink()
+        sample = sampler.sample()
+        self.assertIsNone(sample.get('capacity'))
+        self.assertEqual(sample.get('voltage_now'), 3950000)
+
+    def test_adaptive_interval(self):
+        sampler = self.sampler()
+        intervals = []
+        for capacity, status in ((60, 'Discharging'), (60, 'Discharging'), (60, 'Discharging'),
+                                 (60, 'Discharging'), (59, 'Discharging'), (16, 'Discharging'),
+                                 (9, 'Discharging'), (9, 'Charging')):
+            self.set(capacity=capacity, status=status)
+            sampler.sample()
+            intervals.append(sampler.interval)
+        self.assertEqual(intervals, [30, 60, 120, 120, 30, 10, 2, 30])
+        self.set(capacity=8, status='Discharging')
+        sampler.sample()
+        self.assertEqual(sampler.state(), 'critical')
+        self.set(capacity=14, voltage_now=3700000)
+        sampler.sample()
+        self.assertEqual(sampler.state(), 'low')
+
+    def test_missing_capacity_backs_off(self):
+        sampler = self.sampler()
+        intervals = []
+        for capacity in ('', '', '', 50, 9, '', ''):
+            self.set(capacity=capacity)
+            sampler.sample()
+            intervals.append(sampler.interval)
+        self.assertEqual(intervals, [60, 120, 120, 30, 2, 4, 8])
+        self.assertEqual(sampler.state(), 'unknown')
+
+    def test_queries_and_cli(self):
+        sampler = self.sampler(size=100)
+        for i in range(10):
+            self.set(capacity=50 - i)
+            sampler.sample()
+            self.clock.now += 60
+        self.assertEqual(len(sampler.window(120)), 3)
+        self.assertAlmostEqual(sampler.average('capacity', 120), 42)
+        self.assertAlmostEqual(sampler.rate('capacity'), -1 / 60)
+        self.assertAlmostEqual(sampler.time_to_empty(), (41 - 8) * 60)
+        out = io.StringIO()
+        slept = []
+        self.assertEqual(battery_sampler.run(sampler, 2, out=out, as_json=True, sleep=slept.append), 2)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(l['capacity'], l['state']) for l in lines], [(41, 'ok'), (41, 'ok')])
+        self.assertEqual(slept, [lines[0]['next']])
+        self.assertEqual(battery_sampler.main(['--sysfs-root', str(self.tmp / 'nope'), '--once']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
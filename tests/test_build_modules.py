@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from tools import build_modules, patch_engine
+from tools.dtc_test import fake_make
+
+
+class BuildModulesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.make = fake_make.install(str(self.tmp / 'bin'))
+        self.kernel = self.tmp / 'kernel'
+        self.kernel.mkdir()
+        (self.kernel / '.config').write_text('CONFIG_DRM=y\n')
+        self.drivers = self.tmp / 'extracted-drivers'
+        for name in ('panel-a', 'panel-b', 'power-c', 'power-d'):
+            d = self.drivers / name
+            d.mkdir(parents=True)
+            (d / f"{name}.c").write_text(f"/* {name} */\n")
+            (d / 'Makefile').write_text(f"obj-m := {name}.o\n")
+        self.out = self.tmp / 'built-modules'
+        self.log = self.tmp / 'make.log'
+        os.environ['FAKE_MAKE_LOG'] = str(self.log)
+        self.addCleanup(os.environ.pop, 'FAKE_MAKE_LOG', None)
+
+    def build(self, jobs=4):
+        builder = build_modules.Builder(self.kernel, self.out, self.tmp / 'cache', make=self.make)
+        return {r['name']: r for r in builder.build(self.drivers, jobs)}
+
+    def made(self):
+        return len(self.log.read_text().splitlines()) if self.log.exists() else 0
+
+    def test_builds_in_parallel_and_reports_timings(self):
+        os.environ['FAKE_MAKE_DELAY'] = '0.4'
+        self.addCleanup(os.environ.pop, 'FAKE_MAKE_DELAY', None)
+        t0 = time.perf_counter()
+        results = self.build(jobs=4)
+        self.assertLess(time.perf_counter() - t0, 1.4)  # sequential would take >= 1.6s
+        self.assertEqual({r['status'] for r in results.values()}, {'built'})
+        self.assertEqual(sorted(p.name for p in self.out.glob('*.ko')),
+                         ['panel-a.ko', 'panel-b.ko', 'power-c.ko', 'power-d.ko'])
+        report = json.loads((self.out / build_modules.REPORT_NAME).read_text())
+        self.assertEqual(len(report['modules']), 4)
+        self.assertTrue(all(m['seconds'] >= 0.4 for m in report['modules']))
+        self.assertIn('LD [M]', (self.out / 'logs' / 'panel-a.log').read_text())
+
+    def test_only_changed_drivers_are_rebuilt(self):
+        self.build()
+        self.assertEqual(self.made(), 4)
+        results = self.build()
+        self.assertEqual({r['status'] for r in results.values()}, {'cached'})
+        self.assertEqual(self.made(), 4)
+        (self.drivers / 'panel-b' / 'panel-b.c').write_text('/* patched */\n')
+        state = {'version': patch_engine.STATE_VERSION, 'files': {}, 'patches': {},
+                 'targets': {'extracted-drivers/power-c/power-c.c': {'patches': [['c.patch', 'abc']], 'pre': 'x', 'post': 'y'}}}
+        (self.drivers / patch_engine.STATE_NAME).write_text(json.dumps(state))
+        results = self.build()
+        self.assertEqual({n: r['status'] for n, r in results.items()},
+                         {'panel-a': 'cached', 'panel-b': 'built', 'power-c': 'built', 'power-d': 'cached'})
+        # a new kernel config invalidates everything
+        (self.kernel / '.config').write_text('CONFIG_DRM=m\n')
+        self.assertEqual({r['status'] for r in self.build().values()}, {'built'})
+
+    def test_failed_build_is_reported_and_not_cached(self):
+        os.environ['FAKE_MAKE_FAIL'] = 'power-d'
+        self.addCleanup(os.environ.pop, 'FAKE_MAKE_FAIL', None)
+        results = self.build()
+        self.assertEqual(results['power-d']['status'], 'failed')
+        self.assertIn('fake failure', (self.out / 'logs' / 'power-d.log').read_text())
+        del os.environ['FAKE_MAKE_FAIL']
+        results = self.build()
+        self.assertEqual(results['power-d']['status'], 'built')
+        self.assertEqual(results['power-c']['status'], 'cached')
+
+    def test_kernel_identity_follows_symlinks_inside_root(self):
+        root = self.tmp / 'root'
+        obj = root / 'usr' / 'src' / 'linux-6.12.25-1-obj' / 'aarch64' / 'default'
+        (obj / 'include' / 'config').mkdir(parents=True)
+        (obj / '.config').write_text('CONFIG_DRM=y\n')
+        (obj / 'Module.symvers').write_text('0x1\tdrm_panel_init\tvmlinux\tEXPORT_SYMBOL\n')
+        (obj / 'include' / 'config' / 'kernel.release').write_text('6.12.25-1-default\n')
+        modules = root / 'lib' / 'modules' / '6.12.25-1-default'
+        modules.mkdir(parents=True)
+        # absolute, as installed by the kernel-devel packages: only valid inside the root
+        (modules / 'build').symlink_to('/usr/src/linux-6.12.25-1-obj/aarch64/default')
+        shutil.copytree(self.drivers, root / 'tmp' / 'extracted-drivers')
+
+        def keys(kernel_dir='/lib/modules/6.12.25-1-default/build', kver='6.12.25-1-default'):
+            builder = build_modules.Builder(kernel_dir, '/tmp/built-modules', self.tmp / 'cache', root=root, kver=kver)
+            return dict(builder.keys('/tmp/extracted-drivers')), builder
+
+        first, builder = keys()
+        self.assertEqual(builder.host(builder.kernel_dir), obj)
+        self.assertNotIn(None, first.values())
+        self.assertNotEqual(builder.kernel_id, build_modules._digest([]))
+        self.assertEqual(keys()[0], first)
+        # a kernel upgrade with unchanged driver sources gets new keys
+        (obj / 'Module.symvers').write_text('0x2\tdrm_panel_init\tvmlinux\tEXPORT_SYMBOL\n')
+        second = keys()[0]
+        self.assertTrue(all(second[d] != first[d] for d in first))
+        self.assertNotEqual(keys(kver='6.12.26-1-default')[0], second)
+        # without any kernel file the cache is not used at all
+        self.assertEqual(set(keys('/lib/modules/6.12.26-1-default/build')[0].values()), {None})
+
+    def test_unidentified_kernel_is_built_without_cache(self):
+        (self.kernel / '.config').unlink()
+        for _ in range(2):
+            self.assertEqual({r['status'] for r in self.build().values()}, {'built'})
+        self.assertEqual(self.made(), 8)
+        self.assertEqual(len(list(self.out.glob('*.ko'))), 4)
+        self.assertFalse(any((self.tmp / 'cache').iterdir()))
+
+
+if __name__ == '__main__':
+    unittest.main()
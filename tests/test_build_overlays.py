@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import build_overlays, file_hash
+from tools.dtc_test import fake_dtc
+
+
+PLAIN = '/dts-v1/;\n/plugin/;\n/ { compatible = "test,plain"; };\n'
+WITH_INCLUDE = '/dts-v1/;\n/plugin/;\n#include "pins.h"\n/ { pin = <PIN>; };\n'
+
+
+@unittest.skipUnless(shutil.which('cpp'), 'cpp not installed')
+class TestBuildOverlays(unittest.TestCase):
+    def setUp(self):
+        self.td = Path(tempfile.mkdtemp())
+        self.src = self.td / 'overlays'
+        self.src.mkdir()
+        (self.src / 'plain.dts').write_text(PLAIN)
+        (self.src / 'inc.dts').write_text(WITH_INCLUDE)
+        (self.src / 'pins.h').write_text('#define PIN 5\n')
+        self.log = self.td / 'dtc.log'
+        bindir = self.td / 'bin'
+        fake_dtc.install(str(bindir))
+        env = {'PATH': f"{bindir}{os.pathsep}{os.environ['PATH']}", 'FAKE_DTC_LOG': str(self.log)}
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+
+    def build(self, **kwargs):
+        sources = sorted(str(f) for f in self.src.glob('*.dts'))
+        return {name: (status, sha) for name, status, sha, _ in build_overlays.build(sources, self.src, **kwargs)}
+
+    def dtc_runs(self):
+        return len(self.log.read_text().splitlines()) if self.log.exists() else 0
+
+    def test_incremental_rebuild(self):
+        first = self.build()
+        self.assertEqual({k: v[0] for k, v in first.items()}, {'inc': 'built', 'plain': 'built'})
+        self.assertEqual(first['plain'][1], file_hash.file_sha256(self.src / 'plain.dtbo'))
+        manifest = json.loads((self.src / build_overlays.MANIFEST_NAME).read_text())
+        self.assertIn(str((self.src / 'pins.h').resolve()), manifest['targets']['inc']['deps'])
+        self.assertEqual(self.dtc_runs(), 2)
+
+        mtime = (self.src / build_overlays.MANIFEST_NAME).stat().st_mtime_ns
+        second = self.build()
+        self.assertEqual({k: v[0] for k, v in second.items()}, {'inc': 'up-to-date', 'plain': 'up-to-date'})
+        self.assertEqual(self.dtc_runs(), 2)
+        self.assertEqual((self.src / build_overlays.MANIFEST_NAME).stat().st_mtime_ns, mtime)
+
+        # a header change only rebuilds the overlay that includes it
+        (self.src / 'pins.h').write_text('#define PIN 6\n')
+        third = self.build()
+        self.assertEqual({k: v[0] for k, v in third.items()}, {'inc': 'built', 'plain': 'up-to-date'})
+        self.assertNotEqual(third['inc'][1], first['inc'][1])
+
+        # so does a touched output or different dtc flags
+        (self.src / 'plain.dtbo').write_bytes(b'junk')
+        self.assertEqual(self.build()['plain'][0], 'built')
+        self.assertEqual({v[0] for v in self.build(flags=['-@', '-I', 'dts', '-O', 'dtb', '-W', 'no-unit_address_vs_reg']).values()}, {'built'})
+
+    def test_include_path_change_rebuilds_cpp_overlays(self):
+        # inc.dts needs cpp, plain.dts does not; only the former depends on -I
+        first, second = self.td / 'inc-a', self.td / 'inc-b'
+        first.mkdir()
+        second.mkdir()
+        self.build(cpp_inc=[str(first)])
+        manifest = json.loads((self.src / build_overlays.MANIFEST_NAME).read_text())
+        self.assertIn(str(first.resolve()), manifest['targets']['inc']['includes'])
+        self.assertIsNone(manifest['targets']['plain']['includes'])
+        self.assertEqual({k: v[0] for k, v in self.build(cpp_inc=[str(first)]).items()},
+                         {'inc': 'up-to-date', 'plain': 'up-to-date'})
+        self.assertEqual({k: v[0] for k, v in self.build(cpp_inc=[str(second)]).items()},
+                         {'inc': 'built', 'plain': 'up-to-date'})
+
+    def test_failed_build_keeps_old_output_and_retries(self):
+        self.build()
+        before = (self.src / 'plain.dtbo').read_bytes()
+        (self.src / 'plain.dts').write_text(PLAIN + '// changed\n')
+        with mock.patch.dict(os.environ, {'FAKE_DTC_RC': '1'}):
+            results = self.build()
+        self.assertEqual(results['plain'][0], 'failed')
+        self.assertEqual((self.src / 'plain.dtbo').read_bytes(), before)
+        self.assertEqual([p.name for p in self.src.glob('.*.tmp')], [])
+        self.assertEqual(self.build()['plain'][0], 'built')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import auto_fix_dts as af
+from tools import dtc_cache
+
+
+OVERLAY = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__  {
+            battery: battery@0 {
+                compatible = "simple-battery";
+            };
+        };
+    };
+};
+"""
+
+FAKE_DTC = """#!/bin/sh
+echo "$@" >> "$FAKE_DTC_LOG"
+exit 0
+"""
+
+
+class TestDtcCache(unittest.TestCase):
+    def setUp(self):
+        self.td = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+
+    def test_get_put_and_counters(self):
+        cache = dtc_cache.DtcCache(self.td / 'cache')
+        key = cache.key('content', 'dtc:1', '-i inc')
+        self.assertNotEqual(key, cache.key('content', 'dtc:1', '-i other'))
+        self.assertNotEqual(key, cache.key('content', 'dtc:2', '-i inc'))
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {'rc': 0, 'output': '', 'reg_format': []})
+        self.assertEqual(cache.get(key)['rc'], 0)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0})
+
+    def test_evict_by_age_and_size(self):
+        cache = dtc_cache.DtcCache(self.td / 'cache', max_bytes=None, max_age=3600)
+        old, new = cache.key('old'), cache.key('new')
+        cache.put(old, {'output': 'x'})
+        cache.put(new, {'output': 'y'})
+        stale = time.time() - 7200
+        os.utime(cache._path(old), (stale, stale))
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.get(old))
+        self.assertIsNotNone(cache.get(new))
+
+        cache = dtc_cache.DtcCache(self.td / 'cache', max_bytes=1, max_age=None)
+        self.assertEqual(cache.evict(), 1)
+        self.assertFalse(list((self.td / 'cache').glob('*/*.json')))
+
+    def test_unchanged_input_runs_no_dtc(self):
+        bindir = self.td / 'bin'
+        bindir.mkdir()
+        (bindir / 'dtc').write_text(FAKE_DTC)
+        (bindir / 'dtc').chmod(0o755)
+        log = self.td / 'dtc.log'
+        env = {'PATH': f"{bindir}{os.pathsep}{os.environ['PATH']}", 'FAKE_DTC_LOG': str(log)}
+        cache = dtc_cache.DtcCache(self.td / 'cache')
+        with mock.patch.dict(os.environ, env):
+            for _ in range(2):
+                dts = self.td / 'overlay.dts'
+                dts.write_text(OVERLAY)
+                changed, _ = af.process_file(str(dts), apply=False, cache=cache)
+                self.assertTrue(changed)
+        # the first run starts dtc once for the compile gate,
+        # the second run is served entirely from the cache
+        self.assertEqual(len(log.read_text().splitlines()), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_included_file_change_invalidates(self):
+        bindir = self.td / 'bin'
+        bindir.mkdir()
+        (bindir / 'dtc').write_text(FAKE_DTC)
+        (bindir / 'dtc').chmod(0o755)
+        log = self.td / 'dtc.log'
+        inc = self.td / 'inc'
+        inc.mkdir()
+        (inc / 'nested.dtsi').write_text('/ { nested = <1>; };\n')
+        (self.td / 'common.dtsi').write_text('/include/ "nested.dtsi"\n')
+        dts = self.td / 'overlay.dts'
+        dts.write_text(OVERLAY + '/include/ "common.dtsi"\n')
+        self.assertEqual([n for n, _ in dtc_cache.include_deps(dts.read_bytes(), self.td, [inc])],
+                         sorted([str((self.td / 'common.dtsi').resolve()), str((inc / 'nested.dtsi').resolve())]))
+        env = {'PATH': f"{bindir}{os.pathsep}{os.environ['PATH']}", 'FAKE_DTC_LOG': str(log)}
+        cache = dtc_cache.DtcCache(self.td / 'cache')
+        with mock.patch.dict(os.environ, env):
+            for value in (1, 1, 2):
+                (inc / 'nested.dtsi').write_text(f"/ {{ nested = <{value}>; }};\n")
+                af.run_dtc(str(dts), f"-i {inc}", cache)
+        # the unchanged second run is a hit, editing the nested include is not
+        self.assertEqual(len(log.read_text().splitlines()), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
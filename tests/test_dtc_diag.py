@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from tools import dtc_diag
+from tools.dtc_test import fake_dtc
+
+
+OUTPUT = """<stdin>:12.3-15.4: Warning (reg_format): /fragment@0/__overlay__/dev@1:reg: property has invalid length (4 bytes) (#address-cells == 2, #size-cells == 1)
+Warning (reg_format): /soc/old@2:reg: property has invalid length (4 bytes) (#address-cells == 2, #size-cells == 1)
+<stdin>:20.5-22.6: Warning (unit_address_vs_reg): /soc/foo@10: node has a unit name, but no reg or ranges property
+ERROR (duplicate_node_names): /soc/bar: Duplicate node name
+  also defined at <stdin>:30.2-31.3
+Error: <stdin>:7.1-2 syntax error
+FATAL ERROR: Unable to parse input tree
+"""
+
+
+class DtcDiagTest(unittest.TestCase):
+    def test_parse_classifies_every_line(self):
+        diags = dtc_diag.parse(OUTPUT)
+        self.assertEqual([(d.severity, d.check) for d in diags], [
+            ('warning', 'reg_format'), ('warning', 'reg_format'), ('warning', 'unit_address_vs_reg'),
+            ('error', 'duplicate_node_names'), ('fatal', None), ('fatal', None)])
+        first = diags[0]
+        self.assertEqual((first.file, first.line, first.col), ('<stdin>', 12, 3))
+        self.assertEqual((first.path, first.prop, first.address_cells), ('/fragment@0/__overlay__/dev@1', 'reg', 2))
+        self.assertEqual(diags[2].path, '/soc/foo@10')
+        self.assertIsNone(diags[2].prop)
+        self.assertEqual(diags[3].notes, ['also defined at <stdin>:30.2-31.3'])
+        self.assertEqual((diags[4].line, diags[4].message), (7, 'syntax error'))
+        self.assertEqual(dtc_diag.reg_format(diags), [('/fragment@0/__overlay__/dev@1', 2), ('/soc/old@2', 2)])
+
+    def test_many_warnings_parse_quickly(self):
+        line = 'Warning (reg_format): /soc/dev@{0:x}:reg: property has invalid length (4 bytes) (#address-cells == 2, #size-cells == 1)\n'
+        text = ''.join(line.format(i) for i in range(20000)) + 'x' * 100000
+        t0 = time.perf_counter()
+        self.assertEqual(len(dtc_diag.reg_format(dtc_diag.parse(text))), 20000)
+        self.assertLess(time.perf_counter() - t0, 5)
+
+    def test_run_stops_at_fatal_error(self):
+        td = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, td)
+        (td / 'stderr').write_text(OUTPUT)
+        dtc = fake_dtc.install(str(td / 'bin'))
+        seen = []
+        env_cmd = ['env', f"FAKE_DTC_STDERR={td / 'stderr'}", 'FAKE_DTC_DELAY=30', dtc, '-o', '/dev/null', '-']
+        t0 = time.perf_counter()
+        result = dtc_diag.run(env_cmd, '/dts-v1/; / { };', on_diagnostic=seen.append)
+        self.assertLess(time.perf_counter() - t0, 20)
+        self.assertTrue(result.stopped)
+        self.assertNotEqual(result.rc, 0)
+        self.assertEqual(seen[-1].severity, 'fatal')
+        self.assertIn('syntax error', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+
+from tools import auto_fix_dts
+from tools import dts_bench
+from tools import dts_parser
+
+
+class TestDtsBench(unittest.TestCase):
+    def test_generated_trees_parse(self):
+        text = dts_bench.generate_overlay(nodes=40, depth=3, fragments=4, missing_ratio=0.25, short_ratio=0.25)
+        tree = dts_parser.parse(text)
+        self.assertTrue(tree.is_plugin())
+        devs = [n for n in tree.walk() if n.basename == 'dev']
+        self.assertEqual(len(devs), 40)
+        self.assertTrue(any('reg' not in n.props for n in devs))
+        self.assertEqual(text, dts_bench.generate_overlay(nodes=40, depth=3, fragments=4, missing_ratio=0.25, short_ratio=0.25))
+        board = dts_parser.parse(dts_bench.generate_board(nodes=30, depth=4))
+        self.assertFalse(board.is_plugin())
+        self.assertEqual(sum(1 for n in board.walk() if n.basename == 'dev'), 30)
+
+    def test_bench_size_offline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            params = {'kind': 'overlay', 'nodes': 10, 'depth': 2, 'fragments': 2}
+            res = dts_bench.bench_size('tiny', params, tmp, repeat=1, cli=False)
+        for metric in ('find_nodes', 'extract_parent_block', 'process_file', 'process_file_fake_dtc'):
+            self.assertIn('min', res[metric])
+        self.assertEqual(res['nodes'], len(auto_fix_dts.find_nodes(dts_bench.generate(**params).splitlines())))
+
+    def test_compare_flags_regressions(self):
+        base = {'results': {'small': {'find_nodes': {'min': 0.1}, 'cli': {'min': 0.001}}}}
+        cur = {'results': {'small': {'find_nodes': {'min': 0.2}, 'cli': {'min': 0.004}, 'nodes': 5}}}
+        self.assertEqual(dts_bench.compare(cur, base), [('small', 'find_nodes', 0.1, 0.2)])
+        self.assertEqual(dts_bench.compare(cur, base, threshold=1.5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
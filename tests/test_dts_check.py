@@ -0,0 +1,92 @@
+import unittest
+
+from tools import dts_check
+from tools import dts_parser
+
+
+OVERLAY = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target = <&i2c1>;
+        __overlay__ {
+            pmic@34 {
+                reg = <0x34>;
+            };
+        };
+    };
+    fragment@1 {
+        target-path = "/soc";
+        __overlay__ {
+            #address-cells = <1>;
+            #size-cells = <1>;
+            mem@1000 {
+                reg = <0x1000 0x100>, <0x2000>;
+            };
+            bus: bus@0 {
+                reg = <0 0x10>;
+                #address-cells = <1>;
+                #size-cells = <1>;
+                dev@1 {
+                    reg = <1 2>;
+                };
+            };
+        };
+    };
+    fragment@2 {
+        target = <&bus>;
+        __overlay__ {
+            dev@2 {
+                reg = <2>;
+            };
+        };
+    };
+};
+"""
+
+
+class TestDtsCheck(unittest.TestCase):
+    def check(self, **kwargs):
+        tree = dts_parser.parse(OVERLAY)
+        return {m.path: m for m in dts_check.check_reg_format(tree, **kwargs)}
+
+    def test_reports_every_mismatch_in_one_pass(self):
+        found = self.check()
+        self.assertEqual(sorted(found), [
+            '/fragment@0/__overlay__/pmic@34',
+            '/fragment@1/__overlay__/mem@1000',
+            '/fragment@2/__overlay__/dev@2',
+        ])
+        pmic = found['/fragment@0/__overlay__/pmic@34']
+        # unknown target: dtc's defaults, flagged as assumed
+        self.assertEqual((pmic.reg_cells, pmic.address_cells, pmic.size_cells, pmic.assumed), (1, 2, 1, True))
+        self.assertIn('(#address-cells == 2, #size-cells == 1)', pmic.message())
+        mem = found['/fragment@1/__overlay__/mem@1000']
+        self.assertEqual((mem.reg_cells, mem.address_cells, mem.size_cells, mem.assumed), (3, 1, 1, False))
+
+    def test_local_label_target_cells(self):
+        found = self.check()
+        # fragment@2 targets &bus, defined in this file with 1/1 cells
+        dev = found['/fragment@2/__overlay__/dev@2']
+        self.assertEqual((dev.address_cells, dev.size_cells, dev.assumed), (1, 1, False))
+
+    def test_value_cells(self):
+        self.assertEqual(dts_check.value_cells('<0x1000 0x100>, <0x2000>'), 3)
+        self.assertEqual(dts_check.value_cells('/bits/ 64 <3>'), 2)
+        self.assertIsNone(dts_check.value_cells('"string"'))
+
+    def test_target_cells_mapping(self):
+        found = self.check(target_cells={'&i2c1': (1, 0)})
+        self.assertNotIn('/fragment@0/__overlay__/pmic@34', found)
+
+    def test_reg_override(self):
+        tree = dts_parser.parse(OVERLAY)
+        pmic = tree.labels['bus'].parent.parent.parent.children[0].children[0].children[0]
+        self.assertEqual(pmic.name, 'pmic@34')
+        found = dts_check.check_reg_format(tree, reg_override={pmic: 3})
+        self.assertNotIn(pmic, [m.node for m in found])
+
+
+if __name__ == '__main__':
+    unittest.main()
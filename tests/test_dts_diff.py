@@ -0,0 +1,83 @@
+import unittest
+
+from tools import dts_diff
+
+
+OLD = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target = <&dsi1>;
+        __overlay__ {
+            status = "okay"; // enable
+            panel@0 {
+                reg = <0>;
+                rotation = <90>;
+            };
+        };
+    };
+    fragment@1 {
+        target = <&i2c1>;
+        __overlay__ {
+            clock-frequency = <100000>;
+        };
+    };
+};
+"""
+
+# same content: reordered, renumbered, reformatted
+REORDERED = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@4 {
+        target = <&i2c1>;
+        __overlay__ { clock-frequency = <0x186a0>; };
+    };
+    fragment@5 {
+        target = <&dsi1>;
+        __overlay__ {
+            panel@0 {
+                rotation = <0x5a>;
+                reg = <0x0>;
+            };
+            status = "okay";
+        };
+    };
+};
+"""
+
+
+def big_tree(n, rotation):
+    nodes = ''.join(f"        node{i}@{i:x} {{ reg = <{i}>; label = \"n{i}\"; }};\n" for i in range(n))
+    return f"/dts-v1/;\n/ {{\n    soc {{\n{nodes}    }};\n    panel {{ rotation = <{rotation}>; }};\n}};\n"
+
+
+class DtsDiffTest(unittest.TestCase):
+    def test_order_and_formatting_are_ignored(self):
+        changes, visited = dts_diff.diff_texts(OLD, REORDERED)
+        self.assertEqual(changes, [])
+        self.assertEqual(visited, 1)
+
+    def test_reports_added_removed_and_changed(self):
+        new = OLD.replace('rotation = <90>;', 'orientation = <3>;') \
+                 .replace('clock-frequency = <100000>;', 'clock-frequency = <400000>;') \
+                 .replace('reg = <0>;\n', 'reg = <0>;\n                port { };\n')
+        changes = dts_diff.diff_texts(OLD, new)[0]
+        got = sorted((c.kind, c.path) for c in changes)
+        self.assertEqual(got, [
+            ('node-added', '/fragment[<&dsi1>]/__overlay__/panel@0/port'),
+            ('prop-added', '/fragment[<&dsi1>]/__overlay__/panel@0/orientation'),
+            ('prop-changed', '/fragment[<&i2c1>]/__overlay__/clock-frequency'),
+            ('prop-removed', '/fragment[<&dsi1>]/__overlay__/panel@0/rotation'),
+        ])
+
+    def test_cost_follows_the_change(self):
+        changes, visited = dts_diff.diff_texts(big_tree(2000, 90), big_tree(2000, 180))
+        self.assertEqual([c.path for c in changes], ['/panel/rotation'])
+        self.assertEqual(visited, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+from tools import auto_fix_dts as af
+from tools import dts_index
+from tools import dts_parser
+
+
+SOURCE = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__ {
+            first@1 {
+                compatible = "a";
+            };
+            second@2 {
+                reg = <2>;
+                third@3 {
+                    compatible = "c";
+                };
+            };
+        };
+    };
+};
+
+&i2c1 {
+    pmic@34 {
+        reg = <0x34>;
+    };
+};
+"""
+
+
+class TestDtsIndex(unittest.TestCase):
+    def test_path_lookup(self):
+        tree = dts_parser.parse(SOURCE)
+        index = dts_index.PathIndex(tree)
+        self.assertEqual(len(index), 8)
+        node = index.lookup('/fragment@0/__overlay__/second@2/third@3')
+        self.assertEqual(node.path, '/fragment@0/__overlay__/second@2/third@3')
+        # dtc names &label blocks /fragment@N/__overlay__/...
+        self.assertEqual(index.lookup('/fragment@1/__overlay__/pmic@34').path, '&i2c1/pmic@34')
+        self.assertIsNone(index.lookup('/fragment@0/__overlay__/missing@9'))
+
+    def test_edit_map_tracks_several_edits(self):
+        tree = dts_parser.parse(SOURCE)
+        nodes = {n.name: n for n in tree.walk()}
+        second = nodes['second@2']
+        reg = second.props['reg']
+        edits = [
+            af.reg_insert_edit(tree, nodes['first@1'], 'reg = <1>;'),
+            (reg.start, reg.end, 'reg = <0 2>;'),
+            af.reg_insert_edit(tree, nodes['third@3'], 'reg = <3>;'),
+        ]
+        moved = dts_index.EditMap(SOURCE, edits)
+        fixed = af.apply_edits(SOURCE, edits)
+        for name in ('first@1', 'second@2', 'third@3', 'pmic@34'):
+            start, end = moved.span(nodes[name])
+            self.assertTrue(fixed[start:end].startswith(name + ' {'), name)
+            self.assertTrue(fixed[start:end].endswith('};'), name)
+            line = moved.line(nodes[name].start, tree.line_of(nodes[name].start))
+            self.assertEqual(fixed.splitlines()[line].strip(), name + ' {')
+        start, end = moved.span(reg)
+        self.assertEqual(fixed[start:end], 'reg = <0 2>;')
+
+
+if __name__ == '__main__':
+    unittest.main()
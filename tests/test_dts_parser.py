@@ -0,0 +1,96 @@
+import unittest
+
+from tools import dts_parser
+from tools import auto_fix_dts as af
+
+
+SAMPLE = """/dts-v1/;
+/plugin/;
+
+#include <dt-bindings/gpio/gpio.h>
+
+/ {
+    compatible = "brcm,bcm2712";
+    /* braces in comments { are ignored } */
+    fragment@0 {
+        target = <&i2c1>;
+        __overlay__ {
+            #address-cells = <1>;
+            #size-cells = <0>;
+            note = "a } string { with braces";
+            pmic: pmic@34 {
+                reg = <0x34>;
+                gpios = <&rp1_gpio 10 GPIO_ACTIVE_LOW>; // trailing } comment
+                battery: battery-power-supply {
+                    status = "okay";
+                };
+                stale@1 {
+                    status = "disabled";
+                };
+                /delete-node/ stale@1;
+                /delete-property/ gpios;
+            };
+        };
+    };
+};
+"""
+
+
+class TestDtsParser(unittest.TestCase):
+    def test_tree_structure_and_paths(self):
+        tree = dts_parser.parse(SAMPLE)
+        self.assertEqual(tree.includes, ['dt-bindings/gpio/gpio.h'])
+        self.assertTrue(tree.is_plugin())
+        paths = [n.path for n in tree.walk()]
+        self.assertEqual(paths, [
+            '/',
+            '/fragment@0',
+            '/fragment@0/__overlay__',
+            '/fragment@0/__overlay__/pmic@34',
+            '/fragment@0/__overlay__/pmic@34/battery-power-supply',
+        ])
+        overlay = tree.roots[0].children[0].children[0]
+        self.assertEqual(overlay.props['note'].value, '"a } string { with braces"')
+        self.assertEqual(dts_parser.prop_int(overlay, '#address-cells'), 1)
+
+    def test_labels_spans_and_deletions(self):
+        tree = dts_parser.parse(SAMPLE)
+        pmic = tree.labels['pmic']
+        self.assertEqual((pmic.basename, pmic.unit, pmic.label), ('pmic', '34', 'pmic'))
+        self.assertTrue(SAMPLE[pmic.start:pmic.end].startswith('pmic: pmic@34 {'))
+        self.assertTrue(SAMPLE[pmic.start:pmic.end].endswith('};'))
+        self.assertIs(tree.labels['battery'].parent, pmic)
+        reg = pmic.props['reg']
+        self.assertEqual(SAMPLE[reg.start:reg.end], 'reg = <0x34>;')
+        self.assertEqual(SAMPLE[reg.value_start:reg.value_end], '<0x34>')
+        # /delete-node/ and /delete-property/ take effect in the tree
+        self.assertIsNone(pmic.child('stale@1'))
+        self.assertEqual([n.name for n in tree.deleted], ['stale@1'])
+        self.assertNotIn('gpios', pmic.props)
+
+    def test_cell_groups(self):
+        groups = dts_parser.cell_groups('<&rp1_clocks 46>, <(1 << 4) 0x10 /* c */>')
+        self.assertEqual(groups, [['&rp1_clocks', '46'], ['(1 << 4)', '0x10']])
+        self.assertEqual(dts_parser.cell_int('0x10'), 16)
+        self.assertIsNone(dts_parser.cell_int('GPIO_ACTIVE_LOW'))
+
+    def test_reference_nodes_and_truncated_input(self):
+        tree = dts_parser.parse('&i2c1 {\n\tdev@50 {\n\t\treg = <0x50>;\n')
+        self.assertEqual([n.path for n in tree.walk()], ['&i2c1', '&i2c1/dev@50'])
+        self.assertEqual(tree.roots[0].end, len(tree.text))
+
+    def test_find_nodes_compat(self):
+        lines = SAMPLE.splitlines()
+        nodes = af.find_nodes(lines)
+        self.assertEqual([(n[1], n[2]) for n in nodes], [('fragment', '0'), ('pmic', '34')])
+        label, name, unit, start, end, indent = nodes[1]
+        self.assertEqual(label, 'pmic')
+        self.assertIn('pmic@34 {', lines[start])
+        self.assertEqual(lines[end].strip(), '};')
+        self.assertEqual(indent, ' ' * 12)
+        pstart, pend = af.extract_parent_block(lines, start)
+        self.assertIn('__overlay__ {', lines[pstart])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import auto_fix_dts as af
+from tools import dts_preprocess, dts_report
+from tools.dtc_test import fake_dtc
+
+
+OVERLAY = """/dts-v1/;
+/plugin/;
+
+#include <dt-bindings/gpio/gpio.h>
+#include "board.h"
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__ {
+            #address-cells = <2>;
+            #size-cells = <0>;
+            pmic@34 {
+                reg = <PMIC_REG>;
+                gpios = <&gpio 5 GPIO_ACTIVE_LOW>;
+            };
+            dev@10 {
+                reg = <0x10>;
+            };
+        };
+    };
+};
+"""
+
+
+@unittest.skipUnless(shutil.which('cpp'), 'cpp not installed')
+class TestDtsPreprocess(unittest.TestCase):
+    def setUp(self):
+        self.td = Path(tempfile.mkdtemp())
+        self.dts = self.td / 'overlay.dts'
+        self.dts.write_text(OVERLAY)
+        self.header = self.td / 'board.h'
+        self.header.write_text('#define PMIC_REG 0 0x34\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+
+    def test_line_map_and_deps(self):
+        pre = dts_preprocess.preprocess(OVERLAY, str(self.dts))
+        self.assertIn('reg = <0 0x34>;', pre.text)
+        self.assertEqual(sorted(Path(d).name for d in pre.deps), ['board.h', 'gpio.h'])
+        lines = pre.text.split('\n')
+        idx = next(i for i, line in enumerate(lines) if '0 0x34' in line)
+        self.assertEqual(pre.line_map.source(idx), (str(self.dts), 14))
+        self.assertIsNone(dts_preprocess.preprocess('/dts-v1/;\n/ { };\n', str(self.dts)))
+        depfile = self.td / 'overlay.d'
+        dts_preprocess.write_depfile(depfile, 'overlay.dtbo', pre.deps)
+        self.assertTrue(depfile.read_text().startswith('overlay.dtbo: '))
+
+    def test_cache_reruns_cpp_only_when_a_header_changes(self):
+        cache = dts_preprocess.PreprocessCache(self.td / 'cache')
+        self.assertFalse(cache.preprocess(OVERLAY, str(self.dts)).cached)
+        self.assertTrue(cache.preprocess(OVERLAY, str(self.dts)).cached)
+        self.header.write_text('#define PMIC_REG 0x34\n')
+        pre = cache.preprocess(OVERLAY, str(self.dts))
+        self.assertFalse(pre.cached)
+        self.assertIn('reg = <0x34>;', pre.text)
+        self.assertEqual(cache.runs, 2)
+
+    def test_process_file_checks_expanded_text(self):
+        bindir = self.td / 'bin'
+        fake_dtc.install(str(bindir))
+        log = self.td / 'dtc.log'
+        env = {'PATH': f"{bindir}{os.pathsep}{os.environ['PATH']}", 'FAKE_DTC_LOG': str(log)}
+        with mock.patch.dict(os.environ, env):
+            changed, summary = af.process_file(str(self.dts), apply=True, deps_dir=str(self.td / 'deps'))
+        self.assertTrue(changed)
+        text = self.dts.read_text()
+        # the macro already expands to two cells and is left alone
+        self.assertIn('reg = <PMIC_REG>;', text)
+        self.assertIn('reg = <0 0x10>;', text)
+        self.assertIn('#include "board.h"', text)
+        self.assertIn('board.h', (self.td / 'deps' / 'overlay.d').read_text())
+        self.assertEqual(len(log.read_text().splitlines()), 1)
+
+    def test_deps_recorded_without_unit_nodes(self):
+        self.dts.write_text('#include "board.h"\n/dts-v1/;\n/plugin/;\n&i2c1 { status = "okay"; };\n')
+        report = dts_report.ReportWriter(None, 'jsonl')
+        changed, _ = af.process_file(str(self.dts), report=report, deps_dir=str(self.td / 'deps'))
+        self.assertFalse(changed)
+        record, = [json.loads(e) for e in report.entries]
+        self.assertEqual(record['status'], 'no-change')
+        self.assertIn(str(self.header.resolve()), record['deps'])
+        self.assertIn('board.h', (self.td / 'deps' / 'overlay.d').read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import auto_fix_dts as af
+from tools import dts_report
+from tools.dtc_test import fake_dtc
+
+
+OVERLAY = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target = <&i2c1>;
+        __overlay__  {
+            #address-cells = <2>;
+            #size-cells = <0>;
+            pmic@34 {
+                reg = <0x34>;
+            };
+        };
+    };
+};
+"""
+
+
+class TestDtsReport(unittest.TestCase):
+    def setUp(self):
+        self.td = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+
+    def test_writer_buffers_until_flush(self):
+        path = self.td / 'report.jsonl'
+        with dts_report.ReportWriter(str(path), 'jsonl') as writer:
+            writer.text('ignored in jsonl\n')
+            writer.record({'type': 'file', 'n': 1})
+            writer.record({'type': 'file', 'n': 2})
+            self.assertFalse(path.exists())
+        self.assertEqual([r['n'] for r in dts_report.read_records(path)], [1, 2])
+        sink = []
+        writer = dts_report.ReportWriter(sink, flush_bytes=4)
+        writer.text('abc')
+        self.assertEqual(sink, [])
+        writer.text('def')
+        self.assertEqual(sink, ['abcdef'])
+        with self.assertRaises(ValueError):
+            dts_report.ReportWriter(None, 'xml')
+
+    def test_in_memory_writer_keeps_records_past_flush_bytes(self):
+        writer = dts_report.ReportWriter(None, 'jsonl', flush_bytes=64)
+        for n in range(100):
+            writer.record({'type': 'change', 'n': n})
+        self.assertEqual([json.loads(e)['n'] for e in writer.entries], list(range(100)))
+        # a batch worker hands every record to the parent, however large the report
+        (self.td / 'a.dts').write_text(OVERLAY)
+        with mock.patch.object(dts_report.ReportWriter.__init__, '__defaults__', (None, 'text', 16)):
+            out = af._process_one(str(self.td / 'a.dts'), {}, 'jsonl')
+        records = [json.loads(e) for e in out['report']]
+        self.assertEqual([r['type'] for r in records], ['change', 'file'])
+
+    def test_jsonl_records_for_files_and_changes(self):
+        (self.td / 'a.dts').write_text(OVERLAY)
+        (self.td / 'b.dts').write_text('/dts-v1/;\n/ { compatible = "none"; };\n')
+        bindir = self.td / 'bin'
+        fake_dtc.install(str(bindir))
+        report = self.td / 'report.jsonl'
+        report.write_text('{"type": "file", "file": "earlier-run"}\n')
+        tool = Path(__file__).resolve().parent.parent / 'tools' / 'auto_fix_dts.py'
+        env = dict(os.environ, PATH=f"{bindir}{os.pathsep}{os.environ['PATH']}")
+        proc = subprocess.run([sys.executable, str(tool), '--dir', str(self.td), '-j', '2', '--no-cache',
+                               '--report', str(report), '--report-format', 'jsonl'], capture_output=True, text=True, env=env)
+        self.assertEqual(proc.returncode, 0, proc.stdout + proc.stderr)
+        records = list(dts_report.read_records(report))
+        self.assertEqual(records[0]['file'], 'earlier-run')
+        files = {Path(r['file']).name: r for r in records[1:] if r['type'] == 'file'}
+        self.assertEqual((files['a.dts']['status'], files['a.dts']['changes']), ('proposed', 1))
+        self.assertEqual(files['b.dts']['status'], 'no-change')
+        self.assertEqual(files['a.dts']['dtc']['rc'], 0)
+        change, = [r for r in records if r['type'] == 'change']
+        self.assertEqual(change['node'], '/fragment@0/__overlay__/pmic@34')
+        self.assertEqual((change['kind'], change['old_reg'], change['new_reg']), ('pad-reg', '<0x34>', '<0 0x34>'))
+        self.assertEqual(change['line'], 10)
+        self.assertNotIn('seconds', change)
+        self.assertIn('seconds', files['a.dts'])
+
+    def test_process_file_writes_report_once(self):
+        (self.td / 'a.dts').write_text(OVERLAY)
+        report = self.td / 'report.txt'
+        with mock.patch.object(dts_report, 'append_locked', wraps=dts_report.append_locked) as append:
+            af.process_file(str(self.td / 'a.dts'), report=str(report))
+        self.assertEqual(append.call_count, 1)
+        self.assertIn('a.dts: modified 1 nodes', report.read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
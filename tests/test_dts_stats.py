@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import auto_fix_dts as af
+from tools import dts_stats
+from tools.dtc_test import fake_dtc
+
+
+OVERLAY = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/";
+        __overlay__  {
+            battery: battery@0 {
+                compatible = "simple-battery";
+            };
+        };
+    };
+};
+"""
+
+
+class TestDtsStats(unittest.TestCase):
+    def setUp(self):
+        self.td = Path(tempfile.mkdtemp())
+        self.dts = self.td / 'test-overlay.dts'
+        self.dts.write_text(OVERLAY)
+        self.bindir = self.td / 'bin'
+        fake_dtc.install(str(self.bindir))
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+
+    def test_merge_and_round_trip(self):
+        a = dts_stats.FixStats()
+        with a.phase('parse'):
+            pass
+        a.add_dtc_run(0.5, 0)
+        a.bytes_read = 10
+        b = dts_stats.FixStats.from_dict(a.to_dict())
+        b.add_dtc_run(0.0, 0, cached=True)
+        a.merge(b)
+        record = a.to_dict()
+        self.assertEqual(record['phases']['parse']['calls'], 2)
+        self.assertEqual(record['counters']['bytes_read'], 20)
+        self.assertEqual((len(record['dtc_runs']), record['dtc_invocations']), (3, 2))
+        json.dumps(record)
+
+    def test_process_file_returns_stats(self):
+        with mock.patch.dict(os.environ, {'PATH': f"{self.bindir}{os.pathsep}{os.environ['PATH']}"}):
+            result = af.process_file(str(self.dts), apply=False)
+        stats = result.stats
+        self.assertTrue(result[0])
+        self.assertEqual(stats.dtc_invocations, 1)
+        for phase in ('read', 'parse', 'plan', 'check', 'edit', 'dtc', 'write'):
+            self.assertIn(phase, stats.phases)
+        self.assertEqual(stats.bytes_read, len(OVERLAY))
+        self.assertEqual(stats.bytes_written, len(self.dts.with_suffix('.fixed.dts').read_text()))
+        # battery@0 gets reg = <0>; the cells of "/" are unknown in an overlay, so
+        # padding it to dtc's default of 2 is left unresolved
+        self.assertEqual((stats.files, stats.unit_nodes, stats.changes, stats.unresolved), (1, 2, 1, 1))
+
+    def test_cli_timings_and_profile(self):
+        tool = Path(__file__).resolve().parent.parent / 'tools' / 'auto_fix_dts.py'
+        out, prof = self.td / 'timings.json', self.td / 'run.prof'
+        env = dict(os.environ, PATH=f"{self.bindir}{os.pathsep}{os.environ['PATH']}")
+        proc = subprocess.run([sys.executable, str(tool), '--dir', str(self.td), '--no-cache',
+                               '--timings', str(out), '--profile', str(prof)], capture_output=True, text=True, env=env)
+        self.assertEqual(proc.returncode, 0, proc.stdout + proc.stderr)
+        record = json.loads(out.read_text())
+        self.assertEqual(record['dtc_invocations'], 1)
+        self.assertEqual(record['counters']['files'], 1)
+        self.assertIn(str(self.dts), record['files'])
+        self.assertTrue(any('process_file' in f['function'] for f in record['profile']))
+        self.assertTrue(prof.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
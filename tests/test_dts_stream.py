@@ -0,0 +1,134 @@
+import io
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+
+from tools import auto_fix_dts as af
+from tools import dts_bench, dts_stream
+
+
+LATE_LABEL = """/dts-v1/;
+/plugin/;
+/ {
+	fragment@0 {
+		target = <&bus>;
+		__overlay__ {
+			dev@10 { compatible = "x"; };
+			dev@20 {
+				reg = <0x20>;
+			};
+		};
+	};
+	fragment@1 {
+		target-path = "/";
+		__overlay__ {
+			bus: bus@1000 {
+				#address-cells = <1>;
+				#size-cells = <0>;
+			};
+		};
+	};
+};"""
+
+SIBLINGS = """/dts-v1/;
+/ {
+	parent {
+		a@1 { status = "okay"; };
+		b@2 { reg = <0x2>; };
+		c@3 { reg = <0x0 0x3>; };   /* longest sibling reg comes last; { } ; */
+		d@4 { x = "a;b{}"; y = <1 /* > */ 2>; };
+	};
+	bus {
+		#address-cells = <2>;
+		#size-cells = <0>;
+		e@5 {
+		};
+		f@6 { child@0 { reg = <0>; }; };
+	};
+};
+&ref { i@a { reg = <0xa>; }; };"""
+
+
+def labelled_nodes(count):
+    body = ''.join(f'\tdev{i}: dev@{i:x} {{\n\t\treg = <0x{i:x}>;\n\t\tfirmware = "{"x" * 1024}";\n\t}};\n'
+                   for i in range(count))
+    return '/dts-v1/;\n/ {\n\t#address-cells = <1>;\n\t#size-cells = <0>;\n' + body + '};\n'
+
+
+class _Discard:
+    def write(self, text):
+        pass
+
+
+class StreamFixTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def in_memory(self, text):
+        path = self.tmp / 'x.dts'
+        path.write_text(text)
+        report = []
+        changed, _ = af.process_file(str(path), report=report)
+        return (path.with_suffix('.fixed.dts').read_text() if changed else text), ''.join(report)
+
+    def streamed(self, text, chunk_size):
+        out = io.StringIO()
+        report = []
+        af.process_stream(io.StringIO(text), out, name='x.dts', report=report, chunk_size=chunk_size)
+        return out.getvalue(), ''.join(report)
+
+    def test_same_fixes_as_in_memory(self):
+        texts = [LATE_LABEL, SIBLINGS, dts_bench.generate_overlay(nodes=60, missing_ratio=0.3, short_ratio=0.3)]
+        for text in texts:
+            expected = self.in_memory(text)
+            self.assertIn('modified', expected[1])
+            for chunk_size in (1, 5, 4096):
+                self.assertEqual(self.streamed(text, chunk_size), expected)
+
+    def test_buffer_bounded_by_nesting_not_size(self):
+        text = dts_bench.generate_board(nodes=3000, depth=6, missing_ratio=0.2, short_ratio=0.2)
+        largest = [0]
+        refill = dts_stream.StreamParser._refill
+
+        def tracking(parser):
+            refill(parser)
+            largest[0] = max(largest[0], len(parser.buf))
+
+        dts_stream.StreamParser._refill = tracking
+        try:
+            out, _ = self.streamed(text, 1024)
+        finally:
+            dts_stream.StreamParser._refill = refill
+        self.assertEqual(out, self.in_memory(text)[0])
+        self.assertLess(largest[0], 8 * 1024)
+        self.assertGreater(len(text), 50 * largest[0])
+
+        # labelled nodes must not stay alive after they close: the peak
+        # grows by far less than the input does
+        small, large = labelled_nodes(400), labelled_nodes(1600)
+        growth = self.stream_peak(large) - self.stream_peak(small)
+        self.assertLess(growth, (len(large) - len(small)) // 4)
+
+    def stream_peak(self, text):
+        fin, out = io.StringIO(text), _Discard()
+        tracemalloc.start()
+        try:
+            af.process_stream(fin, out, name='x.dts', report=[], chunk_size=1024)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_parser_events_match_parse(self):
+        events = list(dts_stream.StreamParser(io.StringIO(SIBLINGS), chunk_size=3).events())
+        opened = [e[1].path for e in events if e[0] == 'open']
+        self.assertEqual(opened, [n.path for n in af.dts_parser.parse(SIBLINGS).walk()])
+        props = [(e[1].path, e[2].name, e[2].value) for e in events if e[0] == 'prop']
+        self.assertIn(('/parent/d@4', 'x', '"a;b{}"'), props)
+        self.assertIn(('/parent/d@4', 'y', '<1 /* > */ 2>'), props)
+
+
+if __name__ == '__main__':
+    unittest.main()
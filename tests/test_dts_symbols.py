@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import dts_symbols, file_hash
+
+
+BATTERY = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target = <&i2c1>;
+        __overlay__ {
+            battery: battery@0 {
+                compatible = "simple-battery";
+                monitored-battery = <&battery>;
+            };
+        };
+    };
+    fragment@1 {
+        target-path = "/soc/gpio@7e200000";
+        __overlay__ {
+            status = "okay";
+        };
+    };
+    __overrides__ {
+        i2c_speed = <&i2c1>,"clock-frequency:0";
+        bat = <&battery>,"status", <&i2c1>,"status";
+    };
+};
+"""
+
+AUDIO = """/dts-v1/;
+/plugin/;
+
+&battery {
+    status = "okay";
+};
+"""
+
+
+class SymbolIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        (self.tmp / 'battery.dts').write_text(BATTERY)
+        (self.tmp / 'audio.dts').write_text(AUDIO)
+        self.index_path = self.tmp / 'cache' / 'symbols.json'
+
+    def test_queries(self):
+        index = dts_symbols.SymbolIndex(self.index_path)
+        index.update(dts_symbols.collect_files([self.tmp]))
+        self.assertEqual([(Path(d['file']).name, d['path']) for d in index.definitions('battery')],
+                         [('battery.dts', '/fragment@0/__overlay__/battery@0')])
+        refs = sorted((Path(r['file']).name, r['prop']) for r in index.references('&battery'))
+        self.assertEqual(refs, [('audio.dts', None), ('battery.dts', 'monitored-battery')])
+        self.assertEqual([(o['ref'], o['prop']) for o in index.overrides('bat')],
+                         [('&battery', 'status'), ('&i2c1', 'status')])
+        self.assertEqual(index.targets('/soc/gpio@7e200000')[0]['path'], '/fragment@1')
+        self.assertEqual(list(index.unresolved()), ['&i2c1'])
+
+    def test_update_reparses_only_changed_files(self):
+        files = dts_symbols.collect_files([self.tmp])
+        index = dts_symbols.SymbolIndex(self.index_path)
+        index.update(files)
+        self.assertEqual(index.parsed, 2)
+        index = dts_symbols.SymbolIndex(self.index_path)
+        self.assertFalse(index.update(files))
+        self.assertEqual(index.parsed, 0)
+        (self.tmp / 'audio.dts').write_text(AUDIO.replace('&battery', '&i2c1'))
+        self.assertTrue(index.update(files))
+        self.assertEqual(index.parsed, 1)
+        self.assertEqual(len(index.references('battery')), 1)
+        (self.tmp / 'audio.dts').unlink()
+        index.update(dts_symbols.collect_files([self.tmp]), prune=True)
+        self.assertEqual(len(index.files), 1)
+
+    def test_unchanged_files_are_not_rehashed(self):
+        files = dts_symbols.collect_files([self.tmp])
+        dts_symbols.SymbolIndex(self.index_path).update(files)
+        index = dts_symbols.SymbolIndex(self.index_path)
+        with mock.patch.object(file_hash, 'file_sha256', side_effect=AssertionError('rehashed')):
+            self.assertFalse(index.update(files))
+        # a touched file is rehashed but not reparsed when its content is the same
+        st = os.stat(files[0])
+        os.utime(files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertTrue(index.update(files))
+        self.assertEqual(index.parsed, 0)
+
+    def test_cli(self):
+        args = ['--index', str(self.index_path), '--dir', str(self.tmp)]
+        self.assertEqual(dts_symbols.main(args + ['defs', 'battery']), 0)
+        self.assertEqual(dts_symbols.main(args + ['defs', 'nope']), 1)
+        # querying another directory set keeps this one's entries
+        other = self.tmp / 'other'
+        other.mkdir()
+        (other / 'audio2.dts').write_text(AUDIO)
+        self.assertEqual(dts_symbols.main(['--index', str(self.index_path), '--dir', str(other), 'defs', 'battery']), 0)
+        self.assertEqual(len(dts_symbols.SymbolIndex(self.index_path).files), 3)
+        self.assertEqual(dts_symbols.main(['--index', str(self.index_path), '--dir', str(other), 'update']), 0)
+        self.assertEqual(len(dts_symbols.SymbolIndex(self.index_path).files), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
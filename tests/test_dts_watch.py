@@ -0,0 +1,87 @@
+import io
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from tools import dts_watch
+
+
+OVERLAY = """#include "dt-bindings/uconsole/regs.h"
+/dts-v1/;
+/plugin/;
+/ {
+	fragment@0 {
+		target-path = "/";
+		__overlay__ {
+			#address-cells = <2>;
+			#size-cells = <0>;
+			dev@1 { reg = <DEV_REG>; };
+		};
+	};
+};
+"""
+
+
+class DtsWatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp()).resolve()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.ov = self.tmp / 'overlays'
+        self.inc = self.tmp / 'include'
+        self.ov.mkdir()
+        # nested like the real dt-bindings/gpio/gpio.h, below the -I directory
+        self.header = self.inc / 'dt-bindings' / 'uconsole' / 'regs.h'
+        self.header.parent.mkdir(parents=True)
+        self.header.write_text('#define DEV_REG 0x1\n')
+        (self.ov / 'a.dts').write_text(OVERLAY)
+        (self.ov / 'b.dts').write_text('/dts-v1/;\n/ { };\n')
+        self.session = dts_watch.Session([self.ov], [self.inc], cache_dir=self.tmp / 'cache')
+
+    def test_header_change_rechecks_including_overlay(self):
+        self.session.check_all()
+        self.assertEqual(self.session.overlays[str(self.ov / 'a.dts')].deps, [str(self.header)])
+        self.assertEqual(self.session.affected({str(self.header)}), [str(self.ov / 'a.dts')])
+        self.assertEqual(self.session.affected({str(self.ov / 'b.dts'), str(self.ov / 'b.fixed.dts')}),
+                         [str(self.ov / 'b.dts')])
+
+    def test_unchanged_files_are_not_rechecked(self):
+        self.session.check_all()
+        checks = self.session.checks
+        results = self.session.check_all()
+        self.assertTrue(all(r['skipped'] for r in results))
+        self.assertEqual(self.session.checks, checks)
+        time.sleep(0.01)
+        self.header.write_text('#define DEV_REG 0x2\n')
+        results = {Path(r['file']).name: r for r in self.session.check_all()}
+        self.assertFalse(results['a.dts']['skipped'])
+        self.assertTrue(results['b.dts']['skipped'])
+
+    def test_burst_of_saves_is_checked_once(self):
+        self.session.check_all()
+        for poll in (False, True):
+            self.assertIn(str(self.header.parent), self.session.watch_dirs())
+            # only the top-level directories: watch() adds the dependency directories
+            watcher = dts_watch.make_watcher([str(self.ov), str(self.inc)], poll=poll, interval=0.02)
+            self.addCleanup(watcher.close)
+
+            def save():
+                time.sleep(0.1)
+                for i in range(3):
+                    self.header.write_text(f'#define DEV_REG {i + poll * 3 + 3}\n')
+                    time.sleep(0.01)
+
+            t = threading.Thread(target=save)
+            t.start()
+            out = io.StringIO()
+            dts_watch.watch(self.session, watcher, debounce=0.3, out=out, max_bursts=1)
+            t.join()
+            lines = out.getvalue().splitlines()
+            self.assertEqual(len(lines), 1, lines)
+            self.assertTrue(lines[0].startswith('a.dts: '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import shutil
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools import fdt_reader
+
+
+def u32(*values):
+    return b''.join(struct.pack('>I', v) for v in values)
+
+
+def s(*values):
+    return b''.join(v.encode() + b'\0' for v in values)
+
+
+def build_fdt(root):
+    """Minimal FDT v17 writer; nodes are (name, [(prop, bytes)], [children])."""
+    struct_block = bytearray()
+    strings = bytearray()
+    offsets = {}
+
+    def pad():
+        struct_block.extend(b'\0' * (-len(struct_block) % 4))
+
+    def emit(node):
+        name, props, children = node
+        struct_block.extend(u32(fdt_reader.FDT_BEGIN_NODE) + name.encode() + b'\0')
+        pad()
+        for prop, value in props:
+            if prop not in offsets:
+                offsets[prop] = len(strings)
+                strings.extend(prop.encode() + b'\0')
+            struct_block.extend(u32(fdt_reader.FDT_PROP, len(value), offsets[prop]) + value)
+            pad()
+        for child in children:
+            emit(child)
+        struct_block.extend(u32(fdt_reader.FDT_END_NODE))
+
+    emit(root)
+    struct_block.extend(u32(fdt_reader.FDT_END))
+    rsvmap = b'\0' * 16
+    off_rsvmap = 40
+    off_struct = off_rsvmap + len(rsvmap)
+    off_strings = off_struct + len(struct_block)
+    total = off_strings + len(strings)
+    header = u32(fdt_reader.FDT_MAGIC, total, off_struct, off_strings, off_rsvmap, 17, 16, 0,
+                 len(strings), len(struct_block))
+    return header + rsvmap + bytes(struct_block) + bytes(strings)
+
+
+# What dtc -@ produces for an overlay with a fragment on &i2c1, a fragment
+# on a local node (&mybus) and a target-path fragment
+OVERLAY = ('', [('compatible', s('brcm,bcm2712'))], [
+    ('fragment@0', [('target', u32(0xffffffff))], [
+        ('__overlay__', [('#address-cells', u32(1)), ('#size-cells', u32(0))], [
+            ('pmic@34', [('reg', u32(0x34)), ('status', s('okay'))], []),
+        ]),
+    ]),
+    ('fragment@1', [('target', u32(0xffffffff))], [
+        ('__overlay__', [], [
+            ('dev@10', [('reg', u32(0x10))], []),
+        ]),
+    ]),
+    ('fragment@2', [('target', u32(1))], [
+        ('__overlay__', [], [
+            ('child@2', [('reg', u32(2))], []),
+        ]),
+    ]),
+    ('fragment@3', [('target-path', s('/soc'))], [
+        ('__overlay__', [], [
+            ('mem@1000', [('reg', u32(0, 0x1000))], []),
+        ]),
+    ]),
+    ('mybus', [('#address-cells', u32(1)), ('#size-cells', u32(0)), ('phandle', u32(1))], []),
+    ('__symbols__', [('mybus', s('/mybus')), ('pmic', s('/fragment@0/__overlay__/pmic@34'))], []),
+    ('__fixups__', [('i2c1', s('/fragment@0:target:0')), ('spi0', s('/fragment@1:target:0'))], []),
+    ('__local_fixups__', [], [
+        ('fragment@2', [('target', u32(0))], []),
+    ]),
+])
+
+BASE = ('', [('#address-cells', u32(2)), ('#size-cells', u32(1))], [
+    ('soc', [('#address-cells', u32(2)), ('#size-cells', u32(0))], [
+        ('spi@7e204000', [('#address-cells', u32(1)), ('#size-cells', u32(0))], []),
+    ]),
+    ('__symbols__', [('spi0', s('/soc/spi@7e204000'))], []),
+])
+
+
+class TestFdtReader(unittest.TestCase):
+    def setUp(self):
+        self.td = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+
+    def write(self, name, tree):
+        path = self.td / name
+        path.write_bytes(build_fdt(tree))
+        return path
+
+    def test_tree_and_overlay_metadata(self):
+        with fdt_reader.Fdt.open(self.write('a.dtbo', OVERLAY)) as fdt:
+            self.assertTrue(fdt.is_overlay())
+            pmic = fdt.node('/fragment@0/__overlay__/pmic@34')
+            self.assertEqual(fdt.cells(pmic.props['reg']), [0x34])
+            self.assertEqual(fdt.string(pmic.props['status']), 'okay')
+            view = fdt.value(pmic.props['reg'])
+            self.assertEqual(bytes(view), u32(0x34))
+            view.release()
+            self.assertEqual(fdt.symbols['pmic'], pmic.path)
+            self.assertEqual(fdt.fixups['i2c1'], [('/fragment@0', 'target', 0)])
+            self.assertEqual(fdt.local_fixups, {('/fragment@2', 'target'): [0]})
+            self.assertIs(fdt.phandles[1], fdt.node('/mybus'))
+            self.assertEqual(fdt_reader.target_key(fdt, fdt.node('/fragment@1')), '&spi0')
+
+    def test_reg_format_on_blobs(self):
+        with fdt_reader.Fdt.open(self.write('a.dtbo', OVERLAY)) as fdt:
+            found = {mm.path: mm for mm in fdt_reader.check_reg_format(fdt)}
+            # pmic@34: own cells 1/0; child@2: local target mybus 1/0 -> both fine
+            self.assertEqual(sorted(found), ['/fragment@1/__overlay__/dev@10', '/fragment@3/__overlay__/mem@1000'])
+            self.assertTrue(found['/fragment@1/__overlay__/dev@10'].assumed)
+            with fdt_reader.Fdt.open(self.write('base.dtb', BASE)) as base:
+                cells = fdt_reader.target_cells_from_base(base)
+            self.assertEqual(cells['&spi0'], (1, 0))
+            self.assertEqual(fdt_reader.check_reg_format(fdt, cells), [])
+
+    def test_cli_and_bad_blobs(self):
+        self.write('a.dtbo', OVERLAY)
+        (self.td / 'broken.dtbo').write_bytes(b'\xd0\x0d\xfe\xed' + b'\0' * 8)
+        self.assertEqual(fdt_reader.main([str(self.td)]), 2)
+        (self.td / 'broken.dtbo').unlink()
+        self.assertEqual(fdt_reader.main([str(self.td)]), 1)
+        base = self.write('board.dtb.base', BASE)
+        self.assertEqual(fdt_reader.main([str(self.td / 'a.dtbo'), '--base', str(base)]), 0)
+        with self.assertRaises(fdt_reader.FdtError):
+            fdt_reader.Fdt(b'\0' * 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from tools import fetch_drivers, patch_engine
+
+
+class FetchDriversTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.manifest = fetch_drivers.load_manifest()
+        self.mirror = self.tmp / 'mirror'
+        for entry in fetch_drivers.entries(self.manifest):
+            # optional files only exist at their fallback path
+            path = self.mirror / entry['tree'] / entry['ref'] / entry['paths'][-1]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f"/* {entry['dest']} */\n")
+        self.out = self.tmp / 'extracted-drivers'
+        self.store = fetch_drivers.Store(self.tmp / 'store')
+
+    def test_fetch_from_mirror_links_store_objects(self):
+        results = fetch_drivers.fetch(self.manifest, self.out, self.store, mirror=str(self.mirror))
+        self.assertEqual({status for _, status, _, _ in results}, {'fetched'})
+        header = self.out / 'drm-rp1-dsi' / 'rp1_platform.h'
+        self.assertEqual(header.read_text(), '/* drm-rp1-dsi/rp1_platform.h */\n')
+        sha = hashlib.sha256(header.read_bytes()).hexdigest()
+        self.assertTrue(os.path.samefile(header, self.store.path(sha)))
+        makefile = (self.out / 'drm-rp1-dsi' / 'Makefile').read_text()
+        self.assertIn('drm-rp1-dsi-y := rp1_dsi.o rp1_dsi_dma.o rp1_dsi_dsi.o', makefile)
+        self.assertIn('ccflags-y += -I$(src)', makefile)
+        self.assertTrue((self.out / 'axp20x_battery' / 'Makefile').read_text().startswith('obj-m := axp20x_battery.o\n'))
+
+    def test_warm_refetch_needs_no_network(self):
+        fetch_drivers.fetch(self.manifest, self.out, self.store, mirror=str(self.mirror))
+        shutil.rmtree(self.mirror)
+        (self.out / 'panel-cwu50' / 'panel-cwu50.c').unlink()
+        store = fetch_drivers.Store(self.tmp / 'store')
+        t0 = time.perf_counter()
+        # no mirror: any download attempt would go upstream and fail here
+        results = fetch_drivers.fetch(self.manifest, self.out, store, offline=True)
+        self.assertLess(time.perf_counter() - t0, 1)
+        statuses = {dest: status for dest, status, _, _ in results}
+        self.assertEqual(statuses.pop('panel-cwu50/panel-cwu50.c'), 'linked')
+        self.assertEqual(set(statuses.values()), {'up-to-date'})
+
+    def test_refetch_keeps_patched_files(self):
+        patch = self.tmp / 'panel.patch'
+        patch.write_text('--- a/extracted-drivers/panel-cwu50/panel-cwu50.c\n'
+                         '+++ b/extracted-drivers/panel-cwu50/panel-cwu50.c\n'
+                         '@@ -1 +1,2 @@\n'
+                         ' /* panel-cwu50/panel-cwu50.c */\n'
+                         '+/* cm5 */\n')
+        source = self.out / 'panel-cwu50' / 'panel-cwu50.c'
+        statuses = []
+        for _ in range(2):
+            results = fetch_drivers.fetch(self.manifest, self.out, self.store, mirror=str(self.mirror))
+            statuses.append({dest: status for dest, status, _, _ in results}['panel-cwu50/panel-cwu50.c'])
+            (_, _, status, _), = patch_engine.apply_patches([patch], self.tmp)
+            statuses.append(status)
+        self.assertEqual(statuses, ['fetched', 'applied', 'up-to-date', 'up-to-date'])
+        self.assertTrue(source.read_text().endswith('/* cm5 */\n'))
+        # a hand-edited file is replaced by the store copy and patched again
+        source.write_text('edited\n')
+        results = fetch_drivers.fetch(self.manifest, self.out, self.store, offline=True)
+        self.assertEqual({dest: status for dest, status, _, _ in results}['panel-cwu50/panel-cwu50.c'], 'linked')
+        self.assertEqual(patch_engine.apply_patches([patch], self.tmp)[0][2], 'applied')
+
+    def test_pin_mismatch_and_missing_files_fail(self):
+        self.manifest['drivers'][0]['files'][0]['sha256'] = '0' * 64
+        (self.mirror / 'mainline' / 'master' / 'drivers/power/supply/axp20x_ac_power.c').unlink()
+        results = {dest: (status, msg) for dest, status, _, msg in
+                   fetch_drivers.fetch(self.manifest, self.out, self.store, mirror=str(self.mirror))}
+        self.assertEqual(results['panel-cwu50/panel-cwu50.c'][0], 'failed')
+        self.assertIn('does not match', results['panel-cwu50/panel-cwu50.c'][1])
+        self.assertEqual(results['axp20x_ac_power/axp20x_ac_power.c'][0], 'failed')
+        self.assertFalse((self.out / 'panel-cwu50' / 'panel-cwu50.c').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools import file_hash
+
+
+class FileHashTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_hasher_reuses_hash_while_stamp_matches(self):
+        path = self.tmp / 'a.c'
+        path.write_text('int a;\n')
+        entry = file_hash.Hasher().entry(path)
+        self.assertEqual(entry['sha256'], file_hash.file_sha256(path))
+        # a recorded hash is trusted while size and mtime match
+        hasher = file_hash.Hasher({str(path): dict(entry, sha256='recorded')})
+        self.assertEqual(hasher.entry(path)['sha256'], 'recorded')
+        self.assertEqual(hasher.hashed, 0)
+        path.write_text('int ab;\n')
+        self.assertEqual(hasher.entry(path)['sha256'], file_hash.file_sha256(path))
+        self.assertEqual(hasher.hashed, 1)
+        self.assertIsNone(hasher.entry(self.tmp / 'missing.c'))
+
+    def test_write_manifest_replaces_atomically(self):
+        path = self.tmp / 'state.json'
+        file_hash.write_manifest(path, {'version': 1})
+        file_hash.write_manifest(path, {'version': 2})
+        self.assertEqual(json.loads(path.read_text()), {'version': 2})
+        self.assertEqual(os.listdir(self.tmp), ['state.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from tools import ko_check
+
+
+VERMAGIC = '6.12.25-v8-16k+ SMP preempt mod_unload modversions aarch64'
+
+
+def make_ko(modinfo, versions=(), exports=(), order='<'):
+    """Minimal ELF64 relocatable object with .modinfo, __versions and
+    __ksymtab_strings sections, like modpost leaves them in a .ko."""
+    sections = [('.modinfo', b''.join(f"{k}={v}".encode() + b'\0' for k, v in modinfo))]
+    if versions:
+        sections.append(('__versions', b''.join(struct.pack(order + 'Q', crc) + name.encode().ljust(56, b'\0')
+                                                for name, crc in versions)))
+    if exports:
+        sections.append(('__ksymtab_strings', b''.join(e.encode() + b'\0' for e in exports)))
+    shstrtab = b'\0'
+    names = []
+    for name, _ in sections + [('.shstrtab', None)]:
+        names.append(len(shstrtab))
+        shstrtab += name.encode() + b'\0'
+    sections.append(('.shstrtab', shstrtab))
+    body = b''
+    offsets = []
+    for _, data in sections:
+        offsets.append(64 + len(body))
+        body += data + b'\0' * (-len(data) % 8)
+    shoff = 64 + len(body)
+    ident = b'\x7fELF' + bytes([2, 1 if order == '<' else 2, 1]) + b'\0' * 9
+    header = ident + struct.pack(order + 'HHIQQQIHHHHHH', 1, 183, 1, 0, 0, shoff, 0, 64, 0, 0, 64,
+                                 len(sections) + 1, len(sections))
+    shdrs = b'\0' * 64
+    for (name, data), noff, off in zip(sections, names, offsets):
+        shdrs += struct.pack(order + 'IIQQQQIIQQ', noff, 3 if name == '.shstrtab' else 1, 0, 0, off, len(data), 0, 0, 1, 0)
+    return header + body + shdrs
+
+
+class KoCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.target = ko_check.Target({'drm_panel_init': 0x1234abcd, 'mipi_dsi_attach': 0x0badf00d,
+                                       'module_layout': 0x1}, VERMAGIC)
+
+    def write(self, name, data):
+        path = self.tmp / name
+        path.write_bytes(data)
+        return path
+
+    def test_parses_modinfo_and_versions_both_byte_orders(self):
+        for order in '<>':
+            data = make_ko([('name', 'panel_cwu50'), ('vermagic', VERMAGIC), ('depends', 'drm')],
+                           [('drm_panel_init', 0x1234abcd), ('mipi_dsi_attach', 0x0badf00d)], order=order)
+            module = ko_check.read_ko(self.write(f"m{order == '>'}.ko", data))
+            self.assertEqual(module.name, 'panel_cwu50')
+            self.assertEqual(module.vermagic, VERMAGIC)
+            self.assertEqual(module.modinfo['depends'], ['drm'])
+            self.assertEqual(module.versions, [('drm_panel_init', 0x1234abcd), ('mipi_dsi_attach', 0x0badf00d)])
+            self.assertEqual(ko_check.check_module(module, self.target), [])
+
+    def test_reports_exact_mismatches(self):
+        self.write('bad.ko', make_ko([('name', 'bad'), ('vermagic', VERMAGIC.replace('6.12.25', '6.12.20'))],
+                                     [('drm_panel_init', 0x1111), ('rp1_helper', 0x2), ('module_layout', 0x1)]))
+        self.write('rp1.ko', make_ko([('name', 'rp1'), ('vermagic', VERMAGIC)], [('mipi_dsi_attach', 0x0badf00d)],
+                                     exports=['rp1_helper']))
+        self.write('broken.ko', b'not an elf')
+        results = {Path(p).name: (problems, error) for p, _, problems, error in
+                   ko_check.check_paths([self.tmp], self.target)}
+        self.assertEqual(results['rp1.ko'], ([], None))
+        self.assertIsNotNone(results['broken.ko'][1])
+        kinds = [(kind, symbol) for kind, symbol, _ in results['bad.ko'][0]]
+        # rp1_helper is exported by rp1.ko in the same set
+        self.assertEqual(kinds, [('vermagic', None), ('crc', 'drm_panel_init')])
+        self.assertIn('module 0x00001111, kernel 0x1234abcd', results['bad.ko'][0][1][2])
+
+    def test_large_module_set_is_fast(self):
+        symvers = self.tmp / 'Module.symvers'
+        symvers.write_text(''.join(f"0x{i:08x}\tsym_{i}\tvmlinux\tEXPORT_SYMBOL_GPL\n" for i in range(30000)))
+        (self.tmp / 'mods').mkdir()
+        for n in range(200):
+            self.write(f"mods/m{n}.ko", make_ko([('name', f"m{n}"), ('vermagic', VERMAGIC)],
+                                                [(f"sym_{i}", i if i != n else 0xdead) for i in range(n, n + 50)]))
+        t0 = time.perf_counter()
+        target = ko_check.Target(ko_check.load_symvers(symvers), VERMAGIC)
+        results = ko_check.check_paths([self.tmp / 'mods'], target)
+        self.assertLess(time.perf_counter() - t0, 2)
+        self.assertEqual(len(results), 200)
+        self.assertTrue(all([s for _, s, _ in problems] == [f"sym_{Path(p).stem[1:]}"] for p, _, problems, _ in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import shutil
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools import os_health
+
+
+UUID = '01234567-89ab-cdef-0123-456789abcdef'
+
+
+def fdt_header(size=64):
+    return struct.pack('>10I', 0xd00dfeed, size, 56, 60, 40, 17, 16, 0, 4, 4).ljust(size, b'\0')
+
+
+class OsHealthTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.boot = self.tmp / 'boot'
+        self.root = self.tmp / 'root'
+        (self.boot / 'overlays').mkdir(parents=True)
+        (self.boot / 'config.txt').write_text('[all]\ninclude extraconfig.txt\n')
+        (self.boot / 'extraconfig.txt').write_text(
+            'dtparam=spi=off\ndtoverlay=clockworkpi-uconsole-cm5-stable\n[cm5]\ndtoverlay=dwc2,dr_mode=host\n')
+        for name in ('clockworkpi-uconsole-cm5-stable', 'dwc2'):
+            (self.boot / 'overlays' / f"{name}.dtbo").write_bytes(fdt_header())
+        (self.boot / 'cmdline.txt').write_text(f"root=UUID={UUID} rootwait\n")
+        (self.root / 'etc').mkdir(parents=True)
+        (self.root / 'etc' / 'os-release').write_text('NAME="openSUSE MicroOS"\nPRETTY_NAME="openSUSE MicroOS"\n')
+        (self.root / 'etc' / 'fstab').write_text(f"UUID={UUID.upper()} / btrfs ro 0 0\n")
+        (self.root / 'usr' / 'lib' / 'modules' / '6.12.25-1-default').mkdir(parents=True)
+        (self.root / 'usr' / 'lib' / 'modules' / '6.12.25-1-default' / 'modules.dep').write_text('')
+
+    def problems(self):
+        facts, findings = os_health.inspect(self.boot, self.root)
+        return facts, [(f.severity, f.check) for f in findings if f.severity != 'ok']
+
+    def test_healthy_image(self):
+        facts, problems = self.problems()
+        self.assertEqual(problems, [])
+        self.assertEqual([(o[0], o[2], o[4]) for o in facts['config']['overlays']],
+                         [('clockworkpi-uconsole-cm5-stable', 'extraconfig.txt', 'all'), ('dwc2', 'extraconfig.txt', 'cm5')])
+        self.assertEqual(facts['cmdline']['root'], f"UUID={UUID}")
+        self.assertEqual(os_health.main(['--boot', str(self.boot), '--root', str(self.root)]), 0)
+
+    def test_missing_and_broken_overlays_and_root_mismatch(self):
+        (self.boot / 'overlays' / 'dwc2.dtbo').write_bytes(b'\0' * 64)
+        with open(self.boot / 'config.txt', 'a') as fh:
+            fh.write('dtoverlay=uconsole-audio\n')
+        (self.root / 'etc' / 'fstab').write_text('/dev/mmcblk0p3 / btrfs ro 0 0\n')
+        _, problems = self.problems()
+        self.assertEqual(problems, [('warning', 'overlays'), ('error', 'overlays'), ('error', 'fstab')])
+        self.assertEqual(os_health.main(['--boot', str(self.boot), '--root', str(self.root)]), 2)
+
+    def test_modules_and_missing_partitions(self):
+        overlay = self.root / 'var' / 'lib' / 'modules-overlay'
+        overlay.mkdir(parents=True)
+        (overlay / 'broken.ko').write_bytes(b'not a module')
+        (self.root / 'usr' / 'lib' / 'modules' / '6.12.26-1-default').mkdir()
+        _, problems = self.problems()
+        self.assertEqual(problems, [('warning', 'modules'), ('error', 'modules-overlay')])
+        self.assertEqual(os_health.main(['--boot', str(self.tmp / 'nope'), '--root', str(self.root)]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
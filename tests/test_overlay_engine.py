@@ -0,0 +1,158 @@
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import overlay_engine
+
+
+BASE = """/dts-v1/;
+
+/ {
+    #address-cells = <2>;
+    #size-cells = <1>;
+    soc {
+        i2c1: i2c@7e804000 {
+            status = "disabled";
+            clock-frequency = <100000>;
+        };
+        gpio: gpio@7e200000 {
+            gpio-controller;
+        };
+    };
+};
+
+&gpio {
+    #gpio-cells = <2>;
+};
+"""
+
+BATTERY = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target = <&i2c1>;
+        __overlay__ {
+            status = "okay";
+            clock-frequency = <400000>;
+            battery: battery@0 {
+                reg = <0>;
+                gpios = <&gpio 5 0>;
+            };
+        };
+    };
+    __overrides__ {
+        battery = <&battery>,"status";
+    };
+};
+"""
+
+SLOW_I2C = """/dts-v1/;
+/plugin/;
+
+&i2c1 {
+    clock-frequency = <100000>;
+};
+"""
+
+BROKEN = """/dts-v1/;
+/plugin/;
+
+/ {
+    fragment@0 {
+        target-path = "/soc/nope";
+        __overlay__ {
+            x = <1>;
+        };
+    };
+    fragment@1 {
+        target = <&{/soc/gpio@7e200000}>;
+        __overlay__ {
+            hog {
+                gpios = <&missing 1 0>;
+            };
+        };
+    };
+};
+"""
+
+
+class TestOverlayEngine(unittest.TestCase):
+    def setUp(self):
+        self.td = Path(tempfile.mkdtemp())
+        self.base = self.td / 'board.dts'
+        self.base.write_text(BASE)
+        for name, text in (('battery', BATTERY), ('slow-i2c', SLOW_I2C), ('broken', BROKEN)):
+            (self.td / f"{name}.dts").write_text(text)
+        overlay_engine._BASE_CACHE.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.td)
+
+    def apply(self, names):
+        return overlay_engine.apply_all(self.base, names, [self.td], cache_dir=self.td / 'cache')
+
+    def test_overrides_conflicts_and_effective_tree(self):
+        etree, findings = self.apply(['battery', 'slow-i2c'])
+        kinds = sorted((f.kind, f.path) for f in findings)
+        self.assertEqual(kinds, [
+            ('conflict', '/soc/i2c@7e804000:clock-frequency'),
+            ('override', '/soc/i2c@7e804000:clock-frequency'),
+            ('override', '/soc/i2c@7e804000:status'),
+        ])
+        conflict = [f for f in findings if f.kind == 'conflict'][0]
+        self.assertEqual(conflict.origin, 'slow-i2c.dts:5')
+        self.assertIs(etree.labels['battery'], etree.node('/soc/i2c@7e804000/battery@0'))
+        self.assertEqual(etree.node('/soc/gpio@7e200000').props['#gpio-cells'].value, '<2>')
+        self.assertIn('battery: battery@0 {', overlay_engine.to_dts(etree))
+
+    def test_dangling_and_unresolved(self):
+        _, findings = self.apply(['broken'])
+        self.assertEqual(sorted((f.kind, f.path) for f in findings), [
+            ('dangling', '/fragment@1/__overlay__/hog:gpios'),
+            ('unresolved-target', '/fragment@0'),
+        ])
+
+    def test_config_order_and_cached_base(self):
+        config = self.td / 'config.txt'
+        config.write_text('[all]\ndtoverlay=battery\n# dtoverlay=broken\ndtoverlay=dwc2,dr_mode=host\n')
+        self.assertEqual(overlay_engine.read_config_overlays(config), ['battery', 'dwc2'])
+        self.apply([])
+        overlay_engine._BASE_CACHE.clear()
+        with mock.patch.object(overlay_engine, 'build_base', side_effect=AssertionError('base reparsed')):
+            etree, findings = self.apply(overlay_engine.read_config_overlays(config))
+            # every load is an independent copy of the cached base
+            self.assertEqual(etree.node('/soc/i2c@7e804000').props['status'].value, '"okay"')
+            fresh, _ = self.apply([])
+            self.assertEqual(fresh.node('/soc/i2c@7e804000').props['status'].value, '"disabled"')
+        self.assertEqual([f.kind for f in findings if f.kind == 'missing-overlay'], ['missing-overlay'])
+        status = overlay_engine.main(['--base', str(self.base), '--config', str(config), '--overlay-dir', str(self.td),
+                                      '--cache-dir', str(self.td / 'cache'), '-q'])
+        self.assertEqual(status, 0)
+        self.assertEqual(overlay_engine.main(['--base', str(self.base), '--overlay-dir', str(self.td), '--no-cache', 'broken']), 1)
+
+    def test_disk_cache_is_shared_with_the_cli_and_rebuilt_when_bad(self):
+        cache = self.td / 'cache'
+        tool = Path(overlay_engine.__file__)
+        proc = subprocess.run([sys.executable, str(tool), '--base', str(self.base), '--overlay-dir', str(self.td),
+                               '--cache-dir', str(cache), '-q', 'battery'], capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stdout + proc.stderr)
+        entry, = cache.glob('*.json')
+        with mock.patch.object(overlay_engine, 'build_base', side_effect=AssertionError('base reparsed')):
+            etree, _ = self.apply(['battery'])
+        self.assertIs(etree.labels['battery'], etree.node('/soc/i2c@7e804000/battery@0'))
+        for bad in ('{"version": 0, "nodes": []}', '{"version": 1, "nodes": [[0]]}', 'not json'):
+            overlay_engine._BASE_CACHE.clear()
+            entry.write_text(bad)
+            etree, _ = self.apply([])
+            self.assertEqual(etree.node('/soc/i2c@7e804000').props['status'].value, '"disabled"')
+        self.assertEqual(json.loads(entry.read_text())['version'], overlay_engine.BASE_CACHE_VERSION)
+
+
+if __name__ == '__main__':
+    unittest.main()
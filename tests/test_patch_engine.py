@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools import patch_engine
+
+
+ORIGINAL = ''.join(f"line {i}\n" for i in range(1, 31))
+
+PATCH = """--- a/drivers/x/x.c
++++ b/drivers/x/x.c
+@@ -3,5 +3,5 @@
+ line 3
+ line 4
+-line 5
++line five
+ line 6
+ line 7
+@@ -20,4 +20,6 @@
+ line 20
+ line 21
++added a
++added b
+ line 22
+ line 23
+"""
+
+SECOND = """--- a/drivers/x/x.c
++++ b/drivers/x/x.c
+@@ -28,3 +28,3 @@
+ line 28
+-line 29
++line twenty-nine
+ line 30
+"""
+
+
+class PatchEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.target = self.root / 'drivers' / 'x' / 'x.c'
+        self.target.parent.mkdir(parents=True)
+        self.target.write_text(ORIGINAL)
+        self.patches = []
+        for name, text in (('01-x.patch', PATCH), ('02-x.patch', SECOND)):
+            path = self.root / name
+            path.write_text(text)
+            self.patches.append(str(path))
+        self.state = self.root / 'state.json'
+
+    def run_engine(self):
+        return patch_engine.apply_patches(self.patches, self.root, self.state)
+
+    def expected(self):
+        return (ORIGINAL.replace('line 5\n', 'line five\n').replace('line 21\n', 'line 21\nadded a\nadded b\n')
+                .replace('line 29\n', 'line twenty-nine\n'))
+
+    def test_applies_all_patches_and_skips_them_afterwards(self):
+        results = self.run_engine()
+        self.assertEqual([r[2] for r in results], ['applied', 'applied'])
+        self.assertEqual(self.target.read_text(), self.expected())
+        mtime = self.target.stat().st_mtime_ns
+        self.assertEqual([r[2] for r in self.run_engine()], ['up-to-date', 'up-to-date'])
+        self.assertEqual(self.target.stat().st_mtime_ns, mtime)
+        # without the state file the applied hunks are still recognised
+        self.state.unlink()
+        self.assertEqual([r[2] for r in self.run_engine()], ['already-applied', 'already-applied'])
+
+    def test_offset_and_fuzz_are_reported(self):
+        text = 'new 1\nnew 2\n' + ORIGINAL.replace('line 3\n', 'line three\n')
+        self.target.write_text(text)
+        results = self.run_engine()
+        self.assertEqual([r[2] for r in results], ['applied', 'applied'])
+        notes = results[0][3]
+        self.assertIn('hunk #1 at line 5 (offset +2)', notes)
+        self.assertIn('hunk #1 with fuzz 1', notes)
+        self.assertIn('line five\n', self.target.read_text())
+        self.assertIn('line three\n', self.target.read_text())
+
+    def test_every_hunk_of_a_shifted_file_reports_its_offset(self):
+        self.target.write_text(''.join(f"new {i}\n" for i in range(7)) + ORIGINAL)
+        results = self.run_engine()
+        self.assertEqual([r[2] for r in results], ['applied', 'applied'])
+        self.assertEqual(results[0][3], ['hunk #1 at line 10 (offset +7)', 'hunk #2 at line 27 (offset +7)'])
+        # the second patch sees the two lines the first one added, as patch(1) would
+        self.assertEqual(results[1][3], ['hunk #1 at line 37 (offset +9)'])
+
+    def test_conflict_leaves_file_untouched(self):
+        text = ORIGINAL.replace('line 5\n', 'line 5 changed upstream\n')
+        self.target.write_text(text)
+        results = self.run_engine()
+        self.assertEqual([r[2] for r in results], ['conflict', 'applied'])
+        self.assertEqual(results[0][3], ['hunk #1 FAILED at line 3'])
+        self.assertEqual(self.target.read_text(), text)
+        self.assertNotIn('drivers/x/x.c', patch_engine.load_state(self.state)['targets'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,99 +12,158 @@ only performs changes that are very likely to be safe:
   and are missing a 'reg' property. The reg value is derived from the unit
   address (and padded if the parent indicates multiple address-cells).
 - Pad existing reg properties (e.g., <0x34>) with leading zeros so their
-  length matches the expected address-cells for the parent if siblings or
-  an explicit '#address-cells' are available. We always pad with zeros
-  (prefix) to avoid changing the lower-order part of the address.
+  length matches the expected address-cells for the parent (explicit,
+  inherited through a fragment target as dts_check.py works it out, or
+  guessed from the siblings). We always pad with zeros (prefix) to avoid
+  changing the lower-order part of the address.
 
 Usage: auto_fix_dts.py --file <path-to-dts> [--apply] [--backup] [--report <file>]
+       auto_fix_dts.py --dir overlays/ [--file extra.dts ...] [--jobs N] [--apply]
+       auto_fix_dts.py --stream [<path-to-dts>] > fixed.dts
 
 The script writes a lightweight, human-readable summary to stdout and
 optionally to a report file. If --apply is provided, the changes are
 applied in-place (a backup is written with .orig suffix when --backup
-is enabled).
+is enabled) unless the fixed content fails to compile with dtc. Several
+files are fixed in a process pool, each isolated from the others.
+
+Helpers: dtc_cache.py (dtc results), dts_preprocess.py (#include and
+--deps-dir), dts_stats.py (--timings, --profile), dts_report.py (shared
+report, --report-format jsonl) and dts_stream.py (--stream).
 """
 import argparse
+import bisect
+import collections
+import cProfile
+import heapq
+import io
+import json
+import os
+import pstats
 import re
 import sys
+import time
 from pathlib import Path
-import subprocess
 import shlex
-import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from tools import dtc_cache, dtc_diag, dts_check, dts_index, dts_parser, dts_preprocess, dts_report, dts_stats, dts_stream
+except ImportError:  # executed as a script from tools/
+    import dtc_cache
+    import dtc_diag
+    import dts_check
+    import dts_index
+    import dts_parser
+    import dts_preprocess
+    import dts_report
+    import dts_stats
+    import dts_stream
 
 
 def parse_args():
     p = argparse.ArgumentParser()
-    p.add_argument('--file', '-f', required=True, help='DTS overlay file to fix')
+    p.add_argument('--file', '-f', action='append', default=[], help='DTS overlay file to fix (repeatable)')
+    p.add_argument('--dir', '-d', action='append', default=[], help='Fix every *.dts file in this directory (repeatable)')
+    p.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Number of worker processes for batch mode')
+    p.add_argument('--stream', nargs='?', const='-', default=None, metavar='FILE',
+                   help='Read FILE (default: stdin) incrementally and write the fixed DTS to stdout')
     p.add_argument('--apply', action='store_true', help='Apply fixes to file in-place')
     p.add_argument('--backup', action='store_true', default=True, help='Create a .orig backup when applying')
     p.add_argument('--report', '-r', default=None, help='Append human-readable report to this file')
+    p.add_argument('--report-format', choices=dts_report.FORMATS, default='text',
+                   help='Report as human-readable text or as JSON lines (one record per file and per change)')
     p.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
     p.add_argument('--dtc-inc', help='Pass-through DTC -i include flags (as a single string)')
-    return p.parse_args()
+    p.add_argument('--cache-dir', default=None, help='dtc result cache directory (default: ~/.cache/uconsole-dtc)')
+    p.add_argument('--no-cache', action='store_true', help='Always run dtc instead of using cached results')
+    p.add_argument('--cpp-include', '-I', action='append', default=[],
+                   help='Extra cpp include directory for overlays using #include (repeatable; '
+                        'the overlay directory and tools/dtc_stub_includes are always searched)')
+    p.add_argument('--deps-dir', default=None, help='Write a make-style .d file with the headers of each preprocessed overlay here')
+    p.add_argument('--timings', nargs='?', const='-', default=None, metavar='FILE',
+                   help='Write per-phase timings and counters as JSON to FILE (default: stdout)')
+    p.add_argument('--profile', default=None, metavar='FILE',
+                   help='Run under cProfile, dump stats to FILE and add hot functions to --timings (implies --jobs 1)')
+    args = p.parse_args()
+    if args.stream is not None:
+        if args.file or args.dir or args.apply:
+            p.error('--stream cannot be combined with --file, --dir or --apply')
+    elif not args.file and not args.dir:
+        p.error('one of --file, --dir or --stream is required')
+    return args
+
+
+class FixResult(tuple):
+    """(changed, summary) pair returned by process_file(). ok is False when
+    the final dtc compile check failed for the file; stats is the
+    dts_stats.FixStats collected while processing it."""
+
+    def __new__(cls, changed, summary, ok=True, stats=None):
+        self = super().__new__(cls, (changed, summary))
+        self.ok = ok
+        self.stats = stats
+        return self
+
+    def __getnewargs__(self):
+        return self[0], self[1], self.ok, self.stats
+
+
+# Last (text, tree, {start line: node}) parsed from a list of lines, so that
+# repeated find_nodes()/extract_parent_block() calls on the same file share
+# one parse
+_LAST_PARSE = [None, None, None]
+
+
+def _parse_lines(lines):
+    text = '\n'.join(lines)
+    if _LAST_PARSE[0] != text:
+        _LAST_PARSE[:] = [text, dts_parser.parse(text), None]
+    return _LAST_PARSE[1]
+
+
+def _nodes_by_line(lines):
+    tree = _parse_lines(lines)
+    if _LAST_PARSE[2] is None:
+        by_line = {}
+        for node in tree.walk():
+            by_line.setdefault(tree.line_of(node.start), node)
+        _LAST_PARSE[2] = by_line
+    return tree, _LAST_PARSE[2]
 
 
 def find_nodes(lines):
     """Yield tuples (node_label, node_name, unit_str, start_idx, end_idx, indent)
     for nodes with explicit unit addresses (node@addr) found in the file.
     The end_idx is the line index where the corresponding closing brace '}' is.
-    The algorithm is intentionally simple: it scans lines and tracks brace depth
-    counting occurrences of '{' and '}'. This works well for the fairly small
-    and typical overlay fragments we edit.
+    Nodes come from a single pass of dts_parser, so the cost is linear in the
+    size of the file rather than in nodes x lines.
     """
-    node_re = re.compile(r'^(?P<indent>\s*)(?:(?P<label>[A-Za-z0-9_,-]+):\s*)?(?P<name>[A-Za-z0-9_,-]+)@(?P<unit>[^\s{]+)\s*\{')
-    depth = 0
+    return unit_node_tuples(_parse_lines(lines))
+
+
+def unit_node_tuples(tree):
+    """find_nodes() tuples for an already parsed tree."""
+    text = tree.text
     nodes = []
-    for idx, line in enumerate(lines):
-        # Update depth info for the current line - assume braces are not in strings/comments in normal overlays
-        open_braces = line.count('{')
-        close_braces = line.count('}')
-        m = node_re.match(line)
-        if m:
-            # find the matching closing brace for this node using a simple depth walk
-            cur_depth = depth + open_braces
-            end_idx = idx
-            for j in range(idx+1, len(lines)):
-                cur_depth += lines[j].count('{')
-                cur_depth -= lines[j].count('}')
-                if cur_depth <= depth:
-                    end_idx = j
-                    break
-            nodes.append((m.group('label') or '', m.group('name'), m.group('unit'), idx, end_idx, m.group('indent')))
-        depth += open_braces - close_braces
+    for node in tree.walk():
+        if not node.unit:
+            continue
+        line_start = tree.line_start(node.start)
+        indent = text[line_start:node.start]
+        indent = indent[:len(indent) - len(indent.lstrip())]
+        nodes.append((node.label, node.basename, node.unit, tree.line_of(node.start), tree.line_of(node.end - 1), indent))
     return nodes
 
 
 def extract_parent_block(lines, node_start_idx):
-    # find the nearest previous line that represents a parent start (has a '{')
-    depth = 0
-    # compute depth up to node_start_idx to find parent depth
-    for i in range(0, node_start_idx+1):
-        depth += lines[i].count('{') - lines[i].count('}')
-    # Now go backwards to find where depth decreases (parent's starting line)
-    parent_start = None
-    parent_depth = depth - 1
-    cur_depth = 0
-    for i in range(0, node_start_idx):
-        cur_depth += lines[i].count('{') - lines[i].count('}')
-    for i in range(node_start_idx-1, -1, -1):
-        cur_depth -= lines[i].count('{') - lines[i].count('}')
-        if cur_depth == parent_depth:
-            # search backward for the start of the parent block (line that has a '{')
-            for j in range(i, -1, -1):
-                if '{' in lines[j]:
-                    parent_start = j
-                    break
-            break
-    if parent_start is None:
-        # parent is root; return full file range
-        return 0, len(lines)-1
-    # find end of parent block
-    cur_depth = 0
-    for j in range(parent_start, len(lines)):
-        cur_depth += lines[j].count('{') - lines[j].count('}')
-        if cur_depth == 0:
-            return parent_start, j
-    return parent_start, len(lines)-1
+    """Return (start, end) line indices of the block enclosing the node that
+    starts on line node_start_idx, or the whole file for top-level nodes."""
+    tree, by_line = _nodes_by_line(lines)
+    node = by_line.get(node_start_idx)
+    if node is not None and node.parent is not None:
+        return tree.line_of(node.parent.start), tree.line_of(node.parent.end - 1)
+    return 0, len(lines)-1
 
 
 def find_reg_in_block(block_text):
@@ -127,6 +186,72 @@ def find_address_cells_in_block(block_text):
     return None
 
 
+def expected_address_cells(node):
+    """Expected number of address cells for node's reg: the parent's
+    #address-cells, else the longest sibling reg, else 1."""
+    parent = node.parent
+    if parent is None:
+        return 1
+    cells = dts_parser.prop_int(parent, '#address-cells')
+    if cells is not None:
+        return cells
+    max_tokens = 0
+    for sibling in parent.children:
+        reg = sibling.props.get('reg')
+        if reg is not None:
+            max_tokens = max(max_tokens, len(reg_tokens(reg)))
+    return max_tokens or 1
+
+
+def reg_tokens(reg):
+    """Numeric tokens of a single-group reg property (<...>), else []."""
+    groups = dts_parser.cell_groups(reg.value)
+    if len(groups) != 1:
+        return []
+    return re.findall(r'(0x[0-9A-Fa-f]+|\d+)', ' '.join(groups[0]))
+
+
+def reg_insert_edit(tree, node, prop_text):
+    """Return an (offset, offset, text) edit adding prop_text as the first
+    property of node, indented like the node's existing body."""
+    first = min([pr.start for pr in node.props.values()] + [c.start for c in node.children], default=None)
+    return insert_edit(tree.text, node.start, node.body_start, first, prop_text)
+
+
+def insert_edit(text, start, body_start, first, prop_text, base=0):
+    """reg_insert_edit() for a node given by its start and body_start
+    offsets and the start of its first property or child (None if empty).
+    text holds the source from offset base on (the streaming window)."""
+    def line_start(offset):
+        return base + text.rfind('\n', 0, offset - base) + 1
+
+    eol = text.find('\n', body_start - base)
+    if eol < 0 or text[body_start - base:eol].strip():
+        # opener shares its line with other content; insert inline
+        return body_start, body_start, ' ' + prop_text
+    eol += base
+    indent = text[line_start(start) - base:start - base]
+    indent = indent[:len(indent) - len(indent.lstrip())] + '\t'
+    if first is not None and line_start(first) > eol:
+        body_indent = text[line_start(first) - base:first - base]
+        if not body_indent.strip():
+            indent = body_indent
+    return eol + 1, eol + 1, f"{indent}{prop_text}\n"
+
+
+def apply_edits(text, edits):
+    """Apply non-overlapping (start, end, replacement) spans to text in a
+    single join."""
+    out = []
+    pos = 0
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1])):
+        out.append(text[pos:start])
+        out.append(replacement)
+        pos = end
+    out.append(text[pos:])
+    return ''.join(out)
+
+
 def tokenize_unit(unit_str):
     parts = unit_str.split(',')
     tokens = []
@@ -160,230 +285,588 @@ def stringify_tokens(tokens):
 
 
 def report_append(report_path, text):
+    if isinstance(report_path, list):
+        # in-memory sink used by batch workers; merged by the parent
+        report_path.append(text)
+        return
     if not report_path:
         return
-    p = Path(report_path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    with p.open('a') as fh:
-        fh.write(text)
+    dts_report.append_locked(report_path, text)
+
+
+def process_file(file_path, apply=False, backup=True, report=None, verbose=False, dtc_inc=None, cache=None, stats=None,
+                 cpp_inc=(), cpp_cache=None, deps_dir=None):
+    """Fix one DTS file. report is a dts_report.ReportWriter, a report file
+    path or a list sink; anything but a writer is written once on return.
+    Files using #include are preprocessed (with cpp_inc as extra include
+    dirs and cpp_cache as a dts_preprocess.PreprocessCache) for the
+    reg_format check and the dtc gate; edits are still made on the source."""
+    writer = report if isinstance(report, dts_report.ReportWriter) else dts_report.ReportWriter(report)
+    if stats is None:
+        stats = dts_stats.FixStats()
+    try:
+        return _process_file(file_path, apply, backup, writer, verbose, dtc_inc, cache, stats, cpp_inc, cpp_cache, deps_dir)
+    finally:
+        if writer is not report:
+            writer.flush()
+
+
+def _report_file(writer, p, stats, t0, changed, ok, status, dtc=None, changes=(), unresolved=(), applied=False, deps=None):
+    """Queue the jsonl records for one processed file. changes holds
+    (change tuple, output line) pairs. Only the file record has the time
+    spent, so summing over records does not count it twice."""
+    seconds = time.perf_counter() - t0
+    for c, line in changes:
+        writer.record({'type': 'change', 'file': str(p), 'node': c[4].path, 'line': line, 'kind': c[2],
+                       'old_reg': c[5], 'new_reg': c[6], 'applied': applied, 'dtc': dtc})
+    writer.record({'type': 'file', 'file': str(p), 'status': status, 'changed': changed, 'ok': ok,
+                   'applied': applied, 'changes': len(changes), 'nodes': len(set(c[4] for c, _ in changes)),
+                   'unresolved': [{'node': mm.path, 'reg_cells': mm.reg_cells, 'address_cells': mm.address_cells,
+                                   'size_cells': mm.size_cells} for mm in unresolved],
+                   'dtc': dtc, 'deps': deps, 'seconds': seconds})
+
+
+def _preprocess(writer, p, text, cpp_inc, cpp_cache, stats):
+    """dts_preprocess.preprocess() under the 'preprocess' phase; cpp
+    failures are reported and return None."""
+    with stats.phase('preprocess'):
+        try:
+            return dts_preprocess.preprocess(text, p, cpp_inc, cpp_cache)
+        except RuntimeError as e:
+            writer.text(f"{p.name}: {e}\n")
+            return None
 
 
-def process_file(file_path, apply=False, backup=True, report=None, verbose=False, dtc_inc=None):
+def _process_file(file_path, apply, backup, writer, verbose, dtc_inc, cache, stats, cpp_inc, cpp_cache, deps_dir):
+    t0 = time.perf_counter()
+    stats.files += 1
     p = Path(file_path)
     if not p.exists():
         raise SystemExit(f"File not found: {file_path}")
-    orig_text = p.read_text()
-    lines = orig_text.splitlines()
+    with stats.phase('read'):
+        orig_text = p.read_text()
+    stats.bytes_read += len(orig_text.encode())
+    with stats.phase('parse'):
+        tree = dts_parser.parse(orig_text)
+        all_nodes = list(tree.walk())
 
-    nodes = find_nodes(lines)
+    nodes = [n for n in all_nodes if n.unit]
+    stats.nodes += len(all_nodes)
+    stats.unit_nodes += len(nodes)
     if verbose:
         print(f"Found {len(nodes)} unit-address nodes")
         for nd in nodes:
-            print(f"  node: label={nd[0]!r}, name={nd[1]!r}, unit={nd[2]!r}, start={nd[3]}, end={nd[4]}, indent={nd[5]!r}")
+            print(f"  node: label={nd.label!r}, name={nd.basename!r}, unit={nd.unit!r}, path={nd.path!r}, span={nd.start}-{nd.end}")
+    # Overlays with #include need cpp (as in scripts/build_overlay.sh); the
+    # check then runs on the expanded text and maps nodes back to the source.
+    # Done even without unit nodes so the header deps are always recorded.
+    pre = None
+    deps = None
+    if dts_preprocess.needs_cpp(orig_text):
+        pre = _preprocess(writer, p, orig_text, cpp_inc, cpp_cache, stats)
+        if pre is not None:
+            deps = pre.deps
+            if deps_dir:
+                Path(deps_dir).mkdir(parents=True, exist_ok=True)
+                dts_preprocess.write_depfile(Path(deps_dir) / (p.stem + '.d'), p, deps)
+
     if not nodes:
-        return False, 'no-change'
-
-    modified = False
-    changes = []
-    # We'll operate on a mutable list of lines so we can edit easily
-    for (label, nodename, unit, start, end, indent) in nodes:
-        # Skip overlay fragment guidance and other non-hardware pseudo-nodes
-        if nodename == 'fragment':
-            continue
-        block_lines = lines[start:end+1]
-        block_text = '\n'.join(block_lines)
-        reg_search = find_reg_in_block(block_text)
-        # Determine expected address-cells by looking in the parent block (siblings or explicit #address-cells)
-        parent_start, parent_end = extract_parent_block(lines, start)
-        parent_block_text = '\n'.join(lines[parent_start:parent_end+1])
-        expected_cells = find_address_cells_in_block(parent_block_text)
-        if expected_cells is None:
-            # look for sibling reg properties and use the max tokens among them
-            sibling_regs = re.findall(r'reg\s*=\s*<([^>]*)>\s*;', parent_block_text, flags=re.S)
-            if sibling_regs:
-                max_tokens = 0
-                for s in sibling_regs:
-                    s_tokens = re.findall(r'(0x[0-9A-Fa-f]+|\d+)', s)
-                    max_tokens = max(max_tokens, len(s_tokens))
-                if max_tokens > 0:
-                    expected_cells = max_tokens
-        if expected_cells is None:
-            expected_cells = 1
-
-        # When the node has a unit address and missing reg -> add reg. If reg present but shorter -> pad.
-        if reg_search is None:
-            # no reg present; create one from unit
-            unit_tokens = tokenize_unit(unit)
-            if not unit_tokens:
-                # skip if we couldn't parse
+        _report_file(writer, p, stats, t0, False, True, 'no-change', deps=deps)
+        return FixResult(False, 'no-change', stats=stats)
+
+    with stats.phase('plan'):
+        changes = []
+        # planned maps node -> final reg tokens. Every reg change is decided in
+        # memory first and becomes a single span edit per node afterwards.
+        planned = {}
+        for node in nodes:
+            # Skip overlay fragment guidance and other non-hardware pseudo-nodes
+            if node.basename == 'fragment':
                 continue
-            padded = pad_tokens(unit_tokens, expected_cells)
-            new_reg = '<{}>'.format(stringify_tokens(padded))
-            # insert after opening brace line
-            # find position of the line containing the opening brace (node declaration)
-            opener_line_idx = start
-            # insert into the block at start+1 with same indentation + a tab
-            insert_idx = opener_line_idx + 1
-            m_indent = re.match(r'^(\s*)', lines[opener_line_idx])
-            indent_str = m_indent.group(1) if m_indent else ''
-            reg_line = f"{indent_str}\treg = {new_reg};"
-            lines.insert(insert_idx, reg_line)
-            modified = True
-            changes.append((p.name, nodename, 'add-reg', new_reg))
-        else:
-            full_match, tokens, rstart, rend = reg_search
-            if tokens:
-                if len(tokens) < expected_cells:
-                    # pad left
-                    padded = pad_tokens(tokens, expected_cells)
-                    new_reg = '<{}>'.format(stringify_tokens(padded))
-                    # replace in the block_text
-                    new_block_text = block_text[:rstart] + 'reg = ' + new_reg + ';' + block_text[rend:]
-                    # write back to lines
-                    new_block_lines = new_block_text.splitlines()
-                    lines[start:end+1] = new_block_lines
-                    modified = True
-                    changes.append((p.name, nodename, 'pad-reg', full_match + ' -> reg = ' + new_reg))
-            else:
-                # reg present but tokens not recognized; skip
-                pass
-
-    if not modified:
-        if report:
-            report_append(report, f"{p.name}: no modifications needed\n")
-        return False, 'no-change'
-
-    # write temp file and optionally apply
-    fixed_path = p.with_suffix('.fixed.dts')
-    p_fixed = fixed_path
-    p_fixed.write_text('\n'.join(lines) + '\n')
-    # delegate to apply decision
-    if apply:
-        if backup:
-            backup_path = p.with_suffix('.dts.orig')
-            if not backup_path.exists():
-                # move original to backup, then write the fixed content to original path
-                p.rename(backup_path)
-        # write the fixed content to the original path
-        p.write_text('\n'.join(lines) + '\n')
-    else:
-        # do not overwrite original; leave .fixed.dts for inspection
-        pass
-
-    # If dtc is present and dtc_inc info was passed, try running dtc to parse any
-    # reg_format warnings and try to auto-pad reg properties accordingly (multiple
-    # passes if necessary). We only attempt these fixes when dtc is installed.
-    if shutil.which('dtc') is not None:
-        dts_file_for_check = p if apply else p_fixed
-        # iterate a few times to converge on pad fixes
-        iter_count = 0
-        max_iters = 3
-        any_iter_modified = False
-        while iter_count < max_iters:
-            iter_count += 1
-            # recompute nodes because the previous iteration may have rewritten lines
-            nodes = find_nodes(lines)
-            results, dtc_out = run_dtc_and_get_reg_format_warnings(str(dts_file_for_check), dtc_inc)
-            if not results:
-                break
-            if verbose:
-                print(f"dtc reported {len(results)} reg_format warnings; attempting to auto-pad (iter {iter_count})")
-            made_changes_this_iter = False
-            for nodepath, expected_cells in results:
-                # nodepath examples: /fragment@1/__overlay__/spidev@0
-                parts = [p for p in nodepath.strip('/').split('/') if p]
-                if not parts:
-                    continue
-                # the last part should be the node with unit, e.g., spidev@0
-                target = parts[-1]
-                if '@' not in target:
-                    continue
-                name, unit = target.split('@', 1)
-                # find a fragment index if present in parts
-                frag_name = None
-                for part in parts[:-1]:
-                    if part.startswith('fragment@'):
-                        frag_name = part
-                        break
-                # find the candidate node in our nodes list
-                candidate = None
-                for (lbl, ndname, ndunit, start_idx, end_idx, ndindent) in nodes:
-                    if ndname == name and ndunit == unit:
-                        # if frag_name specified, ensure this node is inside that fragment block
-                        if frag_name:
-                            frag_unit = frag_name.split('@', 1)[1]
-                            # find fragment node range
-                            for (flbl, fname, funit, fstart, fend, findent) in nodes:
-                                if fname == 'fragment' and funit == frag_unit:
-                                    # ensure this node is in the fragment block range
-                                    if start_idx >= fstart and start_idx <= fend:
-                                        candidate = (lbl, ndname, ndunit, start_idx, end_idx, ndindent)
-                                        break
-                            if candidate:
-                                break
-                        else:
-                            candidate = (lbl, ndname, ndunit, start_idx, end_idx, ndindent)
-                            break
-                if not candidate:
-                    if verbose:
-                        print(f"Unable to find node {name}@{unit} in file to pad reg")
+            # Determine expected address-cells from the parent (explicit #address-cells or siblings)
+            expected_cells = expected_address_cells(node)
+            reg = node.props.get('reg')
+
+            # When the node has a unit address and missing reg -> add reg. If reg present but shorter -> pad.
+            if reg is None:
+                # no reg present; create one from unit
+                unit_tokens = tokenize_unit(node.unit)
+                if not unit_tokens:
+                    # skip if we couldn't parse
                     continue
-                # Extract block and reg property
-                (lbl, ndname, ndunit, sidx, eidx, nbindent) = candidate
-                block_text = '\n'.join(lines[sidx:eidx+1])
-                reg_search = find_reg_in_block(block_text)
-                if not reg_search:
-                    # No reg found - e.g., unit exists but no reg property - skip
+                padded = pad_tokens(unit_tokens, expected_cells)
+                planned[node] = padded
+                new_reg = '<{}>'.format(stringify_tokens(padded))
+                changes.append((p.name, node.basename, 'add-reg', new_reg, node, None, new_reg))
+            else:
+                tokens = reg_tokens(reg)
+                if pre is not None and any(dts_parser.cell_int(t) is None for t in tokens):
+                    # macros may expand to several cells; left to the check on the expanded text
                     continue
-                full_match, tokens, rstart, rend = reg_search
                 if tokens and len(tokens) < expected_cells:
+                    # pad left
                     padded = pad_tokens(tokens, expected_cells)
+                    planned[node] = padded
                     new_reg = '<{}>'.format(stringify_tokens(padded))
-                    new_block_text = block_text[:rstart] + 'reg = ' + new_reg + ';' + block_text[rend:]
-                    new_block_lines = new_block_text.splitlines()
-                    lines[sidx:eidx+1] = new_block_lines
-                    made_changes_this_iter = True
-                    any_iter_modified = True
-                    changes.append((p.name, ndname, 'pad-reg-dtc', f"{full_match} -> reg = {new_reg}"))
-            if not made_changes_this_iter:
-                break
-            # write intermediate changes to file so the next dtc run sees them
-            (p if apply else p_fixed).write_text('\n'.join(lines) + '\n')
-        if any_iter_modified and apply:
-            # if dtc couldn't validate the final file, we'll surface the output via report
-            results_after, dtc_out_after = run_dtc_and_get_reg_format_warnings(str(dts_file_for_check), dtc_inc)
-            if results_after:
-                report_append(report, f"{p.name}: dtc still reported reg_format warnings after auto-padding; see dtc output:\n{dtc_out_after}\n")
-        # Final compile check to ensure the modified file is valid
-        rc, dtc_final_out = run_dtc_compile(str(dts_file_for_check), dtc_inc)
+                    changes.append((p.name, node.basename, 'pad-reg', orig_text[reg.start:reg.end] + ' -> reg = ' + new_reg, node,
+                                    reg.value, new_reg))
+
+    # One in-memory reg_format pass over the whole tree (including the regs
+    # planned above) replaces the old dtc -> regex -> rewrite -> dtc loop.
+    unresolved = []
+    with stats.phase('check'):
+        override = {n: len(t) for n, t in planned.items()}
+        if pre is not None:
+            check_tree = dts_parser.parse(pre.text)
+            back = dts_preprocess.map_nodes(check_tree, tree, pre.line_map, str(p))
+            override = {cn: override[sn] for cn, sn in back.items() if sn in override}
+            mismatches = dts_check.check_reg_format(check_tree, reg_override=override)
+        else:
+            back = None
+            mismatches = dts_check.check_reg_format(tree, reg_override=override)
+    if verbose and mismatches:
+        print(f"reg_format check reported {len(mismatches)} mismatches")
+    for mm in mismatches:
+        node = back.get(mm.node) if back is not None else mm.node
+        if node is None or ('reg' not in node.props and node not in planned):
+            # defined in a header (or only through macros): nothing to edit here
+            unresolved.append(mm)
+            continue
+        tokens = planned.get(node)
+        if tokens is not None:
+            old_reg = '<{}>'.format(stringify_tokens(tokens))
+            old = f"reg = {old_reg};"
+        elif 'reg' in node.props:
+            reg = node.props['reg']
+            tokens = reg_tokens(reg)
+            old_reg = reg.value
+            old = orig_text[reg.start:reg.end]
+        # Only pad against cells that are known: assumed ones are dtc's 2/1
+        # defaults for a parent (or overlay target) whose cells were not found
+        if node.unit and node.basename != 'fragment' and not mm.assumed and tokens and len(tokens) < mm.address_cells:
+            padded = pad_tokens(tokens, mm.address_cells)
+            planned[node] = padded
+            new_reg = '<{}>'.format(stringify_tokens(padded))
+            changes.append((p.name, node.basename, 'pad-reg-check', f"{old} -> reg = {new_reg}", node, old_reg, new_reg))
+        else:
+            unresolved.append(mm)
+    stats.changes += len(changes)
+    stats.unresolved += len(unresolved)
+
+    edits = []
+    for node, tokens in planned.items():
+        prop_text = 'reg = <{}>;'.format(stringify_tokens(tokens))
+        reg = node.props.get('reg')
+        if reg is None:
+            edits.append(reg_insert_edit(tree, node, prop_text))
+        else:
+            edits.append((reg.start, reg.end, prop_text))
+
+    if not edits:
+        writer.text(f"{p.name}: no modifications needed\n")
+        _report_file(writer, p, stats, t0, False, True, 'no-change', unresolved=unresolved, deps=deps)
+        return FixResult(False, 'no-change', stats=stats)
+    with stats.phase('edit'):
+        fixed_text = apply_edits(orig_text, edits)
+        if not fixed_text.endswith('\n'):
+            fixed_text += '\n'
+        # Report the lines nodes end up on in fixed_text, however many edits
+        # precede them
+        moved = dts_index.EditMap(orig_text, edits)
+        change_lines = [(c, moved.line(c[4].start, tree.line_of(c[4].start)) + 1) for c in changes]
+
+    # If dtc is installed, run it exactly once on the fixed content (through
+    # stdin) as the final compile gate, before anything is written. All reg
+    # padding was already computed above, so any reg_format warning that dtc
+    # still reports is only surfaced in the report.
+    compile_ok = True
+    dtc = None
+    if dtc_cache.dtc_version():
+        dtc_input = fixed_text
+        if pre is not None:
+            fixed_pre = _preprocess(writer, p, fixed_text, cpp_inc, cpp_cache, stats)
+            if fixed_pre is not None:
+                dtc_input = fixed_pre.text
+        with stats.phase('dtc'):
+            record = run_dtc(str(p), dtc_inc, cache, content=dtc_input, stats=stats)
+        rc, dtc_final_out = record['rc'], record['output']
+        dtc = dict(stats.dtc_runs[-1]) if stats.dtc_runs else {'rc': rc, 'cached': False, 'seconds': 0.0}
+        # records cached before diagnostics were parsed have none
+        dtc['diagnostics'] = dtc_diag.summary(record.get('diagnostics', []))
+        if record['reg_format']:
+            paths = dts_index.PathIndex(tree)
+            located = []
+            for nodepath, cells in record['reg_format']:
+                node = paths.lookup(nodepath)
+                where = f"line {moved.line(node.start, tree.line_of(node.start)) + 1}" if node is not None else 'not found in source'
+                located.append(f"  {nodepath} ({where}): #address-cells == {cells}\n")
+            writer.text(f"{p.name}: dtc still reported reg_format warnings after auto-padding:\n{''.join(located)}see dtc output:\n{dtc_final_out}\n")
         if rc != 0:
-            # revert to original since the compile failed
-            backup_path = p.with_suffix('.dts.orig')
-            if backup and backup_path.exists():
-                backup_path.replace(p)
-                report_append(report, f"{p.name}: auto-fix reverted because dtc compile failed (rc={rc}). dtc output:\n{dtc_final_out}\n")
-                return False, 'reverted due to dtc compile failure'
-            else:
-                report_append(report, f"{p.name}: auto-fix left in place, but dtc compile failed (rc={rc}). dtc output:\n{dtc_final_out}\n")
+            compile_ok = False
+            if apply:
+                # leave the original untouched since the fixed content does not compile
+                writer.text(f"{p.name}: auto-fix not applied because dtc compile failed (rc={rc}). dtc output:\n{dtc_final_out}\n")
+                _report_file(writer, p, stats, t0, False, False, 'not-applied', dtc, change_lines, unresolved, deps=deps)
+                return FixResult(False, 'not applied due to dtc compile failure', ok=False, stats=stats)
+            writer.text(f"{p.name}: proposed auto-fix does not compile with dtc (rc={rc}). dtc output:\n{dtc_final_out}\n")
+
+    # The only writes: the final output and, when applying, the backup
+    with stats.phase('write'):
+        if apply:
+            if backup:
+                backup_path = p.with_suffix('.dts.orig')
+                if not backup_path.exists():
+                    # move original to backup, then write the fixed content to original path
+                    p.rename(backup_path)
+            p.write_text(fixed_text)
+        else:
+            # do not overwrite original; leave .fixed.dts for inspection
+            p.with_suffix('.fixed.dts').write_text(fixed_text)
+    stats.bytes_written += len(fixed_text.encode())
 
     # Write summary to report
-    report_entries = [f"{p.name}: modified {len(changes)} nodes"]
-    for c in changes:
-        report_entries.append(f"  node {c[1]}: {c[2]} -> {c[3]}")
+    report_entries = [f"{p.name}: modified {len(planned)} nodes"]
+    for c, line in change_lines:
+        report_entries.append(f"  node {c[1]} (line {line}): {c[2]} -> {c[3]}")
+    for mm in unresolved:
+        report_entries.append(f"  node {mm.path}: unresolved reg_format ({mm.reg_cells} cells, "
+                              f"#address-cells == {mm.address_cells}, #size-cells == {mm.size_cells})")
     report_text = '\n'.join(report_entries) + '\n'
-    if report:
-        report_append(report, report_text)
+    writer.text(report_text)
+    _report_file(writer, p, stats, t0, True, compile_ok, 'applied' if apply else 'proposed', dtc, change_lines, unresolved, apply, deps)
     if verbose:
         print(report_text)
-    return True, report_text
+    return FixResult(True, report_text, ok=compile_ok, stats=stats)
 
 
-def run_dtc_and_get_reg_format_warnings(dts_path, dtc_inc=None):
-    """Run dtc on dts_path and return list of (nodepath, expected_cells) tuples
-    extracted from 'Warning (reg_format)' messages. Returns (list, dtc_output).
-    """
-    if shutil.which('dtc') is None:
-        return [], ''
+class _StreamFix:
+    """State of process_stream(): the nodes still waiting for a decision
+    and the decided edits not yet written."""
+
+    def __init__(self, parser, out, name):
+        self.parser = parser
+        self.out = out
+        self.name = name
+        self.seq = 0
+        self.waiting = {}                   # node -> document order, undecided
+        self.holds = collections.OrderedDict()  # undecided candidate -> line start (output barrier)
+        self.incomplete = set()             # open nodes whose properties may still grow
+        self.first_child = {}               # node -> start of its first child
+        self.edits = []                     # heap of (start, end, replacement)
+        self.line_deltas = []               # (edit end, change in line count)
+        self.changes = []                   # (phase, order, change tuple, input line)
+        self.unresolved = []                # (order, RegMismatch)
+        self.planned = set()
+        self.nodes = 0
+        self.unit_nodes = 0
+        self.late_deletes = 0
+        self.emitted = 0
+        self.written = 0
+        self.last = ''
+
+    @staticmethod
+    def candidate(node):
+        return bool(node.unit) and node.basename != 'fragment'
+
+    @staticmethod
+    def is_open(node):
+        return node.end == node.body_start
+
+    def open(self, node):
+        self.nodes += 1
+        if node.unit:
+            self.unit_nodes += 1
+        parent = node.parent
+        self.waiting[node] = self.seq
+        self.seq += 1
+        self.incomplete.add(node)
+        if self.candidate(node):
+            self.holds[node] = self.parser.line_start(node.start)
+        if parent is not None and parent not in self.first_child:
+            self.first_child[parent] = node.start
+            self.props_done(parent)
+
+    def props_done(self, node):
+        """node's properties are final (dtc requires them before subnodes)."""
+        if node not in self.incomplete:
+            return
+        self.incomplete.discard(node)
+        if node.labels:
+            # nodes may be waiting for this label's #address-cells
+            for other in list(self.waiting):
+                self.decide(other)
+        else:
+            self.decide(node)
+
+    def close(self, node):
+        self.props_done(node)
+        self.decide(node)
+        for child in node.children:
+            self.decide(child)
+        if node not in self.waiting:
+            self.first_child.pop(node, None)
+        if not any(c in self.waiting for c in node.children):
+            node.children.clear()
+            parent = node.parent
+            if (node not in self.waiting and parent is not None and parent.children and parent.children[-1] is node
+                    and dts_parser.prop_int(parent, '#address-cells') is not None):
+                # no sibling needs it to guess the parent's address cells
+                parent.children.pop()
+
+    def delete(self, node):
+        gone = [n for n in self.waiting if n is node or self._inside(n, node)]
+        for n in gone:
+            del self.waiting[n]
+            self.holds.pop(n, None)
+        if node in self.planned:
+            # already decided and written out; the in-memory fixer would skip it
+            self.late_deletes += 1
+
+    @staticmethod
+    def _inside(node, ancestor):
+        node = node.parent
+        while node is not None:
+            if node is ancestor:
+                return True
+            node = node.parent
+        return False
+
+    def cells(self, parent):
+        """(address_cells, size_cells, assumed) for parent's children, or
+        None while they depend on a label that may still be defined."""
+        addr, size = dts_check.own_cells(parent)
+        assumed = False
+        if addr is None or size is None:
+            inherited = None
+            if parent.name == '__overlay__' or (parent.parent is None and parent.name.startswith('&')):
+                label = dts_check.target_key(parent)[1]
+                entry = self.parser.labels.get(label) if label else None
+                if label and ((entry is None and not self.parser.eof)
+                              or (entry is not None and not entry.complete and entry.node in self.incomplete)):
+                    return None
+                if entry is not None:
+                    # same as dts_check.resolve_target() without keeping the node
+                    own_addr, own_size = entry.cells()
+                    if own_addr is not None or own_size is not None:
+                        inherited = (dts_check.DEFAULT_ADDRESS_CELLS if own_addr is None else own_addr,
+                                     dts_check.DEFAULT_SIZE_CELLS if own_size is None else own_size)
+            if inherited is None:
+                inherited = (dts_check.DEFAULT_ADDRESS_CELLS, dts_check.DEFAULT_SIZE_CELLS)
+                assumed = True
+            addr = inherited[0] if addr is None else addr
+            size = inherited[1] if size is None else size
+        return addr, size, assumed
+
+    def decide(self, node):
+        """Plan and check node like _process_file() once everything that
+        affects it has been read."""
+        order = self.waiting.get(node)
+        if order is None or node in self.incomplete:
+            return
+        parent = node.parent
+        candidate = self.candidate(node)
+        if (candidate and parent is not None and dts_parser.prop_int(parent, '#address-cells') is None
+                and self.is_open(parent)):
+            # expected_address_cells() falls back to the regs of all siblings
+            return
+        cells = self.cells(parent) if parent is not None else None
+        if parent is not None and cells is None:
+            return
+        del self.waiting[node]
+        self.holds.pop(node, None)
+
+        parser = self.parser
+        reg = node.props.get('reg')
+        planned = None
+        if candidate:
+            expected_cells = expected_address_cells(node)
+            if reg is None:
+                unit_tokens = tokenize_unit(node.unit)
+                if unit_tokens:
+                    planned = pad_tokens(unit_tokens, expected_cells)
+                    new_reg = '<{}>'.format(stringify_tokens(planned))
+                    self._change(0, order, node, ('add-reg', new_reg, None, new_reg))
+            else:
+                tokens = reg_tokens(reg)
+                if tokens and len(tokens) < expected_cells:
+                    planned = pad_tokens(tokens, expected_cells)
+                    new_reg = '<{}>'.format(stringify_tokens(planned))
+                    self._change(0, order, node, ('pad-reg', parser.text(reg.start, reg.end) + ' -> reg = ' + new_reg,
+                                                  reg.value, new_reg))
+        if cells is not None:
+            addr, size, assumed = cells
+            reg_cells = len(planned) if planned is not None else (dts_check.value_cells(reg.value) if reg is not None else None)
+            if reg_cells is not None and (addr + size == 0 or reg_cells % (addr + size)):
+                tokens = planned if planned is not None else reg_tokens(reg)
+                if candidate and not assumed and tokens and len(tokens) < addr:
+                    if planned is not None:
+                        old_reg = '<{}>'.format(stringify_tokens(tokens))
+                        old = f"reg = {old_reg};"
+                    else:
+                        old_reg = reg.value
+                        old = parser.text(reg.start, reg.end)
+                    planned = pad_tokens(tokens, addr)
+                    new_reg = '<{}>'.format(stringify_tokens(planned))
+                    self._change(1, order, node, ('pad-reg-check', f"{old} -> reg = {new_reg}", old_reg, new_reg))
+                else:
+                    mm = dts_check.RegMismatch(node, node.path, reg_cells, addr, size, assumed)
+                    self.unresolved.append((order, mm))
+        first_child = self.first_child.pop(node, None) if not self.is_open(node) else self.first_child.get(node)
+        if planned is None:
+            return
+        self.planned.add(node)
+        prop_text = 'reg = <{}>;'.format(stringify_tokens(planned))
+        if reg is None:
+            starts = [pr.start for pr in node.props.values()]
+            if first_child is not None:
+                starts.append(first_child)
+            edit = insert_edit(parser.buf, node.start, node.body_start, min(starts, default=None), prop_text, parser.base)
+        else:
+            edit = (reg.start, reg.end, prop_text)
+        heapq.heappush(self.edits, edit)
+        self.line_deltas.append((edit[1], edit[2].count('\n') - parser.text(edit[0], edit[1]).count('\n')))
+
+    def _change(self, phase, order, node, fix):
+        kind, detail, old_reg, new_reg = fix
+        self.changes.append((phase, order, (self.name, node.basename, kind, detail, node, old_reg, new_reg),
+                             self.parser.line_of(node.start)))
+
+    def flush(self, upto=None):
+        """Write the input up to upto (default: as far as nothing undecided
+        can still change it) with the decided edits applied."""
+        parser = self.parser
+        if upto is None:
+            upto = parser.line_start(parser.offset)
+            if self.holds:
+                upto = min(upto, next(iter(self.holds.values())))
+        edits = self.edits
+        while edits and edits[0][0] < upto:
+            start, end, replacement = heapq.heappop(edits)
+            self._write(parser.text(self.emitted, start))
+            self._write(replacement)
+            self.emitted = end
+        if upto > self.emitted:
+            self._write(parser.text(self.emitted, upto))
+            self.emitted = upto
+        parser.release(self.emitted)
+
+    def _write(self, text):
+        if text:
+            self.out.write(text)
+            self.written += len(text.encode())
+            self.last = text[-1]
+
+    def finish(self):
+        """Decide whatever waited for the end of input and write the rest."""
+        for node in list(self.waiting):
+            self.decide(node)
+        self.flush(self.parser.offset)
+        if self.planned and self.last != '\n':
+            self._write('\n')
+
+    def change_lines(self):
+        """(change tuple, line in the output) in _process_file() order."""
+        deltas = sorted(self.line_deltas)
+        ends = [end for end, _ in deltas]
+        prefix = [0]
+        for _, d in deltas:
+            prefix.append(prefix[-1] + d)
+        lines = []
+        for phase, order, change, line in sorted(self.changes, key=lambda c: (c[0], c[1])):
+            lines.append((change, line + prefix[bisect.bisect_right(ends, change[4].start)] + 1))
+        return lines
+
+
+def process_stream(fin, fout, name='<stdin>', report=None, verbose=False, stats=None, chunk_size=dts_stream.CHUNK):
+    """Fix DTS read from the text stream fin and write the result to fout
+    as it goes. Makes the same reg fixes as process_file() does without
+    cpp, but only keeps the open node path (plus nodes whose fix depends on
+    text not read yet) in memory. Properties must precede subnodes, as dtc
+    requires. There is no dtc gate: the output has already been written by
+    the time the input ends, and a later /delete-node/ cannot undo a fix.
+    Returns a FixResult."""
+    writer = report if isinstance(report, dts_report.ReportWriter) else dts_report.ReportWriter(report)
+    if stats is None:
+        stats = dts_stats.FixStats()
+    t0 = time.perf_counter()
+    stats.files += 1
+    parser = dts_stream.StreamParser(fin, chunk_size)
+    fix = _StreamFix(parser, fout, name)
+    with stats.phase('stream'):
+        for event in parser.events():
+            kind, node = event[0], event[1]
+            if kind == 'open':
+                fix.open(node)
+            elif kind == 'close':
+                fix.close(node)
+            elif kind == 'delete':
+                fix.delete(node)
+            fix.flush()
+        fix.finish()
+    stats.bytes_read += parser.bytes_read
+    stats.bytes_written += fix.written
+    stats.nodes += fix.nodes
+    stats.unit_nodes += fix.unit_nodes
+    # process_file() stops before the check when there are no unit nodes
+    unresolved = [mm for _, mm in sorted(fix.unresolved, key=lambda u: u[0])] if fix.unit_nodes else []
+    change_lines = fix.change_lines()
+    stats.changes += len(change_lines)
+    stats.unresolved += len(unresolved)
+    try:
+        if not fix.planned:
+            writer.text(f"{name}: no modifications needed\n")
+            _report_file(writer, name, stats, t0, False, True, 'no-change', unresolved=unresolved)
+            return FixResult(False, 'no-change', stats=stats)
+        report_entries = [f"{name}: modified {len(fix.planned)} nodes"]
+        for c, line in change_lines:
+            report_entries.append(f"  node {c[1]} (line {line}): {c[2]} -> {c[3]}")
+        for mm in unresolved:
+            report_entries.append(f"  node {mm.path}: unresolved reg_format ({mm.reg_cells} cells, "
+                                  f"#address-cells == {mm.address_cells}, #size-cells == {mm.size_cells})")
+        if fix.late_deletes:
+            report_entries.append(f"  warning: {fix.late_deletes} fixed nodes were deleted later by /delete-node/")
+        report_text = '\n'.join(report_entries) + '\n'
+        writer.text(report_text)
+        _report_file(writer, name, stats, t0, True, True, 'proposed', None, change_lines, unresolved)
+        if verbose:
+            print(report_text, file=sys.stderr)
+        return FixResult(True, report_text, stats=stats)
+    finally:
+        if writer is not report:
+            writer.flush()
+
+
+def parse_reg_format_warnings(out):
+    """Return (nodepath, expected_cells) tuples from dtc output."""
+    return dtc_diag.reg_format(dtc_diag.parse(out))
+
+
+def run_dtc(dts_path, dtc_inc=None, cache=None, content=None, stats=None):
+    """Run dtc on dts_path and return a record dict with 'rc', 'output',
+    'reg_format' (list of [nodepath, expected_cells]) and 'diagnostics'
+    (dtc_diag.Diagnostic dicts, parsed from stderr while dtc runs; dtc is
+    stopped at the first fatal error). When content is given
+    it is fed to dtc on stdin instead of reading dts_path, and the file's
+    directory is added to the include path so /include/ still resolves.
+    When a DtcCache is given, an unchanged input (including its /include/
+    files) is answered from the cache without running dtc. Each run (or cache hit) is recorded on stats when
+    given. Returns None when dtc is not installed."""
+    dtc_ver = dtc_cache.dtc_version()
+    if not dtc_ver:
+        return None
+    key = None
+    if cache is not None:
+        try:
+            data = content if content is not None else Path(dts_path).read_bytes()
+            deps = dtc_cache.include_deps(data, Path(dts_path).resolve().parent, dtc_cache.include_dirs(dtc_inc))
+            key = cache.key(data, dtc_ver, dtc_inc, deps)
+        except OSError:
+            key = None
+        record = cache.get(key) if key else None
+        if record is not None:
+            if stats is not None:
+                stats.add_dtc_run(0.0, record['rc'], cached=True)
+            return record
     cmd = ['dtc', '-@', '-I', 'dts', '-O', 'dtb', '-o', '/dev/null']
     if dtc_inc:
         try:
@@ -391,58 +874,209 @@ def run_dtc_and_get_reg_format_warnings(dts_path, dtc_inc=None):
         except Exception:
             # fallback: pass as a single token
             cmd.append(dtc_inc)
-    cmd.append(dts_path)
+    if content is not None:
+        cmd += ['-i', str(Path(dts_path).resolve().parent), '-']
+    else:
+        cmd.append(dts_path)
+    t0 = time.perf_counter()
     try:
-        p = subprocess.run(cmd, capture_output=True, text=True)
+        result = dtc_diag.run(cmd, content)
     except Exception as e:
-        return [], str(e)
-    out = (p.stdout or '') + '\n' + (p.stderr or '')
-    # parse reg_format messages
-    reg_fmt_re = re.compile(r"Warning \(reg_format\):\s+([^:]+):reg: property has invalid length .*?\(#address-cells == (\d+)", flags=re.S)
-    matches = reg_fmt_re.findall(out)
-    results = []
-    for nodepath, addr_cells in matches:
-        nodepath = nodepath.strip()
-        try:
-            expected = int(addr_cells)
-        except Exception:
-            expected = None
-        if expected:
-            results.append((nodepath, expected))
-    return results, out
+        if stats is not None:
+            stats.add_dtc_run(time.perf_counter() - t0, 1)
+        return {'rc': 1, 'output': str(e), 'reg_format': [], 'diagnostics': []}
+    if stats is not None:
+        stats.add_dtc_run(time.perf_counter() - t0, result.rc)
+    record = {'rc': result.rc, 'output': result.output,
+              'reg_format': [list(r) for r in dtc_diag.reg_format(result.diagnostics)],
+              'diagnostics': [d.to_dict() for d in result.diagnostics]}
+    if key:
+        cache.put(key, record)
+    return record
 
 
-def run_dtc_compile(dts_path, dtc_inc=None):
+def run_dtc_and_get_reg_format_warnings(dts_path, dtc_inc=None, cache=None):
+    """Run dtc on dts_path and return list of (nodepath, expected_cells) tuples
+    extracted from 'Warning (reg_format)' messages. Returns (list, dtc_output).
+    """
+    record = run_dtc(dts_path, dtc_inc, cache)
+    if record is None:
+        return [], ''
+    return [tuple(r) for r in record['reg_format']], record['output']
+
+
+def run_dtc_compile(dts_path, dtc_inc=None, cache=None):
     """Run dtc to compile dts_path and return (returncode, combined_output)"""
-    if shutil.which('dtc') is None:
+    record = run_dtc(dts_path, dtc_inc, cache)
+    if record is None:
         return 127, 'dtc not found'
-    cmd = ['dtc', '-@', '-I', 'dts', '-O', 'dtb', '-o', '/dev/null']
-    if dtc_inc:
-        try:
-            cmd += shlex.split(dtc_inc)
-        except Exception:
-            cmd.append(dtc_inc)
-    cmd.append(dts_path)
+    return record['rc'], record['output']
+
+
+def collect_dts_files(files=(), dirs=()):
+    """Return the DTS files named directly plus every *.dts in dirs, in a
+    stable order and without duplicates or generated .fixed.dts files."""
+    paths = list(files)
+    for d in dirs:
+        paths.extend(str(f) for f in sorted(Path(d).glob('*.dts')) if not f.name.endswith('.fixed.dts'))
+    return list(dict.fromkeys(paths))
+
+
+def _process_one(path, options, fmt='text'):
+    """Batch worker: run process_file() on one path and return a plain dict
+    so that failures never escape the worker. The report chunks (in the
+    run's report format) are returned for the parent to write."""
+    report = dts_report.ReportWriter(None, fmt)
+    stats = dts_stats.FixStats()
+    cache = options.get('cache')
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
     try:
-        p = subprocess.run(cmd, capture_output=True, text=True)
-    except Exception as e:
-        return 1, str(e)
-    out = (p.stdout or '') + '\n' + (p.stderr or '')
-    return p.returncode, out
+        result = process_file(path, report=report, stats=stats, **options)
+        out = {'file': path, 'changed': result[0], 'summary': result[1],
+               'ok': getattr(result, 'ok', True), 'error': None}
+    except (Exception, SystemExit) as e:
+        msg = f"{type(e).__name__}: {e}"
+        report.text(f"{Path(path).name}: auto-fix failed ({msg})\n")
+        report.record({'type': 'file', 'file': path, 'status': 'error', 'changed': False, 'ok': False,
+                       'applied': False, 'error': msg})
+        out = {'file': path, 'changed': False, 'summary': msg, 'ok': False, 'error': msg}
+    out['report'] = report.entries
+    out['stats'] = stats.to_dict()
+    if cache is not None:
+        out['cache'] = {'hits': cache.hits - hits, 'misses': cache.misses - misses}
+    return out
+
+
+def process_files(paths, jobs=None, report=None, **options):
+    """Run process_file() over paths with up to jobs worker processes.
+    Returns one result dict per path (in input order). The per-file reports
+    are queued on report when it is a dts_report.ReportWriter, otherwise
+    appended to it in a single write."""
+    paths = list(paths)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(paths) or 1))
+    fmt = report.fmt if isinstance(report, dts_report.ReportWriter) else 'text'
+    if jobs == 1:
+        results = [_process_one(path, options, fmt) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_process_one, paths, [options] * len(paths), [fmt] * len(paths)))
+        cache = options.get('cache')
+        if cache is not None:
+            # workers counted on their own copies of the cache object
+            cache.hits += sum(r['cache']['hits'] for r in results)
+            cache.misses += sum(r['cache']['misses'] for r in results)
+    if isinstance(report, dts_report.ReportWriter):
+        for r in results:
+            report.extend(r['report'])
+    else:
+        merged = ''.join(''.join(r['report']) for r in results)
+        if merged:
+            report_append(report, merged)
+    return results
+
+
+def timings_record(stats, wall, cpu, files=None, profiler=None, top=25):
+    """JSON-serializable --timings record for stats (a FixStats), with the
+    per-file stats dicts and the top cProfile entries when available."""
+    record = {'wall': wall, 'cpu': cpu}
+    record.update(stats.to_dict())
+    if files is not None:
+        record['files'] = files
+    if profiler is not None:
+        ps = pstats.Stats(profiler, stream=io.StringIO())
+        hot = sorted(ps.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:top]
+        record['profile'] = [{'function': f"{fn[0]}:{fn[1]}({fn[2]})", 'calls': nc, 'tottime': tt, 'cumtime': ct}
+                             for fn, (cc, nc, tt, ct, callers) in hot]
+    return record
+
+
+def run(args, cache, stats, files, report=None):
+    """Process the files named in args; returns the exit status."""
+    cpp_cache = None if cache is None else dts_preprocess.PreprocessCache(cache.root / 'cpp')
+    options = dict(apply=args.apply, backup=args.backup, verbose=args.verbose, dtc_inc=args.dtc_inc, cache=cache,
+                   cpp_inc=args.cpp_include, cpp_cache=cpp_cache, deps_dir=args.deps_dir)
+    if args.stream is not None:
+        if args.stream == '-':
+            changed, summary = process_stream(sys.stdin, sys.stdout, report=report, verbose=args.verbose, stats=stats)
+        else:
+            with open(args.stream) as fh:
+                changed, summary = process_stream(fh, sys.stdout, Path(args.stream).name, report, args.verbose, stats)
+        sys.stdout.flush()
+        files[args.stream] = stats.to_dict()
+        # stdout carries the DTS
+        print(f"{'Fixed' if changed else 'No changes made to'} {args.stream} ({summary.splitlines()[0]})", file=sys.stderr)
+        return 0
+
+    if len(args.file) == 1 and not args.dir:
+        path = args.file[0]
+        changed, summary = process_file(path, report=report, stats=stats, **options)
+        files[path] = stats.to_dict()
+        if cache is not None:
+            cache.evict()
+            cpp_cache.store.evict()
+            if args.verbose:
+                print(f"dtc cache: {cache.hits} hits, {cache.misses} misses")
+        if changed:
+            if args.apply:
+                print(f"Applied modifications to {path}")
+            else:
+                print(f"Proposed modifications for {path} written to {Path(path).with_suffix('.fixed.dts')} (use --apply to commit)")
+        else:
+            print(f"No changes made to {path} ({summary})")
+        return 0
+
+    paths = collect_dts_files(args.file, args.dir)
+    if not paths:
+        print("No DTS files found")
+        return 1
+    # the profiler only sees this process
+    jobs = 1 if args.profile else args.jobs
+    results = process_files(paths, jobs=jobs, report=report, **options)
+    if cache is not None:
+        cache.evict()
+        cpp_cache.store.evict()
+        print(f"dtc cache: {cache.hits} hits, {cache.misses} misses")
+    failed = 0
+    for r in results:
+        stats.merge(r['stats'])
+        files[r['file']] = r['stats']
+        if not r['ok']:
+            failed += 1
+            print(f"FAILED {r['file']}: {r['error'] or r['summary'].strip()}")
+        elif r['changed']:
+            print(f"{'Applied' if args.apply else 'Proposed'} modifications for {r['file']}")
+        else:
+            print(f"No changes made to {r['file']} ({r['summary']})")
+    print(f"{len(results)} files processed, {failed} failed")
+    return 1 if failed else 0
 
 
 def main():
     args = parse_args()
-    changed, summary = process_file(args.file, apply=args.apply, backup=args.backup, report=args.report, verbose=args.verbose, dtc_inc=args.dtc_inc)
-    if changed:
-        if args.apply:
-            print(f"Applied modifications to {args.file}")
+    cache = None if args.no_cache else dtc_cache.DtcCache(args.cache_dir)
+    # one buffered writer for the whole run; written when the run ends
+    report = dts_report.ReportWriter(args.report, args.report_format)
+    stats = dts_stats.FixStats()
+    files = {}
+    profiler = cProfile.Profile() if args.profile else None
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        status = run(args, cache, stats, files, report)
+    finally:
+        report.flush()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    if args.timings or profiler is not None:
+        record = timings_record(stats, time.perf_counter() - wall, time.process_time() - cpu, files, profiler)
+        text = json.dumps(record, indent=2, sort_keys=True) + '\n'
+        if args.timings in (None, '-'):
+            (sys.stderr if args.stream is not None else sys.stdout).write(text)
         else:
-            print(f"Proposed modifications for {args.file} written to {args.file}.fixed.dts (use --apply to commit)")
-        sys.exit(0)
-    else:
-        print(f"No changes made to {args.file} ({summary})")
-        sys.exit(0)
+            Path(args.timings).write_text(text)
+    sys.exit(status)
 
 
 if __name__ == '__main__':
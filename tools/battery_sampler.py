@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+battery_sampler.py
+
+Low-overhead AXP221 battery telemetry for the uConsole CM5.
+
+The power_supply attributes (status, capacity, voltage_now, ...) are opened
+once and kept open; every sample re-reads each one with os.pread() at
+offset 0, which makes sysfs regenerate the value without a fork of cat or
+i2cget, a path lookup or an open/close per value. All attributes are read
+back to back into one Sample so the values belong together.
+
+Samples go into a fixed-size ring buffer. The polling interval adapts:
+
+- discharging at or below CRIT_PERCENT + MARGIN: FAST_INTERVAL
+- discharging at or below WARN_PERCENT + MARGIN: NEAR_INTERVAL
+- level or status changed since the previous sample: NORMAL_INTERVAL
+- otherwise (or while capacity cannot be read) the interval doubles, up
+  to SLOW_INTERVAL
+
+The Sampler's query API (latest, window, values, average, rate,
+time_to_empty, state) answers from the ring without touching sysfs.
+
+Usage: battery_sampler.py [--sysfs-root DIR] [--once | --count N]
+                          [--interval SECONDS] [--size N] [--json]
+
+Exit status: 0 on success, 1 if the battery attributes cannot be opened.
+"""
+import argparse
+import errno
+import json
+import os
+import sys
+import time
+
+
+DEFAULT_ROOT = '/sys/class/power_supply/axp20x-battery'
+ATTRS = ('status', 'capacity', 'voltage_now', 'current_now', 'online', 'present', 'health', 'temp')
+TEXT_ATTRS = ('status', 'health')
+READ_SIZE = 64
+
+# Same thresholds as overlay/usr/local/sbin/uconsole-power-monitor.sh
+WARN_PERCENT = 15
+CRIT_PERCENT = 8
+CRIT_VOLT_UV = 3550000
+MARGIN = 2
+
+FAST_INTERVAL = 2
+NEAR_INTERVAL = 10
+NORMAL_INTERVAL = 30
+SLOW_INTERVAL = 120
+RING_SIZE = 512
+
+
+class Sample:
+    """One batched read of all attributes; missing or unreadable ones are None."""
+    __slots__ = ('time', 'values')
+
+    def __init__(self, time, values):
+        self.time = time
+        self.values = values
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def as_dict(self):
+        return dict(self.values, time=self.time)
+
+
+class Ring:
+    """Fixed-size ring buffer; iterates oldest first."""
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError('ring size must be at least 1')
+        self.size = size
+        self._items = [None] * size
+        self._next = 0
+        self._count = 0
+
+    def append(self, item):
+        self._items[self._next] = item
+        self._next = (self._next + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        start = (self._next - self._count) % self.size
+        for i in range(self._count):
+            yield self._items[(start + i) % self.size]
+
+    def latest(self):
+        return self._items[self._next - 1] if self._count else None
+
+
+def parse_value(name, raw):
+    text = raw.decode('ascii', 'replace').strip()
+    if name in TEXT_ATTRS:
+        return text or None
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+class Sampler:
+    def __init__(self, root=DEFAULT_ROOT, attrs=ATTRS, size=RING_SIZE, clock=time.monotonic):
+        self.root = str(root)
+        self.attrs = tuple(attrs)
+        self.ring = Ring(size)
+        self.clock = clock
+        self.interval = NORMAL_INTERVAL
+        self._fds = {}
+
+    def open(self):
+        """Open every attribute present under root; returns how many are open."""
+        for name in self.attrs:
+            if name not in self._fds:
+                self._open(name)
+        return len(self._fds)
+
+    def _open(self, name):
+        try:
+            self._fds[name] = os.open(os.path.join(self.root, name), os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+        except OSError:
+            return None
+        return self._fds[name]
+
+    def close(self):
+        for fd in self._fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds.clear()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, name):
+        fd = self._fds.get(name)
+        if fd is None:
+            return None
+        try:
+            return parse_value(name, os.pread(fd, READ_SIZE, 0))
+        except OSError as e:
+            if e.errno == errno.ENODATA:
+                # The driver has no value right now (e.g. no battery ADC reading yet)
+                return None
+        # The device went away (driver rebind): reopen once
+        try:
+            os.close(self._fds.pop(name))
+        except OSError:
+            pass
+        fd = self._open(name)
+        if fd is None:
+            return None
+        try:
+            return parse_value(name, os.pread(fd, READ_SIZE, 0))
+        except OSError:
+            return None
+
+    def sample(self):
+        if not self._fds:
+            self.open()
+        sample = Sample(self.clock(), {name: self._read(name) for name in self.attrs})
+        previous = self.ring.latest()
+        self.ring.append(sample)
+        self.interval = self.next_interval(sample, previous)
+        return sample
+
+    def next_interval(self, sample, previous=None):
+        capacity = sample.values.get('capacity')
+        if capacity is None:
+            # no reading (gauge not ready or gone): back off instead of polling it hard
+            return min(self.interval * 2, SLOW_INTERVAL)
+        if sample.values.get('status') == 'Discharging':
+            if capacity <= CRIT_PERCENT + MARGIN:
+                return FAST_INTERVAL
+            if capacity <= WARN_PERCENT + MARGIN:
+                return NEAR_INTERVAL
+        if previous is None or (previous.values.get('capacity'), previous.values.get('status')) != \
+                (capacity, sample.values.get('status')):
+            return NORMAL_INTERVAL
+        return min(max(self.interval, NORMAL_INTERVAL) * 2, SLOW_INTERVAL)
+
+    # Query API; everything below reads only the ring buffer
+
+    def latest(self):
+        return self.ring.latest()
+
+    def window(self, seconds=None):
+        """Samples from the last `seconds` (all samples if None), oldest first."""
+        samples = list(self.ring)
+        if seconds is None or not samples:
+            return samples
+        since = samples[-1].time - seconds
+        return [s for s in samples if s.time >= since]
+
+    def values(self, attr, seconds=None):
+        return [(s.time, s.values[attr]) for s in self.window(seconds) if s.values.get(attr) is not None]
+
+    def average(self, attr, seconds=None):
+        points = self.values(attr, seconds)
+        if not points:
+            return None
+        return sum(v for _, v in points) / len(points)
+
+    def rate(self, attr, seconds=None):
+        """Change of attr per second over the window (least squares), or None."""
+        points = self.values(attr, seconds)
+        if len(points) < 2:
+            return None
+        n = len(points)
+        mean_t = sum(t for t, _ in points) / n
+        mean_v = sum(v for _, v in points) / n
+        var = sum((t - mean_t) ** 2 for t, _ in points)
+        if not var:
+            return None
+        return sum((t - mean_t) * (v - mean_v) for t, v in points) / var
+
+    def time_to_empty(self, seconds=None):
+        """Seconds until capacity reaches CRIT_PERCENT at the current rate, or
+        None when not discharging or the rate is unknown."""
+        sample = self.latest()
+        rate = self.rate('capacity', seconds)
+        if sample is None or sample.values.get('capacity') is None or not rate or rate >= 0:
+            return None
+        return max(0.0, (sample.values['capacity'] - CRIT_PERCENT) / -rate)
+
+    def state(self):
+        """'unknown', 'ok', 'low' or 'critical' as uconsole-power-monitor judges it."""
+        sample = self.latest()
+        if sample is None or sample.values.get('capacity') is None:
+            return 'unknown'
+        if sample.values.get('status') != 'Discharging':
+            return 'ok'
+        voltage = sample.values.get('voltage_now')
+        if sample.values['capacity'] <= CRIT_PERCENT or (voltage is not None and voltage < CRIT_VOLT_UV):
+            return 'critical'
+        if sample.values['capacity'] <= WARN_PERCENT:
+            return 'low'
+        return 'ok'
+
+
+def format_sample(sample, state, interval):
+    v = sample.values
+    voltage = f"{v['voltage_now'] // 1000} mV" if v.get('voltage_now') is not None else '? mV'
+    current = f"{v['current_now'] // 1000} mA" if v.get('current_now') is not None else '? mA'
+    capacity = f"{v['capacity']}%" if v.get('capacity') is not None else '?%'
+    return f"{v.get('status') or 'Unknown'} {capacity} {voltage} {current} [{state}, next in {interval}s]"
+
+
+def run(sampler, count=None, fixed=None, out=sys.stdout, as_json=False, sleep=time.sleep):
+    n = 0
+    while count is None or n < count:
+        sample = sampler.sample()
+        interval = fixed or sampler.interval
+        if as_json:
+            out.write(json.dumps(dict(sample.as_dict(), state=sampler.state(), next=interval), sort_keys=True) + '\n')
+        else:
+            out.write(format_sample(sample, sampler.state(), interval) + '\n')
+        out.flush()
+        n += 1
+        if count is None or n < count:
+            sleep(interval)
+    return n
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description='Sample AXP221 battery telemetry from sysfs with kept-open handles')
+    ap.add_argument('--sysfs-root', default=os.environ.get('BATTERY_SYSFS_ROOT', DEFAULT_ROOT),
+                    help=f"power_supply directory (default {DEFAULT_ROOT})")
+    ap.add_argument('--once', action='store_true', help='take one sample and exit')
+    ap.add_argument('--count', type=int, help='stop after N samples (default: run forever)')
+    ap.add_argument('--interval', type=float, help='fixed polling interval instead of the adaptive one')
+    ap.add_argument('--size', type=int, default=RING_SIZE, help=f"ring buffer size (default {RING_SIZE})")
+    ap.add_argument('--json', action='store_true', help='print one JSON object per sample')
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sampler = Sampler(args.sysfs_root, size=args.size)
+    if not sampler.open():
+        print(f"Error: no battery attributes under {args.sysfs_root}", file=sys.stderr)
+        return 1
+    try:
+        run(sampler, 1 if args.once else args.count, args.interval, as_json=args.json)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
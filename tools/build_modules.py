@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+build_modules.py
+
+Parallel, cached build of the out-of-tree drivers in extracted-drivers/.
+
+This replaces the build.sh loop install_uconsole_offline.sh ran inside the
+qemu-aarch64 chroot, which built one driver directory after the other.
+Every directory with a Makefile is built with
+`make -C <kernel build dir> M=<dir> modules`, --jobs directories at a time
+(inside --root with chroot(8) when given, so only make runs under
+emulation).
+
+Built .ko files are cached (by default in ~/.cache/uconsole-modules, or
+$UCONSOLE_MODULE_CACHE) under a key made of:
+
+- the sha256 of every source file in the driver directory (which covers
+  the patches applied to it)
+- the patches recorded for that directory by patch_engine.py
+- the kernel build directory, the kernel version and the kernel's .config,
+  Module.symvers and release string
+- the make command line
+
+With --root, paths (including symlinks such as lib/modules/<kver>/build ->
+/usr/src/linux-<kver>-obj/...) are resolved inside the root, as chroot
+would. A directory whose key is cached is not built again; its modules are
+copied from the cache. When none of the kernel files can be found the
+kernel cannot be told apart from another one, so the cache is not used.
+Each build's output is kept in <out-dir>/logs/ and the per-module timings
+in <out-dir>/build-modules.json.
+
+Usage: build_modules.py [--drivers-dir extracted-drivers] [--out-dir DIR]
+                        [--kernel-dir DIR | --kver VER] [--root DIR]
+                        [--jobs N] [--make-jobs N] [--make make] [--force]
+"""
+import argparse
+import errno
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from tools import file_hash, patch_engine
+except ImportError:  # executed as a script from tools/
+    import file_hash
+    import patch_engine
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_DRIVERS_DIR = REPO_ROOT / 'extracted-drivers'
+REPORT_NAME = 'build-modules.json'
+# files of a kernel build tree that decide whether a module still fits it
+KERNEL_FILES = ('.config', 'Module.symvers', 'include/config/kernel.release', 'include/generated/utsrelease.h')
+# kbuild output that must not change a driver's key
+BUILD_SUFFIXES = ('.o', '.ko', '.mod', '.mod.c', '.cmd', '.a', '.order', '.symvers', '.log', '.d', '.tmp')
+
+
+def default_cache_dir():
+    env = os.environ.get('UCONSOLE_MODULE_CACHE')
+    if env:
+        return Path(env)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'uconsole-modules'
+
+
+def detect_kver(root='/'):
+    """Kernel version of the first linux-* headers in <root>/usr/src (as the
+    old build.sh did), or None."""
+    try:
+        names = sorted(os.listdir(os.path.join(root, 'usr/src')))
+    except OSError:
+        return None
+    for name in names:
+        if name.startswith('linux-') and 'obj' not in name:
+            return name[len('linux-'):]
+    return None
+
+
+def driver_dirs(drivers_dir):
+    """Driver directories (those with a Makefile), sorted by name."""
+    try:
+        entries = sorted(Path(drivers_dir).iterdir())
+    except OSError:
+        return []
+    return [d for d in entries if d.is_dir() and (d / 'Makefile').is_file()]
+
+
+def source_files(d):
+    """Source files of a driver directory, relative and sorted; hidden files
+    and kbuild output are left out."""
+    out = []
+    for dirpath, dirnames, filenames in os.walk(d):
+        dirnames[:] = sorted(n for n in dirnames if not n.startswith('.'))
+        for name in filenames:
+            if name.startswith('.') or name.endswith(BUILD_SUFFIXES) or name == 'modules.order':
+                continue
+            out.append(os.path.relpath(os.path.join(dirpath, name), d))
+    return sorted(out)
+
+
+def _digest(items):
+    h = hashlib.sha256()
+    for item in items:
+        h.update(json.dumps(item, sort_keys=True).encode() + b'\n')
+    return h.hexdigest()
+
+
+def resolve_in_root(root, path, max_links=40):
+    """Host path of path inside root, following symlinks the way they
+    resolve after chroot(root): absolute link targets are relative to root
+    and '..' never leaves it."""
+    root = Path(root)
+    todo = [p for p in str(path).split('/') if p][::-1]
+    parts = []
+    links = 0
+    while todo:
+        part = todo.pop()
+        if part == '.':
+            continue
+        if part == '..':
+            if parts:
+                parts.pop()
+            continue
+        host = root.joinpath(*parts, part)
+        if not host.is_symlink():
+            parts.append(part)
+            continue
+        links += 1
+        if links > max_links:
+            raise OSError(errno.ELOOP, f"too many symlinks resolving {path} in {root}")
+        target = os.readlink(host)
+        if target.startswith('/'):
+            parts = []
+        todo.extend([p for p in target.split('/') if p][::-1])
+    return root.joinpath(*parts)
+
+
+def kernel_identity(kernel_dir, hasher):
+    """Digest of the kernel tree files in KERNEL_FILES that exist, or None
+    if there are none."""
+    items = []
+    for name in KERNEL_FILES:
+        entry = hasher.entry(Path(kernel_dir) / name)
+        if entry is not None:
+            items.append([name, entry['sha256']])
+    return _digest(items) if items else None
+
+
+def applied_patches(state, name):
+    """[[patch, sha], ...] patch_engine recorded for files of driver name."""
+    out = []
+    for target, record in sorted(state.get('targets', {}).items()):
+        if f"/{name}/" in f"/{target}":
+            out.extend(record['patches'])
+    return out
+
+
+def driver_key(d, kernel_id, patches, make_cmd, hasher):
+    files = []
+    for rel in source_files(d):
+        entry = hasher.entry(Path(d) / rel)
+        if entry is not None:
+            files.append([rel, entry['sha256']])
+    return _digest([d.name, files, patches, kernel_id, make_cmd])
+
+
+class Builder:
+    """Builds driver directories into out_dir, reusing cached modules. With
+    root, kernel_dir, out_dir and the driver directories are paths inside
+    root. kver, when known, is part of the cache key."""
+
+    def __init__(self, kernel_dir, out_dir, cache_dir=None, make='make', make_jobs=1, root=None, force=False,
+                 kver=None):
+        self.root = Path(root) if root else None
+        self.kernel_dir = str(kernel_dir)
+        self.kver = kver
+        self.kernel_id = None
+        self.out_dir = self.host(out_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.make_cmd = shlex.split(make) + ([f"-j{make_jobs}"] if make_jobs > 1 else [])
+        self.force = force
+        self.hasher = file_hash.Hasher()
+
+    def host(self, path):
+        """Host path of a path inside --root (see resolve_in_root)."""
+        return resolve_in_root(self.root, path) if self.root else Path(path)
+
+    def command(self, d):
+        cmd = self.make_cmd + ['-C', self.kernel_dir, f"M={d}", 'modules']
+        return ['chroot', str(self.root)] + cmd if self.root else cmd
+
+    def build_one(self, d, key):
+        """Build (or fetch from the cache) one driver directory (a path
+        inside --root). A key of None builds without the cache. Returns a
+        result record."""
+        src = self.host(d)
+        name = src.name
+        t0 = time.perf_counter()
+        cached = self.cache_dir / key if key else None
+        log_path = self.out_dir / 'logs' / f"{name}.log"
+        record = {'name': name, 'key': key, 'log': str(log_path)}
+        meta = cached / 'build.json' if cached else None
+        if meta is not None and meta.is_file() and not self.force:
+            info = json.loads(meta.read_text())
+            for ko in info['modules']:
+                shutil.copyfile(cached / ko, self.out_dir / ko)
+            shutil.copyfile(cached / 'build.log', log_path)
+            record.update(status='cached', modules=info['modules'], build_seconds=info['seconds'],
+                          seconds=time.perf_counter() - t0)
+            return record
+        for stale in src.glob('*.ko'):
+            stale.unlink()
+        with open(log_path, 'wb') as log:
+            log.write(f"$ {shlex.join(self.command(d))}\n".encode())
+            log.flush()
+            try:
+                rc = subprocess.run(self.command(d), stdout=log, stderr=subprocess.STDOUT).returncode
+            except OSError as e:
+                log.write(f"{e}\n".encode())
+                rc = 127
+        seconds = time.perf_counter() - t0
+        modules = sorted(p.name for p in src.glob('*.ko'))
+        if rc != 0 or not modules:
+            record.update(status='failed', modules=[], seconds=seconds,
+                          message=f"make exited with {rc}" if rc else 'no .ko produced')
+            return record
+        if cached is None:
+            for ko in modules:
+                shutil.copyfile(src / ko, self.out_dir / ko)
+            record.update(status='built', modules=modules, seconds=seconds)
+            return record
+        tmp = self.cache_dir / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for ko in modules:
+            shutil.copyfile(src / ko, tmp / ko)
+            shutil.copyfile(src / ko, self.out_dir / ko)
+        shutil.copyfile(log_path, tmp / 'build.log')
+        (tmp / 'build.json').write_text(json.dumps({'name': name, 'modules': modules, 'seconds': seconds},
+                                                   sort_keys=True) + '\n')
+        shutil.rmtree(cached, ignore_errors=True)
+        try:
+            os.replace(tmp, cached)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # a concurrent run stored it first
+        record.update(status='built', modules=modules, seconds=seconds)
+        return record
+
+    def keys(self, drivers_dir, patch_state=None):
+        """(driver directory inside --root, cache key) for every driver
+        below drivers_dir. The keys are None when no kernel file was found."""
+        host_dir = self.host(drivers_dir)
+        state = patch_engine.load_state(patch_state or host_dir / patch_engine.STATE_NAME)
+        self.kernel_id = kernel_identity(self.host(self.kernel_dir), self.hasher)
+        kernel = [self.kernel_dir, self.kver, self.kernel_id]
+        todo = []
+        for src in driver_dirs(host_dir):
+            key = None
+            if self.kernel_id is not None:
+                key = driver_key(src, kernel, applied_patches(state, src.name), self.make_cmd, self.hasher)
+            todo.append((f"{str(drivers_dir).rstrip('/')}/{src.name}", key))
+        return todo
+
+    def build(self, drivers_dir, jobs=None, patch_state=None):
+        """Build every driver directory below drivers_dir (a path inside
+        --root). Returns the result records in name order and writes them to
+        <out-dir>/build-modules.json."""
+        wall = time.perf_counter()
+        (self.out_dir / 'logs').mkdir(parents=True, exist_ok=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        todo = self.keys(drivers_dir, patch_state)
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(todo) or 1))
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(lambda item: self.build_one(*item), todo))
+        report = {'kernel_dir': self.kernel_dir, 'kver': self.kver, 'kernel': self.kernel_id, 'jobs': jobs,
+                  'seconds': time.perf_counter() - wall, 'modules': results}
+        file_hash.write_manifest(self.out_dir / REPORT_NAME, report)
+        return results
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Build the out-of-tree driver modules in parallel with a cache')
+    p.add_argument('--drivers-dir', default=str(DEFAULT_DRIVERS_DIR), help='Directory with one subdirectory per driver')
+    p.add_argument('--out-dir', default=None, help='Where to put the .ko files (default: <drivers-dir>/../built-modules)')
+    p.add_argument('--kernel-dir', default=None, help='Kernel build tree (default: /lib/modules/<kver>/build)')
+    p.add_argument('--kver', default=None, help='Kernel version (default: detected from <root>/usr/src)')
+    p.add_argument('--root', default=None, help='Build inside this root with chroot (paths are inside the root)')
+    p.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Driver directories built at once')
+    p.add_argument('--make-jobs', type=int, default=1, help='make -j for each driver build')
+    p.add_argument('--make', default='make', help='make command')
+    p.add_argument('--cache-dir', default=None, help='Module cache (default: ~/.cache/uconsole-modules)')
+    p.add_argument('--patch-state', default=None, help=f"patch_engine state (default: <drivers-dir>/{patch_engine.STATE_NAME})")
+    p.add_argument('--force', action='store_true', help='Rebuild every driver')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    kernel_dir = args.kernel_dir
+    kver = args.kver
+    if kernel_dir is None:
+        kver = kver or detect_kver(args.root or '/')
+        if not kver:
+            print(f"Could not detect kernel headers in {os.path.join(args.root or '/', 'usr/src')}", file=sys.stderr)
+            return 2
+        kernel_dir = f"/lib/modules/{kver}/build"
+    out_dir = args.out_dir or str(Path(args.drivers_dir).parent / 'built-modules')
+    builder = Builder(kernel_dir, out_dir, args.cache_dir, args.make, args.make_jobs, args.root, args.force, kver)
+    print(f"Building modules against {kernel_dir}")
+    results = builder.build(args.drivers_dir, args.jobs, args.patch_state)
+    if results and builder.kernel_id is None:
+        print(f"Warning: none of {', '.join(KERNEL_FILES)} found in {builder.host(kernel_dir)}; "
+              'built without the module cache', file=sys.stderr)
+    if not results:
+        print(f"No driver directories found in {args.drivers_dir}")
+        return 1
+    for r in sorted(results, key=lambda r: -r['seconds']):
+        line = f"{r['name']:<20} {r['status']:<7} {r['seconds']:7.2f}s  {' '.join(r['modules'])}"
+        if r['status'] == 'cached':
+            line += f"  (built in {r['build_seconds']:.2f}s)"
+        elif r['status'] == 'failed':
+            line += f"  ({r['message']}, see {r['log']})"
+        print(line)
+    counts = {s: sum(r['status'] == s for r in results) for s in ('built', 'cached', 'failed')}
+    print(f"{counts['built']} built, {counts['cached']} cached, {counts['failed']} failed")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
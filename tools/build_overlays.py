@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+build_overlays.py
+
+Parallel, incremental build of every overlays/*.dts into a .dtbo.
+
+This is the batch counterpart of scripts/build_overlay.sh: overlays that
+use #include go through the same cpp step (see dts_preprocess.py) and all
+of them are compiled with `dtc -@ -I dts -O dtb`. Targets are built
+concurrently (--jobs) and recorded in a manifest (JSON, by default
+<out-dir>/dtbo-manifest.json) with:
+
+- the sha256 of the source and of every header or /include/ file it uses
+- the cpp include path (-I) for overlays that need cpp
+- the dtc flags and the identity of the dtc binary
+- the sha256 and size of the produced .dtbo
+
+A target whose source hash, include set, include path, flags and output
+all match the manifest is skipped. Files are only rehashed when their size
+or mtime differs from the manifest, so a no-op rebuild only stats files.
+The output sha256 is computed while dtc's output is streamed to disk, and
+every .dtbo is written to a temporary file and renamed into place.
+
+Usage: build_overlays.py [--src-dir overlays] [--out-dir DIR] [--jobs N]
+                         [--force] [--dtc-flags "..."] [-I DIR ...]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from tools import dtc_cache, dts_parser, dts_preprocess, file_hash
+except ImportError:  # executed as a script from tools/
+    import dtc_cache
+    import dts_parser
+    import dts_preprocess
+    import file_hash
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SRC_DIR = REPO_ROOT / 'overlays'
+MANIFEST_NAME = 'dtbo-manifest.json'
+MANIFEST_VERSION = 2
+DTC_FLAGS = ['-@', '-I', 'dts', '-O', 'dtb']
+
+
+def load_manifest(path):
+    try:
+        manifest = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'targets': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'targets': {}}
+    return manifest
+
+
+def dtc_includes(source, text):
+    """Files pulled in with /include/ (resolved next to the source)."""
+    base = Path(source).resolve().parent
+    return sorted(str(base / inc) for inc in dts_parser.parse(text).includes
+                  if not inc.startswith('<') and (base / inc).exists())
+
+
+def up_to_date(target, source, out, flags, dtc_ver, hasher, cpp_inc=()):
+    """True if the manifest entry target still describes source and out."""
+    if not target or target.get('flags') != flags or target.get('dtc') != dtc_ver:
+        return False
+    # a different -I path can make #include <...> pick other headers
+    includes = target.get('includes')
+    if includes is not None and includes != dts_preprocess.include_dirs_for(source, cpp_inc):
+        return False
+    src = hasher.entry(source)
+    if src is None or src['sha256'] != target['source']['sha256']:
+        return False
+    for dep, sha in target['deps'].items():
+        entry = hasher.entry(dep)
+        if entry is None or entry['sha256'] != sha:
+            return False
+    entry = hasher.entry(out)
+    return entry is not None and entry['sha256'] == target['sha256']
+
+
+def run_dtc_streaming(cmd, out, content=None):
+    """Run dtc writing the blob to stdout and stream it into out (through a
+    temporary file), hashing as it goes. Returns (rc, stderr, sha256, size)."""
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if content is not None else subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = []
+    threads = [threading.Thread(target=lambda: errors.append(proc.stderr.read()))]
+    if content is not None:
+        def feed():
+            try:
+                proc.stdin.write(content.encode())
+                proc.stdin.close()
+            except OSError:
+                pass
+        threads.append(threading.Thread(target=feed))
+    for t in threads:
+        t.start()
+    tmp = Path(out).with_name(f".{Path(out).name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    h = hashlib.sha256()
+    size = 0
+    with open(tmp, 'wb') as fh:
+        for chunk in iter(lambda: proc.stdout.read(file_hash.CHUNK), b''):
+            h.update(chunk)
+            fh.write(chunk)
+            size += len(chunk)
+    rc = proc.wait()
+    for t in threads:
+        t.join()
+    if rc == 0:
+        os.replace(tmp, out)
+    else:
+        tmp.unlink()
+    return rc, b''.join(errors).decode(errors='replace'), h.hexdigest(), size
+
+
+def build_one(source, out, flags, cpp_inc=(), dtc_ver='', hasher=None):
+    """Compile one overlay. Returns (manifest entry or None, message)."""
+    hasher = hasher or file_hash.Hasher()
+    text = Path(source).read_text()
+    deps = dtc_includes(source, text)
+    content = None
+    includes = None
+    if dts_preprocess.needs_cpp(text):
+        includes = dts_preprocess.include_dirs_for(source, cpp_inc)
+        try:
+            pre = dts_preprocess.run_cpp(text, source, cpp_inc)
+        except RuntimeError as e:
+            return None, str(e)
+        content = pre.text
+        deps = sorted(set(deps) | set(pre.deps))
+    cmd = ['dtc'] + flags + ['-o', '-']
+    if content is not None:
+        cmd += ['-i', str(Path(source).resolve().parent), '-']
+    else:
+        cmd.append(str(source))
+    try:
+        rc, err, sha, size = run_dtc_streaming(cmd, out, content)
+    except OSError as e:
+        return None, f"dtc failed: {e}"
+    if rc != 0:
+        return None, f"dtc failed (rc={rc}): {err.strip()}"
+    target = {
+        'source': {'path': str(source), 'sha256': hasher.entry(source)['sha256']},
+        'deps': {dep: hasher.entry(dep)['sha256'] for dep in deps},
+        'includes': includes,
+        'flags': flags,
+        'dtc': dtc_ver,
+        'output': str(out),
+        'sha256': sha,
+        'size': size,
+    }
+    # the output was just hashed while streaming; remember it for next time
+    hasher.known[str(out)] = {'stamp': file_hash.stamp(out), 'sha256': sha}
+    return target, err.strip()
+
+
+def build(sources, out_dir, manifest_path=None, jobs=None, flags=None, cpp_inc=(), force=False):
+    """Build sources into out_dir. Returns a list of
+    (name, status, sha256 or None, message) with status built, up-to-date
+    or failed, in input order."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(manifest_path) if manifest_path else out_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    flags = list(DTC_FLAGS if flags is None else flags)
+    dtc_ver = dtc_cache.dtc_version()
+    hasher = file_hash.Hasher(manifest.get('files'))
+    targets = manifest['targets']
+
+    def one(source):
+        name = Path(source).stem
+        out = out_dir / f"{name}.dtbo"
+        if not force and up_to_date(targets.get(name), str(source), str(out), flags, dtc_ver, hasher, cpp_inc):
+            return name, 'up-to-date', targets[name]['sha256'], ''
+        target, msg = build_one(str(source), str(out), flags, cpp_inc, dtc_ver, hasher)
+        if target is None:
+            return name, 'failed', None, msg
+        targets[name] = target
+        return name, 'built', target['sha256'], msg
+
+    sources = list(sources)
+    if not dtc_ver:
+        return [(Path(s).stem, 'failed', None, 'dtc not found') for s in sources]
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(sources) or 1))
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(one, sources))
+    for name, status, _, _ in results:
+        if status == 'failed':
+            targets.pop(name, None)
+    if any(status != 'up-to-date' for _, status, _, _ in results) or manifest.get('files') != hasher.known:
+        manifest['files'] = hasher.known
+        file_hash.write_manifest(manifest_path, manifest)
+    return results
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Build overlays/*.dts into .dtbo files incrementally')
+    p.add_argument('sources', nargs='*', help='DTS files to build (default: every *.dts in --src-dir)')
+    p.add_argument('--src-dir', default=str(DEFAULT_SRC_DIR), help='Directory with the overlay sources')
+    p.add_argument('--out-dir', default=None, help='Directory for the .dtbo files (default: --src-dir)')
+    p.add_argument('--manifest', default=None, help=f"Manifest path (default: <out-dir>/{MANIFEST_NAME})")
+    p.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Number of concurrent builds')
+    p.add_argument('--dtc-flags', default=None, help=f"dtc flags as one string (default: {' '.join(DTC_FLAGS)})")
+    p.add_argument('--cpp-include', '-I', action='append', default=[], help='Extra cpp include directory (repeatable)')
+    p.add_argument('--force', action='store_true', help='Rebuild every target')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sources = args.sources or sorted(str(f) for f in Path(args.src_dir).glob('*.dts') if not f.name.endswith('.fixed.dts'))
+    if not sources:
+        print("No DTS files found")
+        return 1
+    flags = shlex.split(args.dtc_flags) if args.dtc_flags is not None else None
+    results = build(sources, args.out_dir or args.src_dir, args.manifest, args.jobs, flags, args.cpp_include, args.force)
+    counts = {'built': 0, 'up-to-date': 0, 'failed': 0}
+    for name, status, sha, msg in results:
+        counts[status] += 1
+        if status == 'failed':
+            print(f"FAILED {name}: {msg}")
+        elif status == 'built':
+            print(f"{sha}  {name}.dtbo")
+            if msg:
+                print(msg)
+    print(f"{counts['built']} built, {counts['up-to-date']} up to date, {counts['failed']} failed")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,7 +12,11 @@ modprobe i2c-dev
 echo "=== AXP221 Battery Diagnostics ==="
 
 # 1. Check Current Voltage
-if [ -d /sys/class/power_supply/axp20x-battery ]; then
+SAMPLER="$(dirname "$0")/battery_sampler.py"
+if [ -d /sys/class/power_supply/axp20x-battery ] && command -v python3 >/dev/null 2>&1 && [ -f "$SAMPLER" ]; then
+    # One batched read of all battery attributes instead of a cat per value
+    python3 "$SAMPLER" --once
+elif [ -d /sys/class/power_supply/axp20x-battery ]; then
     VOLT=$(cat /sys/class/power_supply/axp20x-battery/voltage_now)
     echo "Current Battery Voltage: $((VOLT / 1000)) mV"
     STATUS=$(cat /sys/class/power_supply/axp20x-battery/status)
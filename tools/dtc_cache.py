@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+dtc_cache.py
+
+Persistent, content-addressed cache for dtc validation results.
+
+auto_fix_dts.py runs dtc several times per overlay even when neither the
+overlay nor the toolchain changed since the previous run. This cache stores
+the outcome of a dtc run (return code, combined output and the parsed
+reg_format warnings) under a key derived from:
+
+- the exact DTS content dtc is given,
+- the identity of the dtc binary (path, size, mtime), so that upgrading dtc
+  invalidates entries without having to run `dtc --version` on a cache hit,
+- the extra dtc flags (--dtc-inc),
+- the content of every file pulled in with dtc's /include/, resolved like
+  dtc does (next to the including file, then the -i directories), so that
+  editing an included .dtsi invalidates the entry.
+
+Entries are small JSON files sharded by key prefix under the cache root
+(default: $UCONSOLE_DTC_CACHE, else $XDG_CACHE_HOME/uconsole-dtc, else
+~/.cache/uconsole-dtc). Writes are atomic (temp file + rename) so several
+fixer processes can share one cache. evict() drops entries older than
+max_age seconds and then the least recently used entries until the cache
+fits in max_bytes.
+
+MemoryCache adds an in-process LRU layer in front of the disk for
+long-running callers such as dts_watch.py.
+"""
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+_INCLUDE_RE = re.compile(rb'/include/\s*"([^"]+)"')
+
+
+def default_cache_dir():
+    env = os.environ.get('UCONSOLE_DTC_CACHE')
+    if env:
+        return Path(env)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'uconsole-dtc'
+
+
+def dtc_version(dtc='dtc'):
+    """Return a string identifying the dtc binary on PATH (or '' if absent).
+    Uses the resolved path, size and mtime instead of running dtc."""
+    path = shutil.which(dtc)
+    if path is None:
+        return ''
+    real = os.path.realpath(path)
+    try:
+        st = os.stat(real)
+    except OSError:
+        return real
+    return f"{real}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def include_dirs(dtc_inc):
+    """The -i/--include directories in the extra dtc flags."""
+    try:
+        args = shlex.split(dtc_inc or '')
+    except ValueError:
+        args = (dtc_inc or '').split()
+    dirs = []
+    for i, arg in enumerate(args):
+        if arg in ('-i', '--include') and i + 1 < len(args):
+            dirs.append(args[i + 1])
+        elif arg.startswith('--include='):
+            dirs.append(arg.split('=', 1)[1])
+        elif arg.startswith('-i') and len(arg) > 2:
+            dirs.append(arg[2:])
+    return dirs
+
+
+def include_deps(content, base, dirs=()):
+    """Resolve the /include/ files of content (recursively, as dtc searches:
+    the including file's directory, then dirs) and return a sorted list of
+    (name, sha256). Includes that cannot be found are listed with an empty
+    hash, so creating them later changes the key too."""
+    if isinstance(content, str):
+        content = content.encode()
+    deps = {}
+    todo = [(content, Path(base))]
+    while todo:
+        text, here = todo.pop()
+        for match in _INCLUDE_RE.finditer(text):
+            name = match.group(1).decode(errors='replace')
+            for d in [here, *dirs]:
+                path = Path(d) / name
+                if path.is_file():
+                    break
+            else:
+                deps.setdefault(name, '')
+                continue
+            real = str(path.resolve())
+            if real in deps:
+                continue
+            try:
+                data = path.read_bytes()
+            except OSError:
+                deps[real] = ''
+                continue
+            deps[real] = hashlib.sha256(data).hexdigest()
+            todo.append((data, path.resolve().parent))
+    return sorted(deps.items())
+
+
+class DtcCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.root = Path(root) if root else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(content, dtc_ver='', dtc_inc=None, deps=()):
+        """Hash of the DTS content, dtc identity, extra dtc flags and the
+        (name, sha256) pairs of its /include/ files (see include_deps)."""
+        h = hashlib.sha256()
+        for part in (dtc_ver, dtc_inc or ''):
+            h.update(part.encode())
+            h.update(b'\0')
+        for name, sha in deps:
+            h.update(f"{name}\0{sha}\0".encode())
+        h.update(b'\0')
+        h.update(content.encode() if isinstance(content, str) else content)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / (key + '.json')
+
+    def get(self, key):
+        """Return the stored record for key, or None. Counts a hit or miss."""
+        path = self._path(key)
+        try:
+            record = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            # refresh mtime so size-based eviction is least-recently-used
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return record
+
+    def put(self, key, record):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(record))
+            os.replace(tmp, path)
+        except OSError:
+            return
+        self.stores += 1
+
+    def evict(self):
+        """Remove expired entries, then the oldest ones until the cache fits
+        in max_bytes. Returns the number of entries removed."""
+        if not self.root.is_dir():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.root.glob('*/*.json'):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if self.max_age is not None and now - st.st_mtime > self.max_age:
+                removed += _unlink(path)
+            else:
+                entries.append((st.st_mtime, st.st_size, path))
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entries)
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                removed += _unlink(path)
+                total -= size
+        self.evictions += removed
+        return removed
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
+
+
+class MemoryCache(DtcCache):
+    """DtcCache that also keeps up to max_entries records in memory, so
+    repeated lookups skip the disk."""
+
+    def __init__(self, root=None, max_entries=4096, **kwargs):
+        super().__init__(root, **kwargs)
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+
+    def _remember(self, key, record):
+        self.memory[key] = record
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        record = self.memory.get(key)
+        if record is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return record
+        record = super().get(key)
+        if record is not None:
+            self._remember(key, record)
+        return record
+
+    def put(self, key, record):
+        self._remember(key, record)
+        super().put(key, record)
+
+
+def _unlink(path):
+    try:
+        path.unlink()
+        return 1
+    except OSError:
+        return 0
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+dtc_diag.py
+
+Line-oriented parser for dtc diagnostics.
+
+dtc prints one diagnostic per line on stderr, in forms such as:
+
+    <stdin>:12.3-15.4: Warning (reg_format): /fragment@0/__overlay__/dev@1:reg: property has invalid length ...
+    Warning (unit_address_vs_reg): /soc/foo@10: node has a unit name, but no reg or ranges property
+    ERROR (duplicate_label): /soc/bar: Duplicate label 'bar' on /soc/bar and /soc/baz
+    Error: <stdin>:7.1-2 syntax error
+    FATAL ERROR: Unable to parse input tree
+
+Each line becomes a Diagnostic with its severity (warning, error or
+fatal), the check name, the source location, the node path and property
+it refers to, and the message. Lines that belong to the previous
+diagnostic (e.g. "also defined at ...") are attached to it as notes.
+
+run() starts dtc and parses its stderr line by line as it arrives, so a
+large tree's thousands of warnings cost one cheap match per line. On the
+first fatal diagnostic it stops dtc instead of waiting for it to finish.
+
+Usage: dtc ... 2>&1 | dtc_diag.py [--json]
+       dtc_diag.py [--json] -- dtc -I dts -O dtb -o /dev/null file.dts
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import threading
+from collections import Counter
+
+_LOC = r'[^\s:][^\s]*?:\d+\.\d+(?:-\d+(?:\.\d+)?)?'
+_DIAG_RE = re.compile(r'^(?:(?P<loc>' + _LOC + r'):\s*)?'
+                      r'(?P<sev>Warning|ERROR|Error|FATAL ERROR)(?:\s+\((?P<check>[\w-]+)\))?:\s*(?P<rest>.*)$')
+_LEAD_LOC_RE = re.compile(r'^(' + _LOC + r'):?\s+(.*)$')
+_LOC_RE = re.compile(r'^(?P<file>.*?):(?P<line>\d+)\.(?P<col>\d+)(?:-(?:(?P<end_line>\d+)\.)?(?P<end_col>\d+))?$')
+_SUBJECT_RE = re.compile(r'^(?P<path>/[^:\s]*|&[\w]+)(?::(?P<prop>[^:\s]+))?:\s+(?P<message>.*)$')
+_ADDRESS_CELLS_RE = re.compile(r'#address-cells == (\d+)')
+
+
+class Diagnostic:
+    __slots__ = ('severity', 'check', 'file', 'line', 'col', 'path', 'prop', 'message', 'text', 'notes')
+
+    def __init__(self, severity, check, message, text, loc=None, path=None, prop=None):
+        self.severity = severity
+        self.check = check
+        self.file = self.line = self.col = None
+        if loc:
+            m = _LOC_RE.match(loc)
+            if m:
+                self.file = m.group('file')
+                self.line = int(m.group('line'))
+                self.col = int(m.group('col'))
+        self.path = path
+        self.prop = prop
+        self.message = message
+        self.text = text
+        self.notes = []
+
+    @property
+    def address_cells(self):
+        """The #address-cells a reg_format warning expected, else None."""
+        m = _ADDRESS_CELLS_RE.search(self.message)
+        return int(m.group(1)) if m else None
+
+    def to_dict(self):
+        return {'severity': self.severity, 'check': self.check, 'file': self.file, 'line': self.line,
+                'col': self.col, 'path': self.path, 'prop': self.prop, 'message': self.message,
+                'notes': list(self.notes)}
+
+    def __repr__(self):
+        return f"Diagnostic({self.severity!r}, {self.check!r}, {self.path!r}, {self.message!r})"
+
+
+def parse_line(line):
+    """Diagnostic for one line of dtc output, or None if the line is not a
+    diagnostic (blank lines, notes and other output)."""
+    text = line.rstrip('\r\n')
+    m = _DIAG_RE.match(text)
+    if m is None:
+        return None
+    sev, check, rest, loc = m.group('sev'), m.group('check'), m.group('rest'), m.group('loc')
+    if sev == 'Warning':
+        severity = 'warning'
+    elif sev == 'FATAL ERROR' or (sev == 'Error' and check is None):
+        # parser errors (syntax errors, missing includes) end the run
+        severity = 'fatal'
+    else:
+        severity = 'error'
+    if loc is None:
+        lead = _LEAD_LOC_RE.match(rest)
+        if lead:
+            loc, rest = lead.group(1), lead.group(2)
+    path = prop = None
+    if check is not None:
+        subject = _SUBJECT_RE.match(rest)
+        if subject:
+            path, prop, rest = subject.group('path'), subject.group('prop'), subject.group('message')
+    return Diagnostic(severity, check, rest, text, loc, path, prop)
+
+
+class DiagParser:
+    """Feed dtc output line by line; collects Diagnostics in order."""
+
+    def __init__(self):
+        self.diagnostics = []
+
+    def feed(self, line):
+        """Parse one line; returns the new Diagnostic or None."""
+        diag = parse_line(line)
+        if diag is None:
+            note = line.strip()
+            if note and self.diagnostics and line[:1].isspace():
+                self.diagnostics[-1].notes.append(note)
+            return None
+        self.diagnostics.append(diag)
+        return diag
+
+
+def parse(text):
+    """Diagnostics in a complete dtc output."""
+    parser = DiagParser()
+    for line in text.splitlines():
+        parser.feed(line)
+    return parser.diagnostics
+
+
+def reg_format(diagnostics):
+    """(nodepath, expected address cells) of the reg_format warnings."""
+    return [(d.path, d.address_cells) for d in diagnostics
+            if d.check == 'reg_format' and d.path and d.address_cells]
+
+
+class DtcRun:
+    __slots__ = ('rc', 'output', 'diagnostics', 'stopped')
+
+    def __init__(self, rc, output, diagnostics, stopped):
+        self.rc = rc
+        self.output = output
+        self.diagnostics = diagnostics
+        self.stopped = stopped
+
+
+def run(cmd, content=None, stop_on_fatal=True, on_diagnostic=None):
+    """Run dtc (cmd) feeding content on stdin when given, parsing stderr as
+    it arrives. on_diagnostic is called with every Diagnostic. With
+    stop_on_fatal the process is killed at the first fatal diagnostic (its
+    remaining output is still parsed). Returns a DtcRun; output is stdout
+    and stderr joined like the fixer's reports show them. Raises OSError
+    when dtc cannot be started."""
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if content is not None else subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace')
+    stdout = []
+    threads = [threading.Thread(target=lambda: stdout.append(proc.stdout.read()))]
+    if content is not None:
+        def feed():
+            try:
+                proc.stdin.write(content)
+                proc.stdin.close()
+            except OSError:
+                pass  # dtc exited (or was stopped) before reading everything
+        threads.append(threading.Thread(target=feed))
+    for t in threads:
+        t.start()
+    parser = DiagParser()
+    lines = []
+    stopped = False
+
+    def consume(line):
+        lines.append(line)
+        diag = parser.feed(line)
+        if diag is not None and on_diagnostic is not None:
+            on_diagnostic(diag)
+        return diag
+
+    for line in proc.stderr:
+        diag = consume(line)
+        if diag is not None and diag.severity == 'fatal' and stop_on_fatal:
+            proc.kill()
+            stopped = True
+            break
+    for line in proc.stderr:
+        consume(line)
+    rc = proc.wait()
+    for t in threads:
+        t.join()
+    if stopped and rc <= 0:
+        rc = 1
+    return DtcRun(rc, ''.join(stdout) + '\n' + ''.join(lines), parser.diagnostics, stopped)
+
+
+def summary(diagnostics):
+    """Counts per check (or per severity for diagnostics without one) of
+    Diagnostics or their to_dict() records."""
+    counts = Counter()
+    for d in diagnostics:
+        if isinstance(d, dict):
+            counts[d['check'] or d['severity']] += 1
+        else:
+            counts[d.check or d.severity] += 1
+    return dict(counts)
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Parse dtc diagnostics into structured records')
+    p.add_argument('--json', action='store_true', help='Print one JSON record per diagnostic')
+    p.add_argument('command', nargs=argparse.REMAINDER, help='dtc command to run (after --); default: read stdin')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cmd = args.command[1:] if args.command[:1] == ['--'] else args.command
+
+    def show(diag):
+        if args.json:
+            print(json.dumps(diag.to_dict(), sort_keys=True))
+        else:
+            where = f"{diag.file}:{diag.line}: " if diag.file else ''
+            subject = f"{diag.path}{':' + diag.prop if diag.prop else ''}: " if diag.path else ''
+            print(f"{where}{diag.severity} ({diag.check or '-'}): {subject}{diag.message}")
+
+    if cmd:
+        try:
+            result = run(cmd, on_diagnostic=show)
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        diagnostics, rc = result.diagnostics, result.rc
+    else:
+        parser = DiagParser()
+        for line in sys.stdin:
+            diag = parser.feed(line)
+            if diag is not None:
+                show(diag)
+        diagnostics, rc = parser.diagnostics, 0
+    if not args.json:
+        counts = summary(diagnostics)
+        print(', '.join(f"{k}: {v}" for k, v in sorted(counts.items())) or 'no diagnostics', file=sys.stderr)
+    if rc or any(d.severity != 'warning' for d in diagnostics):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
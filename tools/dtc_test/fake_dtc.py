@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+fake_dtc.py
+
+Offline stand-in for dtc used by the benchmarks and tests. It accepts the
+same command lines auto_fix_dts.py and build_overlays.py use (input file
+or '-' for stdin) and reads the whole input like dtc would. With -o (other
+than /dev/null) it writes a small fake blob derived from the input to that
+file, or to stdout for '-o -'.
+
+Environment knobs:
+  FAKE_DTC_RC      exit status to return (default 0)
+  FAKE_DTC_DELAY   seconds to sleep, to emulate a slow dtc (default 0)
+  FAKE_DTC_LOG     append each command line to this file
+  FAKE_DTC_STDERR  file whose content is written to stderr (canned diagnostics)
+"""
+import hashlib
+import os
+import sys
+import time
+
+
+def main(argv):
+    if '--version' in argv:
+        print('Version: DTC 1.7.0-fake')
+        return 0
+    log = os.environ.get('FAKE_DTC_LOG')
+    if log:
+        with open(log, 'a') as fh:
+            fh.write(' '.join(argv) + '\n')
+    src = argv[-1] if argv else '-'
+    if src == '-':
+        data = sys.stdin.buffer.read()
+    else:
+        with open(src, 'rb') as fh:
+            data = fh.read()
+    out = argv[argv.index('-o') + 1] if '-o' in argv[:-1] else None
+    if out and out != '/dev/null':
+        blob = b'\xd0\x0d\xfe\xed' + hashlib.sha256(data).digest()
+        if out == '-':
+            sys.stdout.buffer.write(blob)
+        else:
+            with open(out, 'wb') as fh:
+                fh.write(blob)
+    stderr = os.environ.get('FAKE_DTC_STDERR')
+    if stderr:
+        with open(stderr) as fh:
+            sys.stderr.write(fh.read())
+        sys.stderr.flush()
+    delay = float(os.environ.get('FAKE_DTC_DELAY') or 0)
+    if delay:
+        time.sleep(delay)
+    return int(os.environ.get('FAKE_DTC_RC') or 0)
+
+
+def install(bindir):
+    """Create an executable 'dtc' in bindir that runs this shim."""
+    os.makedirs(bindir, exist_ok=True)
+    path = os.path.join(bindir, 'dtc')
+    with open(path, 'w') as fh:
+        fh.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
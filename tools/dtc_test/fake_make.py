@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+fake_make.py
+
+Offline stand-in for `make -C <kernel> M=<dir> modules` used by the tests
+of build_modules.py. It reads obj-m from <dir>/Makefile and writes one
+<name>.ko per module, derived from the sources in <dir> and the kernel
+tree's .config, so no kernel tree or compiler is needed.
+
+Environment knobs:
+  FAKE_MAKE_DELAY  seconds to sleep per build, to emulate a slow make (default 0)
+  FAKE_MAKE_FAIL   comma-separated module names whose build fails
+  FAKE_MAKE_LOG    append each command line to this file
+"""
+import hashlib
+import os
+import re
+import sys
+import time
+
+_OBJ_RE = re.compile(r'^obj-m\s*[:+]?=\s*(.+)$', re.M)
+
+
+def main(argv):
+    log = os.environ.get('FAKE_MAKE_LOG')
+    if log:
+        with open(log, 'a') as fh:
+            fh.write(' '.join(argv) + '\n')
+    kdir = argv[argv.index('-C') + 1] if '-C' in argv else '.'
+    mdir = next((a[2:] for a in argv if a.startswith('M=')), '.')
+    with open(os.path.join(mdir, 'Makefile')) as fh:
+        names = [o[:-2] for m in _OBJ_RE.finditer(fh.read()) for o in m.group(1).split() if o.endswith('.o')]
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(mdir)):
+        if name.endswith(('.c', '.h')):
+            with open(os.path.join(mdir, name), 'rb') as fh:
+                h.update(fh.read())
+    try:
+        with open(os.path.join(kdir, '.config'), 'rb') as fh:
+            h.update(fh.read())
+    except OSError:
+        pass
+    delay = float(os.environ.get('FAKE_MAKE_DELAY') or 0)
+    if delay:
+        time.sleep(delay)
+    failing = set(filter(None, (os.environ.get('FAKE_MAKE_FAIL') or '').split(',')))
+    for name in names:
+        print(f"  CC [M]  {mdir}/{name}.o")
+        if name in failing:
+            print(f"{mdir}/{name}.c:1:1: error: fake failure", file=sys.stderr)
+            return 2
+        with open(os.path.join(mdir, f"{name}.ko"), 'wb') as fh:
+            fh.write(b'\x7fELF' + h.digest())
+        print(f"  LD [M]  {mdir}/{name}.ko")
+    return 0
+
+
+def install(bindir):
+    """Create an executable 'make' in bindir that runs this shim."""
+    os.makedirs(bindir, exist_ok=True)
+    path = os.path.join(bindir, 'make')
+    with open(path, 'w') as fh:
+        fh.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
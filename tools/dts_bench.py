@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+dts_bench.py
+
+Benchmark harness for auto_fix_dts.py with a synthetic DTS generator.
+
+The generator produces overlays (fragment@N/__overlay__ blocks) and
+full-board trees (a single root with nested buses) of parameterized size:
+number of device nodes, bus nesting depth, number of fragments and the
+ratios of devices with a missing or a too-short reg property. Output is
+deterministic for a given seed.
+
+For each size the harness times:
+
+- find_nodes() over the whole file
+- extract_parent_block() for a sample of nodes
+- process_file() without dtc and with the fake dtc shim on PATH
+- the full CLI (a fresh interpreter running auto_fix_dts.py)
+
+Everything runs offline: dtc is replaced by tools/dtc_test/fake_dtc.py, and
+the dtc cache is disabled so every run does the full amount of work.
+
+Results are written as JSON. With --baseline the run is compared against a
+previous result file and any metric slower than baseline * (1 + threshold)
+is reported as a regression (exit status 1). --write-baseline stores the
+current results as the new baseline.
+
+Usage: dts_bench.py [--sizes small,medium] [--repeat N] [--out results.json]
+                    [--baseline tools/dts_bench_baseline.json] [--threshold 0.5]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    from tools import auto_fix_dts as af
+    from tools.dtc_test import fake_dtc
+except ImportError:  # executed as a script from tools/
+    import auto_fix_dts as af
+    from dtc_test import fake_dtc
+
+
+TOOLS_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = TOOLS_DIR / 'dts_bench_baseline.json'
+
+# name -> generator parameters
+SIZES = {
+    'small': {'kind': 'overlay', 'nodes': 50, 'depth': 2, 'fragments': 4},
+    'medium': {'kind': 'overlay', 'nodes': 1000, 'depth': 4, 'fragments': 16},
+    'large': {'kind': 'board', 'nodes': 5000, 'depth': 6, 'fragments': 1},
+    'huge': {'kind': 'board', 'nodes': 20000, 'depth': 8, 'fragments': 1},
+}
+DEFAULT_SIZES = ('small', 'medium', 'large')
+
+# metrics below this many seconds are too noisy to flag as regressions
+MIN_SECONDS = 0.005
+
+
+def _device(rng, idx, address_cells, missing_ratio, short_ratio, indent):
+    addr = 0x1000 + idx * 0x10
+    lines = [f"{indent}dev{idx}: dev@{addr:x} {{",
+             f'{indent}\tcompatible = "bench,dev{idx % 7}";',
+             f'{indent}\t/* device {idx}: braces {{ }} in comments are ignored */']
+    roll = rng.random()
+    if roll < missing_ratio:
+        pass
+    elif roll < missing_ratio + short_ratio and address_cells > 1:
+        lines.append(f"{indent}\treg = <0x{addr:x}>;")
+    else:
+        lines.append(f"{indent}\treg = <{' '.join(['0'] * (address_cells - 1) + [f'0x{addr:x}'])}>;")
+    lines.append(f'{indent}\tstatus = "okay";')
+    lines.append(f"{indent}}};")
+    return lines
+
+
+def _bus_tree(rng, first_idx, count, depth, missing_ratio, short_ratio, indent):
+    """Lines for count devices spread over a chain of depth nested buses."""
+    levels = [[] for _ in range(depth)]
+    for n in range(count):
+        levels[n % depth].append(first_idx + n)
+    out = []
+
+    def emit(level, ind):
+        address_cells = 2 if level % 2 else 1
+        out.append(f"{ind}#address-cells = <{address_cells}>;")
+        out.append(f"{ind}#size-cells = <0>;")
+        for idx in levels[level]:
+            out.extend(_device(rng, idx, address_cells, missing_ratio, short_ratio, ind))
+        if level + 1 < depth:
+            out.append(f"{ind}bus{level + 1}: bus@{level + 1:x} {{")
+            out.append(f"{ind}\treg = <{' '.join(['0'] * address_cells)}>;")
+            emit(level + 1, ind + '\t')
+            out.append(f"{ind}}};")
+
+    emit(0, indent)
+    return out
+
+
+def generate_overlay(nodes=100, depth=3, fragments=4, missing_ratio=0.2, short_ratio=0.2, seed=0):
+    """Return the text of a synthetic overlay with nodes devices split over
+    fragments fragment@N blocks, each holding a bus chain depth levels deep."""
+    rng = random.Random(seed)
+    out = ['/dts-v1/;', '/plugin/;', '', '/ {', '\tcompatible = "brcm,bcm2712";']
+    per_fragment = [nodes // fragments + (1 if f < nodes % fragments else 0) for f in range(fragments)]
+    idx = 0
+    for f, count in enumerate(per_fragment):
+        out.append(f"\tfragment@{f} {{")
+        if f % 2:
+            out.append(f"\t\ttarget = <&i2c{f}>;")
+        else:
+            out.append(f'\t\ttarget-path = "/soc/bus@{f:x}";')
+        out.append("\t\t__overlay__ {")
+        out.extend(_bus_tree(rng, idx, count, depth, missing_ratio, short_ratio, '\t\t\t'))
+        out.append("\t\t};")
+        out.append("\t};")
+        idx += count
+    out.append('};')
+    return '\n'.join(out) + '\n'
+
+
+def generate_board(nodes=1000, depth=4, fragments=1, missing_ratio=0.05, short_ratio=0.05, seed=0):
+    """Return the text of a synthetic full-board tree (no /plugin/)."""
+    rng = random.Random(seed)
+    out = ['/dts-v1/;', '', '/ {', '\tcompatible = "brcm,bcm2712";', '\t#address-cells = <2>;',
+           '\t#size-cells = <1>;', '\tchosen {', '\t\tbootargs = "console=ttyAMA0 } {";', '\t};']
+    per_soc = [nodes // fragments + (1 if f < nodes % fragments else 0) for f in range(fragments)]
+    idx = 0
+    for f, count in enumerate(per_soc):
+        out.append(f"\tsoc{f}: soc@{f:x} {{")
+        out.append(f"\t\treg = <0 0x{f:x} 0>;")
+        out.extend(_bus_tree(rng, idx, count, depth, missing_ratio, short_ratio, '\t\t'))
+        out.append("\t};")
+        idx += count
+    out.append('};')
+    return '\n'.join(out) + '\n'
+
+
+def generate(kind='overlay', **params):
+    if kind == 'board':
+        return generate_board(**params)
+    return generate_overlay(**params)
+
+
+def _time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {'min': min(samples), 'median': statistics.median(samples)}
+
+
+class _path_env:
+    """Temporarily replace PATH (to hide or provide dtc)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.saved = os.environ.get('PATH', '')
+        os.environ['PATH'] = self.path
+
+    def __exit__(self, *exc):
+        os.environ['PATH'] = self.saved
+
+
+def bench_size(name, params, workdir, repeat=3, cli=True):
+    """Run every benchmark for one generated file and return its metrics."""
+    text = generate(**params)
+    dts = Path(workdir) / f"{name}.dts"
+    dts.write_text(text)
+    lines = text.splitlines()
+    results = {'params': dict(params), 'lines': len(lines), 'bytes': len(text.encode())}
+
+    # each timed run starts cold: auto_fix_dts keeps the last parse around
+    def cold(fn):
+        def run():
+            af._LAST_PARSE[0] = None
+            return fn()
+        return run
+
+    results['find_nodes'] = _time(cold(lambda: af.find_nodes(lines)), repeat)
+    nodes = af.find_nodes(lines)
+    results['nodes'] = len(nodes)
+    sample = [nd[3] for nd in nodes[::max(1, len(nodes) // 20)]][:20]
+    results['extract_parent_block'] = _time(cold(lambda: [af.extract_parent_block(lines, i) for i in sample]), repeat)
+    results['extract_parent_block']['calls'] = len(sample)
+
+    nodtc = Path(workdir) / 'no-dtc-bin'
+    nodtc.mkdir(exist_ok=True)
+    with _path_env(str(nodtc)):
+        results['process_file'] = _time(lambda: af.process_file(str(dts), apply=False), repeat)
+    shimdir = Path(workdir) / 'fake-dtc-bin'
+    fake_dtc.install(str(shimdir))
+    path_with_shim = f"{shimdir}{os.pathsep}{os.environ.get('PATH', '')}"
+    with _path_env(path_with_shim):
+        results['process_file_fake_dtc'] = _time(lambda: af.process_file(str(dts), apply=False), repeat)
+
+    if cli:
+        env = dict(os.environ, PATH=path_with_shim)
+        cmd = [sys.executable, str(TOOLS_DIR / 'auto_fix_dts.py'), '--file', str(dts), '--no-cache']
+        results['cli'] = _time(lambda: subprocess.run(cmd, env=env, capture_output=True, check=True), repeat)
+    return results
+
+
+def run(sizes=DEFAULT_SIZES, repeat=3, cli=True):
+    workdir = tempfile.mkdtemp(prefix='dts-bench-')
+    try:
+        return {
+            'meta': {'python': platform.python_version(), 'machine': platform.machine(),
+                     'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat},
+            'results': {name: bench_size(name, SIZES[name], workdir, repeat, cli) for name in sizes},
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(current, baseline, threshold=0.5, min_seconds=MIN_SECONDS):
+    """Return (size, metric, baseline_s, current_s) for every timed metric
+    whose min exceeds the baseline min by more than threshold."""
+    regressions = []
+    for size, metrics in current['results'].items():
+        base = baseline.get('results', {}).get(size)
+        if not base:
+            continue
+        for metric, value in metrics.items():
+            if not isinstance(value, dict) or 'min' not in value:
+                continue
+            old = base.get(metric, {}).get('min') if isinstance(base.get(metric), dict) else None
+            if old is None:
+                continue
+            new = value['min']
+            if new > max(old, min_seconds) * (1 + threshold):
+                regressions.append((size, metric, old, new))
+    return regressions
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Benchmark auto_fix_dts.py on synthetic device trees')
+    p.add_argument('--sizes', default=','.join(DEFAULT_SIZES), help=f"Comma separated subset of {', '.join(SIZES)}")
+    p.add_argument('--repeat', type=int, default=3, help='Timed repetitions per metric (the minimum is compared)')
+    p.add_argument('--no-cli', action='store_true', help='Skip the full CLI benchmark')
+    p.add_argument('--out', '-o', default=None, help='Write results JSON to this file')
+    p.add_argument('--baseline', default=None, help=f"Compare against this results file (e.g. {DEFAULT_BASELINE.name})")
+    p.add_argument('--threshold', type=float, default=0.5, help='Allowed slowdown before a metric is a regression (0.5 = +50%%)')
+    p.add_argument('--write-baseline', action='store_true', help='Store the results as the new baseline')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [s for s in args.sizes.split(',') if s]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        print(f"Unknown sizes: {', '.join(unknown)}")
+        return 2
+    current = run(sizes, args.repeat, cli=not args.no_cli)
+    for size, metrics in current['results'].items():
+        timed = ', '.join(f"{k}={v['min'] * 1000:.1f}ms" for k, v in metrics.items() if isinstance(v, dict) and 'min' in v)
+        print(f"{size} ({metrics['nodes']} unit nodes, {metrics['lines']} lines): {timed}")
+    text = json.dumps(current, indent=2, sort_keys=True) + '\n'
+    if args.out:
+        Path(args.out).write_text(text)
+    status = 0
+    if args.baseline:
+        baseline_path = Path(args.baseline)
+        if baseline_path.exists():
+            regressions = compare(current, json.loads(baseline_path.read_text()), args.threshold)
+            for size, metric, old, new in regressions:
+                print(f"REGRESSION {size}/{metric}: {old * 1000:.1f}ms -> {new * 1000:.1f}ms")
+            status = 1 if regressions else 0
+        else:
+            print(f"Baseline {baseline_path} not found; nothing to compare")
+    if args.write_baseline:
+        (Path(args.baseline) if args.baseline else DEFAULT_BASELINE).write_text(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
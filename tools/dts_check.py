@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+dts_check.py
+
+Pure-Python equivalent of dtc's reg_format check for parsed DTS trees.
+
+dtc validates that every 'reg' property is a whole number of
+(#address-cells + #size-cells) entries, where the cell counts come from the
+node's parent. This module performs the same check on a dts_parser tree in
+a single walk, propagating #address-cells/#size-cells down the tree, so the
+fixer can compute all of its pad fixes without round-tripping through dtc.
+
+Overlay fragments are handled by resolving each __overlay__ node's cells
+in this order:
+
+1. #address-cells/#size-cells declared on the __overlay__ node itself
+2. the fragment's target (target = <&label>) when the label is defined in
+   the same file and declares its cells
+3. a caller-supplied target_cells mapping ('&label' or '/path' ->
+   (address_cells, size_cells)), e.g. built from a base board tree
+4. dtc's defaults (2 address cells, 1 size cell); mismatches found under
+   such assumed cells are flagged with assumed=True
+
+Reference nodes at the top level (&label { ... }) are resolved the same way.
+
+The tree walk itself (walk_reg_format) only needs node names, parents and
+children, and is shared with fdt_reader.py to run the check on compiled
+.dtb/.dtbo files.
+"""
+import re
+
+try:
+    from tools import dts_parser
+except ImportError:  # executed as a script from tools/
+    import dts_parser
+
+
+DEFAULT_ADDRESS_CELLS = 2
+DEFAULT_SIZE_CELLS = 1
+
+_BITS_RE = re.compile(r'/bits/\s*(\d+)')
+
+
+class RegMismatch:
+    """A reg property whose length is not a multiple of the parent's
+    (#address-cells + #size-cells)."""
+    __slots__ = ('node', 'path', 'reg_cells', 'address_cells', 'size_cells', 'assumed')
+
+    def __init__(self, node, path, reg_cells, address_cells, size_cells, assumed):
+        self.node = node
+        self.path = path
+        self.reg_cells = reg_cells
+        self.address_cells = address_cells
+        self.size_cells = size_cells
+        self.assumed = assumed
+
+    def message(self):
+        return (f"{self.path}:reg: property has invalid length ({self.reg_cells * 4} bytes) "
+                f"(#address-cells == {self.address_cells}, #size-cells == {self.size_cells})")
+
+    def __repr__(self):
+        return f"RegMismatch({self.message()!r})"
+
+
+def value_cells(value):
+    """Number of 32-bit cells in a property value, or None if the value
+    holds anything other than cell lists."""
+    if value is None:
+        return 0
+    bits = _BITS_RE.search(value)
+    groups = dts_parser.cell_groups(value)
+    if not groups:
+        return None
+    cells = sum(len(g) for g in groups)
+    if bits:
+        cells = cells * int(bits.group(1)) // 32
+    return cells
+
+
+def own_cells(node):
+    """(#address-cells, #size-cells) declared on node itself (either may be None)."""
+    return dts_parser.prop_int(node, '#address-cells'), dts_parser.prop_int(node, '#size-cells')
+
+
+def target_key(node):
+    """(key, label) naming the target of an __overlay__ node or top-level
+    reference node: key is '&label' or '/path', label the bare label (None
+    for path targets). (None, None) when node has no target."""
+    key = None
+    label = None
+    if node.name.startswith('&{'):
+        key = node.name[2:-1]
+    elif node.name.startswith('&'):
+        key, label = node.name, node.name[1:]
+    elif node.name == '__overlay__' and node.parent is not None:
+        fragment = node.parent
+        target = fragment.props.get('target')
+        target_path = fragment.props.get('target-path')
+        if target is not None:
+            groups = dts_parser.cell_groups(target.value)
+            if groups and groups[0] and groups[0][0].startswith('&'):
+                key = groups[0][0]
+                label = key[1:]
+        elif target_path is not None and target_path.value:
+            key = target_path.value.strip('"')
+    return key, label
+
+
+def resolve_target(tree, node, target_cells=None):
+    """Return the (address_cells, size_cells) that the children of an
+    __overlay__ node or top-level &label node inherit from their target,
+    or None if it cannot be determined."""
+    key, label = target_key(node)
+    if key is None:
+        return None
+    if label and label in tree.labels:
+        local = tree.labels[label]
+        if isinstance(local, dts_parser.Node):
+            addr, size = own_cells(local)
+            if addr is not None or size is not None:
+                return (DEFAULT_ADDRESS_CELLS if addr is None else addr,
+                        DEFAULT_SIZE_CELLS if size is None else size)
+    if target_cells:
+        return target_cells.get(key)
+    return None
+
+
+def check_reg_format(tree, target_cells=None, reg_override=None):
+    """Return a RegMismatch for every reg property in tree whose length does
+    not match the inherited cells. reg_override maps nodes to a reg cell
+    count to check instead of the one in the source (planned edits)."""
+    reg_override = reg_override or {}
+
+    def reg_cells(node):
+        if node in reg_override:
+            return reg_override[node]
+        reg = node.props.get('reg')
+        return value_cells(reg.value) if reg is not None else None
+
+    def inherit(node):
+        if node.name == '__overlay__' or (node.parent is None and node.name.startswith('&')):
+            return resolve_target(tree, node, target_cells)
+        return None
+
+    return walk_reg_format(tree.roots, own_cells, reg_cells, inherit)
+
+
+def walk_reg_format(roots, cells_of, reg_cells_of, inherit):
+    """Core of check_reg_format() for any tree whose nodes have name,
+    parent, children and path. cells_of(node) gives the node's own
+    (#address-cells, #size-cells), reg_cells_of(node) its reg length in
+    cells (None without reg) and inherit(node) the cells its children get
+    from an overlay target (None if unknown or not a target node)."""
+    mismatches = []
+    # stack entries: (node, address_cells, size_cells, assumed) where the
+    # cells are those the node's own reg is checked against
+    stack = []
+    for root in reversed(roots):
+        stack.append((root, None, None, True))
+    while stack:
+        node, addr, size, assumed = stack.pop()
+        if addr is not None:
+            cells = reg_cells_of(node)
+            if cells is not None and (addr + size == 0 or cells % (addr + size)):
+                mismatches.append(RegMismatch(node, node.path, cells, addr, size, assumed))
+
+        child_addr, child_size = cells_of(node)
+        child_assumed = False
+        if child_addr is None or child_size is None:
+            inherited = inherit(node)
+            if inherited is None:
+                inherited = (DEFAULT_ADDRESS_CELLS, DEFAULT_SIZE_CELLS)
+                child_assumed = True
+            if child_addr is None:
+                child_addr = inherited[0]
+            if child_size is None:
+                child_size = inherited[1]
+        for child in reversed(node.children):
+            stack.append((child, child_addr, child_size, child_assumed))
+    return mismatches
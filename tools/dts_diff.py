@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+dts_diff.py
+
+Structural diff between DTS files (e.g. the -final/-fix/-stable/-ultimate
+variants of the uConsole overlay).
+
+Each file is parsed into a tree where every node carries a Merkle hash of
+its labels, properties and children. The hash does not depend on the
+order of properties or child nodes. Property values are normalised
+first: comments are dropped, whitespace is collapsed and numeric cells
+are compared by value (<0x10> == <16>). The comparison walks both trees
+together and only descends into subtrees whose hashes differ, so its cost
+follows the size of the change rather than the size of the files.
+
+Same-path nodes are merged the way dtc merges them (later properties
+win). By default overlay fragments are matched by their target
+(fragment[<&dsi1>]) instead of by fragment@N, because renumbering the
+fragments would otherwise show up as a difference everywhere.
+
+Usage: dts_diff.py OLD NEW [NEW ...] [--json] [--no-align-fragments]
+Exit status: 0 identical, 1 differences found, 2 error.
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+from pathlib import Path
+
+try:
+    from tools import dts_parser
+except ImportError:  # executed as a script from tools/
+    import dts_parser
+
+
+_PART_RE = re.compile(r'"(?:[^"\\]|\\.)*"|<[^>]*>|\[[^\]]*\]|//[^\n]*|/\*.*?\*/|[^"<\[/]+|/', re.S)
+_COMMENT_RE = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+_TARGET_PROPS = ('target', 'target-path')
+
+# sha256 of file text -> DiffNode, so comparing one file against several
+# others parses and hashes it once
+_TREE_CACHE = {}
+
+
+def normalize_value(value):
+    """Canonical form of a property value (None for empty properties)."""
+    if value is None:
+        return None
+    out = []
+    for part in _PART_RE.findall(value):
+        if part.startswith('"'):
+            out.append(part)
+        elif part.startswith('<'):
+            cells = []
+            for tok in _COMMENT_RE.sub(' ', part[1:-1]).split():
+                n = dts_parser.cell_int(tok)
+                cells.append(hex(n) if n is not None else tok)
+            out.append('<' + ' '.join(cells) + '>')
+        elif part.startswith('['):
+            out.append('[' + ''.join(part[1:-1].split()).lower() + ']')
+        elif part.startswith(('//', '/*')):
+            continue
+        else:
+            out.append(''.join(part.split()))
+    return ''.join(out)
+
+
+class DiffNode:
+    __slots__ = ('name', 'labels', 'props', 'children', 'digest')
+
+    def __init__(self, name):
+        self.name = name
+        self.labels = set()
+        self.props = {}
+        self.children = {}
+        self.digest = None
+
+    def seal(self):
+        """Compute digests bottom-up (iteratively, trees can be deep)."""
+        order, stack = [], [self]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children.values())
+        for node in reversed(order):
+            h = hashlib.sha256()
+            h.update(','.join(sorted(node.labels)).encode() + b'\n')
+            for name in sorted(node.props):
+                h.update(f"p {name}={node.props[name]}\n".encode())
+            for key in sorted(node.children):
+                h.update(f"c {key} ".encode() + node.children[key].digest + b'\n')
+            node.digest = h.digest()
+        return self
+
+    def count(self):
+        n, stack = 0, [self]
+        while stack:
+            node = stack.pop()
+            n += 1
+            stack.extend(node.children.values())
+        return n
+
+
+def _fragment_key(node):
+    for name in _TARGET_PROPS:
+        prop = node.props.get(name)
+        if prop is not None and prop.value:
+            return f"fragment[{normalize_value(prop.value)}]"
+    return None
+
+
+def _merge(dst, src, aliases=None):
+    """Merge parsed node src into dst. With aliases (a dict, used for the
+    root only) fragments are keyed by target; aliases maps fragment@N to
+    its key so repeated fragment@N blocks still merge."""
+    dst.labels.update(src.labels)
+    for prop in src.props.values():
+        dst.props[prop.name] = normalize_value(prop.value)
+    for child in src.children:
+        key = child.name
+        target = _fragment_key(child) if aliases is not None else None
+        if target is not None:
+            key = aliases.get(child.name)
+            if key is None:
+                key, n = target, 2
+                while key in dst.children:
+                    key, n = f"{target}#{n}", n + 1
+                aliases[child.name] = key
+        node = dst.children.get(key)
+        if node is None:
+            node = dst.children[key] = DiffNode(key)
+        _merge(node, child)
+
+
+def build(text, align=True):
+    """Hashed DiffNode tree for DTS text. Reference roots (&label { ... })
+    become children of the root named after the reference."""
+    key = (hashlib.sha256(text.encode()).hexdigest(), align)
+    cached = _TREE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    tree = dts_parser.parse(text)
+    root = DiffNode('/')
+    aliases = {} if align else None
+    for node in tree.roots:
+        if node.name == '/':
+            _merge(root, node, aliases)
+        else:
+            ref = root.children.get(node.name)
+            if ref is None:
+                ref = root.children[node.name] = DiffNode(node.name)
+            _merge(ref, node)
+    _TREE_CACHE[key] = root.seal()
+    return root
+
+
+class Change:
+    __slots__ = ('kind', 'path', 'old', 'new')
+
+    def __init__(self, kind, path, old=None, new=None):
+        self.kind = kind
+        self.path = path
+        self.old = old
+        self.new = new
+
+    def to_dict(self):
+        return {'kind': self.kind, 'path': self.path, 'old': self.old, 'new': self.new}
+
+    def __str__(self):
+        if self.kind == 'node-added':
+            return f"+ {self.path}/ ({self.new} nodes)"
+        if self.kind == 'node-removed':
+            return f"- {self.path}/ ({self.old} nodes)"
+        if self.kind == 'labels-changed':
+            return f"~ {self.path}/ labels {self.old} -> {self.new}"
+        old = '' if self.old is None else f" = {self.old}"
+        new = '' if self.new is None else f" = {self.new}"
+        if self.kind == 'prop-added':
+            return f"+ {self.path}{new}"
+        if self.kind == 'prop-removed':
+            return f"- {self.path}{old}"
+        return f"~ {self.path}{old} -> {new.lstrip(' =') or '(empty)'}"
+
+
+def diff_trees(a, b):
+    """Changes between two sealed DiffNode trees and the number of node
+    pairs visited (only pairs whose digests differ are descended into)."""
+    changes = []
+    visited = 0
+    stack = [('', a, b)]
+    while stack:
+        path, x, y = stack.pop()
+        visited += 1
+        if x.labels != y.labels:
+            changes.append(Change('labels-changed', path or '/', sorted(x.labels), sorted(y.labels)))
+        for name in sorted(x.props.keys() | y.props.keys()):
+            old, new = x.props.get(name, ''), y.props.get(name, '')
+            if name not in y.props:
+                changes.append(Change('prop-removed', f"{path}/{name}", x.props[name]))
+            elif name not in x.props:
+                changes.append(Change('prop-added', f"{path}/{name}", None, y.props[name]))
+            elif old != new:
+                changes.append(Change('prop-changed', f"{path}/{name}", old, new))
+        pending = []
+        for key in sorted(x.children.keys() | y.children.keys()):
+            cx, cy = x.children.get(key), y.children.get(key)
+            if cy is None:
+                changes.append(Change('node-removed', f"{path}/{key}", cx.count()))
+            elif cx is None:
+                changes.append(Change('node-added', f"{path}/{key}", None, cy.count()))
+            elif cx.digest != cy.digest:
+                pending.append((f"{path}/{key}", cx, cy))
+        stack.extend(reversed(pending))
+    return changes, visited
+
+
+def diff_texts(old, new, align=True):
+    return diff_trees(build(old, align), build(new, align))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Structural diff of DTS files')
+    p.add_argument('old', help='Reference DTS file')
+    p.add_argument('new', nargs='+', help='DTS file(s) to compare against the reference')
+    p.add_argument('--json', action='store_true', help='Print changes as JSON')
+    p.add_argument('--no-align-fragments', action='store_true', help='Match fragments by fragment@N instead of by target')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    align = not args.no_align_fragments
+    try:
+        old = build(Path(args.old).read_text(), align)
+        results = [(f, diff_trees(old, build(Path(f).read_text(), align))[0]) for f in args.new]
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps({f: [c.to_dict() for c in changes] for f, changes in results}, indent=2))
+    else:
+        for f, changes in results:
+            print(f"--- {args.old}\n+++ {f}")
+            for c in changes:
+                print(c)
+            if not changes:
+                print('(no structural differences)')
+    return 1 if any(changes for _, changes in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
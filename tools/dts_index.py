@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+dts_index.py
+
+Lookup structures over a dts_parser tree.
+
+PathIndex maps node paths to nodes with a dict, so resolving a path that
+dtc prints in a diagnostic (e.g. /fragment@1/__overlay__/spidev@0) is a
+hash lookup instead of a scan over every node. Paths that dtc generates for
+&label { ... } blocks (which it turns into /fragment@N/__overlay__/...) are
+matched through a secondary index on the last path component.
+
+EditMap translates offsets and lines of the parsed text to the text after
+a set of edits (see auto_fix_dts.apply_edits), by bisecting the sorted edit
+ends next to the cumulative change in length and line count. LineIndex
+turns offsets into line numbers.
+"""
+import bisect
+import re
+
+
+class PathIndex:
+    def __init__(self, tree):
+        self.by_path = {}
+        self.by_name = {}
+        stack = [(root, root.path) for root in reversed(tree.roots)]
+        while stack:
+            node, path = stack.pop()
+            self.by_path.setdefault(path, node)
+            self.by_name.setdefault(node.name, []).append((path, node))
+            prefix = '' if path == '/' else path
+            for child in reversed(node.children):
+                stack.append((child, f"{prefix}/{child.name}"))
+
+    def __len__(self):
+        return len(self.by_path)
+
+    def lookup(self, path):
+        """Return the node for a dtc-style path, or None."""
+        path = path.rstrip('/') or '/'
+        node = self.by_path.get(path)
+        if node is not None:
+            return node
+        parts = path.split('/')
+        candidates = self.by_name.get(parts[-1])
+        if not candidates:
+            return None
+        rest = _overlay_rest(parts)
+        matches = [node for cpath, node in candidates if _overlay_rest(cpath.split('/')) == rest]
+        return matches[0] if len(matches) == 1 else None
+
+
+def _overlay_rest(parts):
+    """Path components below the overlay target: after __overlay__ for
+    fragment paths, after the reference for &label paths."""
+    if '__overlay__' in parts:
+        return tuple(parts[parts.index('__overlay__') + 1:])
+    if parts and parts[0].startswith('&'):
+        return tuple(parts[1:])
+    return tuple(parts)
+
+
+class LineIndex:
+    """0-based line lookups for a text by bisecting its newline offsets."""
+    __slots__ = ('starts',)
+
+    def __init__(self, text):
+        self.starts = [0] + [m.end() for m in re.finditer('\n', text)]
+
+    def line_of(self, offset):
+        return bisect.bisect_right(self.starts, offset) - 1
+
+
+class EditMap:
+    """Positions in the text after non-overlapping (start, end, replacement)
+    edits of text, for offsets and lines of the original text. Offsets at
+    or after an edit's end move by that edit's change."""
+    __slots__ = ('ends', 'chars', 'lines')
+
+    def __init__(self, text, edits):
+        self.ends = []
+        self.chars = [0]
+        self.lines = [0]
+        for start, end, replacement in sorted(edits):
+            self.ends.append(end)
+            self.chars.append(self.chars[-1] + len(replacement) - (end - start))
+            self.lines.append(self.lines[-1] + replacement.count('\n') - text.count('\n', start, end))
+
+    def offset(self, pos):
+        """Position of an original offset in the edited text."""
+        return pos + self.chars[bisect.bisect_right(self.ends, pos)]
+
+    def span(self, obj):
+        """Current (start, end) of a Node or Property."""
+        return self.offset(obj.start), self.offset(obj.end)
+
+    def line(self, pos, line):
+        """0-based line in the edited text of the original offset pos, which
+        was on (0-based) line."""
+        return line + self.lines[bisect.bisect_right(self.ends, pos)]
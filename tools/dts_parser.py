@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+dts_parser.py
+
+Single-pass tokenizer and tree builder for device-tree source (DTS).
+
+The parser walks the source exactly once with a compiled master regex and
+builds a light node tree as it goes, so cost is linear in the size of the
+file regardless of how many nodes it contains. It understands the parts of
+the DTS grammar that show up in our overlays and in decompiled board trees:
+
+- line and block comments, C preprocessor lines (#include/#define/...) and
+  cpp linemarkers, quoted strings, cell lists (<...>), byte strings ([...])
+- labels on nodes and properties (label: node@0 { ... })
+- root nodes (/ { ... }) and reference nodes (&label { ... }, &{/path} { ... })
+- /dts-v1/, /plugin/, /include/, /memreserve/, /delete-node/ and
+  /delete-property/ directives
+
+Nodes and properties keep character offsets (spans) into the source text
+instead of copies of it, and use __slots__ so that trees with tens of
+thousands of nodes stay small. Line numbers are derived on demand from a
+single newline index.
+"""
+import bisect
+import re
+
+
+# Leading whitespace is consumed by each match; tokens start at m.start(m.lastgroup)
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<cpp>\#[ \t]*(?:include|define|undef|ifdef|ifndef|if|elif|else|endif|line|pragma|error|warning)(?![\w-])(?:\\\n|[^\n])*
+      | \#[ \t]+\d+[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<cells><(?:[^>()/]|/\*.*?\*/|/(?!\*)|\((?:[^()]|\([^()]*\))*\))*>)
+  | (?P<bytes>\[[^\]]*\])
+  | (?P<char>'(?:[^'\\]|\\.)+')
+  | (?P<directive>/[a-z][a-z0-9-]*/)
+  | (?P<root>/)
+  | (?P<ref>&\{[^}]*\}|&[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<label>[A-Za-z_][A-Za-z0-9_]*):
+  | (?P<word>[A-Za-z0-9,._+*\#?@-]+)
+  | (?P<punct>[{};=,])
+  | (?P<other>.)
+)""", re.X | re.S)
+
+# Everything up to the ';' that ends a property value, in one match
+_VALUE_RE = re.compile(r"""(?:
+    "(?:[^"\\]|\\.)*"
+  | <(?:[^>()/]|/\*.*?\*/|/(?!\*)|\((?:[^()]|\([^()]*\))*\))*>
+  | \[[^\]]*\]
+  | '(?:[^'\\]|\\.)+'
+  | /\*.*?\*/ | //[^\n]*
+  | [^;"'<\[/]+
+  | /
+)*""", re.X | re.S)
+
+_INCLUDE_RE = re.compile(r'\#[ \t]*include[ \t]*[<"]([^>"]+)[>"]')
+_COMMENT_RE = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+_CELL_GROUP_RE = re.compile(r'<((?:[^>()/]|/\*.*?\*/|/(?!\*)|\((?:[^()]|\([^()]*\))*\))*)>', re.S)
+_CELL_TOKEN_RE = re.compile(r'\((?:[^()]|\([^()]*\))*\)|&\{[^}]*\}|[^\s()]+')
+_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+_REF_RE = re.compile(r'&\{[^}]*\}|&[A-Za-z_][A-Za-z0-9_]*')
+
+# Directives that take an argument and (except /include/) end with ';'
+_ARG_DIRECTIVES = ('/delete-node/', '/delete-property/', '/include/', '/memreserve/')
+
+
+class Property:
+    """A property assignment. value is the stripped source text of the value
+    (None for boolean properties); value_start is its offset in the source."""
+    __slots__ = ('name', 'labels', 'value', 'start', 'end', 'value_start')
+
+    def __init__(self, name, labels, value, start, end, value_start):
+        self.name = name
+        self.labels = labels
+        self.value = value
+        self.start = start
+        self.end = end
+        self.value_start = value_start
+
+    @property
+    def value_end(self):
+        if self.value is None:
+            return self.value_start
+        return self.value_start + len(self.value)
+
+    def __repr__(self):
+        return f"Property({self.name!r}, {self.value!r})"
+
+
+class Node:
+    """A node definition. start is the offset of the first label (or the
+    name), body_start the offset just after '{' and end the offset just
+    after the closing '};'."""
+    __slots__ = ('name', 'labels', 'parent', 'children', 'props', 'start', 'body_start', 'end', '__weakref__')
+
+    def __init__(self, name, labels, parent, start, body_start):
+        self.name = name
+        self.labels = labels
+        self.parent = parent
+        self.children = []
+        self.props = {}
+        self.start = start
+        self.body_start = body_start
+        self.end = body_start
+
+    @property
+    def basename(self):
+        return self.name.partition('@')[0]
+
+    @property
+    def unit(self):
+        return self.name.partition('@')[2]
+
+    @property
+    def label(self):
+        return self.labels[-1] if self.labels else ''
+
+    @property
+    def path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        if node.name == '/':
+            return '/' + '/'.join(reversed(parts))
+        parts.append(node.name)
+        return '/'.join(reversed(parts))
+
+    @property
+    def depth(self):
+        depth = 0
+        node = self.parent
+        while node is not None:
+            depth += 1
+            node = node.parent
+        return depth
+
+    def child(self, name):
+        for c in self.children:
+            if c.name == name:
+                return c
+        return None
+
+    def iter(self):
+        """Yield this node and all of its descendants in document order."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def __repr__(self):
+        return f"Node({self.name!r}, start={self.start}, end={self.end})"
+
+
+class DtsTree:
+    """Result of parse(): top-level nodes plus file-level metadata."""
+    __slots__ = ('text', 'roots', 'directives', 'includes', 'labels', 'deleted', '_line_starts')
+
+    def __init__(self, text):
+        self.text = text
+        self.roots = []
+        self.directives = []
+        self.includes = []
+        self.labels = {}
+        self.deleted = []
+        self._line_starts = None
+
+    def walk(self):
+        """Yield every node of every top-level block in document order."""
+        for root in self.roots:
+            yield from root.iter()
+
+    def line_of(self, offset):
+        """Return the 0-based line index containing offset."""
+        if self._line_starts is None:
+            self._line_starts = [0] + [m.end() for m in re.finditer('\n', self.text)]
+        return bisect.bisect_right(self._line_starts, offset) - 1
+
+    def line_start(self, offset):
+        return self.text.rfind('\n', 0, offset) + 1
+
+    def is_plugin(self):
+        return any(d == '/plugin/' for d, _ in self.directives)
+
+
+def parse(text):
+    """Parse DTS text into a DtsTree in a single forward pass."""
+    tree = DtsTree(text)
+    stack = []
+    labels = []
+    name = None
+    stmt_start = -1
+    directive = None
+    directive_arg = None
+    closing = None
+
+    match = _TOKEN_RE.match
+    end = len(text)
+    pos = 0
+    while True:
+        m = match(text, pos)
+        if m is None:
+            break
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'comment':
+            continue
+        tok = m.group(kind)
+        if kind == 'cpp':
+            inc = _INCLUDE_RE.match(tok)
+            if inc:
+                tree.includes.append(inc.group(1))
+            continue
+
+        if tok == '=' and directive is None:
+            # Consume the whole value up to its ';' in one go
+            value_start = pos
+            while True:
+                pos = _VALUE_RE.match(text, pos).end()
+                if pos >= end or text[pos] == ';':
+                    break
+                pos += 1  # stray '<', '[' or quote without its closing pair
+            raw = text[value_start:pos]
+            value = raw.strip()
+            vstart = value_start + (len(raw) - len(raw.lstrip()))
+            pos = min(pos + 1, end)
+            _add_prop(tree, stack, Property(name, labels, value, stmt_start, pos, vstart))
+            labels, name, stmt_start = [], None, -1
+            closing = None
+            continue
+
+        if closing is not None:
+            if tok == ';':
+                closing.end = pos
+                closing = None
+                continue
+            closing = None
+
+        if directive is not None:
+            if tok == ';' or (directive == '/include/' and kind == 'string'):
+                if kind == 'string':
+                    directive_arg = tok
+                _finish_directive(tree, stack, directive, directive_arg)
+                directive = directive_arg = None
+            elif directive_arg is None:
+                directive_arg = tok
+            continue
+
+        if kind == 'directive':
+            if tok in _ARG_DIRECTIVES:
+                directive = tok
+            elif tok != '/omit-if-no-ref/' and tok != '/bits/':
+                tree.directives.append((tok, m.start(kind)))
+            continue
+        if kind == 'label':
+            if stmt_start < 0:
+                stmt_start = m.start(kind)
+            labels.append(tok)
+            continue
+        if kind == 'word' or kind == 'ref' or kind == 'root':
+            if name is None:
+                name = tok
+                if stmt_start < 0:
+                    stmt_start = m.start(kind)
+            continue
+        if tok == '{':
+            parent = stack[-1] if stack else None
+            node = Node(name or '', labels, parent, stmt_start if stmt_start >= 0 else m.start(kind), pos)
+            if parent is None:
+                tree.roots.append(node)
+            else:
+                parent.children.append(node)
+            for lbl in labels:
+                tree.labels[lbl] = node
+            stack.append(node)
+        elif tok == '}':
+            if stack:
+                closing = stack.pop()
+                closing.end = pos
+        elif tok == ';' and name is not None:
+            _add_prop(tree, stack, Property(name, labels, None, stmt_start, pos, pos - 1))
+        labels, name, stmt_start = [], None, -1
+
+    # Tolerate truncated input: close whatever is still open at EOF
+    for node in stack:
+        node.end = end
+    return tree
+
+
+def _add_prop(tree, stack, prop):
+    if not stack:
+        return
+    stack[-1].props[prop.name] = prop
+    for lbl in prop.labels:
+        tree.labels[lbl] = prop
+
+
+def _finish_directive(tree, stack, directive, arg):
+    if directive == '/include/':
+        if arg:
+            tree.includes.append(arg.strip('"'))
+        return
+    if directive == '/delete-property/':
+        if stack and arg:
+            stack[-1].props.pop(arg, None)
+        return
+    if directive != '/delete-node/' or not arg:
+        return
+    if arg.startswith('&'):
+        target = tree.labels.get(arg[1:])
+        if not isinstance(target, Node):
+            return
+    elif stack:
+        target = stack[-1].child(arg)
+        if target is None:
+            return
+    else:
+        return
+    siblings = target.parent.children if target.parent is not None else tree.roots
+    if target in siblings:
+        siblings.remove(target)
+        tree.deleted.append(target)
+
+
+def cell_groups(value):
+    """Split a property value into its <...> groups, each a list of cell
+    tokens (numbers, &refs, (expressions) or macro names)."""
+    if not value:
+        return []
+    return [_CELL_TOKEN_RE.findall(_COMMENT_RE.sub(' ', g)) for g in _CELL_GROUP_RE.findall(value)]
+
+
+def value_refs(value):
+    """Phandle/path references (&label, &{/path}) in a property value."""
+    if not value:
+        return []
+    return _REF_RE.findall(_STRING_RE.sub('', value))
+
+
+def cell_int(token):
+    """Return the integer value of a literal cell token, or None."""
+    try:
+        return int(token, 0)
+    except ValueError:
+        if token.isdigit():
+            return int(token, 10)
+        return None
+
+
+def prop_int(node, name):
+    """Return the first cell of node property name as an int, or None."""
+    prop = node.props.get(name)
+    if prop is None:
+        return None
+    groups = cell_groups(prop.value)
+    if not groups or not groups[0]:
+        return None
+    return cell_int(groups[0][0])
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+dts_preprocess.py
+
+C preprocessor step for overlays that #include headers, as done by
+scripts/build_overlay.sh:
+
+    cpp -nostdinc -I tools/dtc_stub_includes -undef -x assembler-with-cpp
+
+The DTS text is fed to cpp on stdin, so in-memory (already fixed) content
+can be preprocessed without writing it anywhere. The result keeps cpp's
+linemarkers (with <stdin> renamed to the real source path), which dtc
+understands, so dtc diagnostics point at the original file and line.
+LineMap maps every preprocessed line back to its (file, line) for callers
+that work on the preprocessed text.
+
+The header dependency set of each run is taken from the linemarkers and
+recorded with the size and mtime of every header. With a PreprocessCache,
+preprocessing the same text again only runs cpp when one of its headers
+changed; write_depfile() stores the set in make's .d format.
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+try:
+    from tools import dtc_cache
+except ImportError:  # executed as a script from tools/
+    import dtc_cache
+
+
+STUB_INCLUDES = Path(__file__).resolve().parent / 'dtc_stub_includes'
+CPP_FLAGS = ['-nostdinc', '-undef', '-x', 'assembler-with-cpp']
+
+_NEEDS_CPP_RE = re.compile(r'^[ \t]*#[ \t]*(?:include|define|if|ifdef|ifndef)\b', re.M)
+_MARKER_RE = re.compile(r'^#[ \t]+(\d+)[ \t]+"((?:[^"\\]|\\.)*)"(.*)$')
+_STDIN = '<stdin>'
+
+
+def needs_cpp(text):
+    """True if text uses C preprocessor directives."""
+    return _NEEDS_CPP_RE.search(text) is not None
+
+
+def cpp_version(cpp='cpp'):
+    """Identity of the cpp binary (like dtc_cache.dtc_version), '' if absent."""
+    return dtc_cache.dtc_version(cpp)
+
+
+class LineMap:
+    """Maps 0-based lines of preprocessed text to (file, 1-based line) in
+    the sources; linemarker lines map to None."""
+    __slots__ = ('lines',)
+
+    def __init__(self, text):
+        self.lines = []
+        current, lineno = None, 0
+        for line in text.split('\n'):
+            m = _MARKER_RE.match(line)
+            if m:
+                current, lineno = m.group(2), int(m.group(1))
+                self.lines.append(None)
+                continue
+            self.lines.append((current, lineno) if current is not None else None)
+            lineno += 1
+
+    def source(self, line):
+        """(file, line) for a 0-based preprocessed line, or None."""
+        if 0 <= line < len(self.lines):
+            return self.lines[line]
+        return None
+
+
+class Preprocessed:
+    __slots__ = ('text', 'deps', 'line_map', 'cached')
+
+    def __init__(self, text, deps, cached=False):
+        self.text = text
+        self.deps = deps
+        self.line_map = LineMap(text)
+        self.cached = cached
+
+
+def _deps_of(text, source):
+    deps = []
+    for line in text.split('\n'):
+        m = _MARKER_RE.match(line)
+        if m and not m.group(2).startswith('<') and m.group(2) != source:
+            deps.append(m.group(2))
+    return sorted(set(deps))
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def include_dirs_for(source, extra=()):
+    """cpp include path: the source's directory, extra dirs, then the stubs."""
+    dirs = [str(Path(source).resolve().parent)]
+    dirs.extend(str(Path(d).resolve()) for d in extra)
+    dirs.append(str(STUB_INCLUDES))
+    return list(dict.fromkeys(dirs))
+
+
+def run_cpp(text, source, include_dirs=(), cpp='cpp'):
+    """Preprocess text (the content of source) and return a Preprocessed.
+    Raises RuntimeError when cpp fails."""
+    cmd = [cpp] + CPP_FLAGS
+    for d in include_dirs_for(source, include_dirs):
+        cmd += ['-I', d]
+    cmd.append('-')
+    try:
+        p = subprocess.run(cmd, input=text, capture_output=True, text=True)
+    except OSError as e:
+        raise RuntimeError(f"cpp failed: {e}")
+    if p.returncode != 0:
+        raise RuntimeError(f"cpp failed (rc={p.returncode}): {p.stderr.replace(_STDIN, str(source)).strip()}")
+    source = str(source)
+    out = p.stdout.replace(f' "{_STDIN}"', ' "{}"'.format(source.replace('\\', '\\\\').replace('"', '\\"')))
+    return Preprocessed(out, _deps_of(out, source))
+
+
+class PreprocessCache:
+    """Stores cpp output with the header stamps it depends on, keyed by
+    the input text, source path, include path and cpp identity."""
+
+    def __init__(self, root=None, store=None):
+        self.store = store or dtc_cache.DtcCache(root or dtc_cache.default_cache_dir() / 'cpp')
+        self.runs = 0
+
+    def preprocess(self, text, source, include_dirs=(), cpp='cpp'):
+        h = hashlib.sha256()
+        for part in [cpp_version(cpp), str(source)] + include_dirs_for(source, include_dirs):
+            h.update(part.encode() + b'\0')
+        h.update(text.encode())
+        key = h.hexdigest()
+        record = self.store.get(key)
+        if record is not None and all(_stamp(dep) == stamp for dep, stamp in record['deps'].items()):
+            return Preprocessed(record['text'], sorted(record['deps']), cached=True)
+        self.runs += 1
+        result = run_cpp(text, source, include_dirs, cpp)
+        self.store.put(key, {'text': result.text, 'deps': {dep: _stamp(dep) for dep in result.deps}})
+        return result
+
+
+def preprocess(text, source, include_dirs=(), cache=None, cpp='cpp'):
+    """Preprocess text if it needs cpp and cpp is installed, else None."""
+    if not needs_cpp(text) or not shutil.which(cpp):
+        return None
+    if cache is not None:
+        return cache.preprocess(text, source, include_dirs, cpp)
+    return run_cpp(text, source, include_dirs, cpp)
+
+
+def write_depfile(path, target, deps):
+    """Write deps as a make-style .d file for target."""
+    def esc(s):
+        return s.replace(' ', '\\ ')
+    lines = [f"{esc(str(target))}: " + ' \\\n  '.join(esc(d) for d in deps)]
+    lines.extend(f"{esc(d)}:" for d in deps)
+    Path(path).write_text('\n\n'.join(lines) + '\n')
+
+
+def map_nodes(pre_tree, src_tree, line_map, source):
+    """Map the nodes of the parsed preprocessed text to the nodes of the
+    parsed source they came from ({pre_node: src_node}). Nodes coming from
+    headers are left out."""
+    by_line = {}
+    for node in src_tree.walk():
+        by_line.setdefault((src_tree.line_of(node.start) + 1, node.name), node)
+    mapping = {}
+    for node in pre_tree.walk():
+        loc = line_map.source(pre_tree.line_of(node.start))
+        if loc is None or loc[0] != source:
+            continue
+        src = by_line.get((loc[1], node.name))
+        if src is not None:
+            mapping[node] = src
+    return mapping
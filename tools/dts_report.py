@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+dts_report.py
+
+Buffered report writer for auto_fix_dts.py.
+
+The fixer's report used to be appended to with an open/write/close per
+message. A ReportWriter instead collects everything produced during a run
+and writes it with one append when flushed (or when the buffer grows past
+flush_bytes). The append holds an exclusive flock on the report file, so
+several fixers can share one report without interleaving their output.
+
+Two formats are supported:
+
+- 'text': the human-readable report (text() entries; record() is ignored)
+- 'jsonl': one JSON object per line (record() entries; text() is ignored).
+  auto_fix_dts writes a {"type": "file", ...} record per processed file and
+  a {"type": "change", ...} record per reg change, so aggregation over many
+  builds is a streaming parse:
+
+      for line in open('report.jsonl'):
+          rec = json.loads(line)
+
+The target may also be a list, which receives the formatted chunks instead
+of a file, or None to keep everything in the entries list for the caller
+to read (used by batch workers and dts_watch.py, whose output is merged or
+parsed afterwards). A writer without a target never flushes by size;
+flush() then discards the entries.
+"""
+import fcntl
+import json
+import os
+from pathlib import Path
+
+
+FORMATS = ('text', 'jsonl')
+
+
+class ReportWriter:
+    def __init__(self, target=None, fmt='text', flush_bytes=1 << 20):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown report format {fmt!r}")
+        self.target = target
+        self.fmt = fmt
+        self.flush_bytes = flush_bytes
+        self.entries = []
+        self._size = 0
+
+    def text(self, text):
+        """Queue free text (text format only)."""
+        if self.fmt == 'text' and text:
+            self._add(text)
+
+    def record(self, record):
+        """Queue one JSON record (jsonl format only)."""
+        if self.fmt == 'jsonl':
+            self._add(json.dumps(record, sort_keys=True) + '\n')
+
+    def extend(self, entries):
+        """Queue chunks already formatted by another writer of this format."""
+        for entry in entries:
+            self._add(entry)
+
+    def _add(self, chunk):
+        self.entries.append(chunk)
+        self._size += len(chunk)
+        if self.target is not None and self._size >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.entries:
+            return
+        data = ''.join(self.entries)
+        if isinstance(self.target, list):
+            self.target.append(data)
+        elif self.target:
+            append_locked(self.target, data)
+        self.entries = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def append_locked(path, data):
+    """Append data to path with one write under an exclusive flock."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(p, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        buf = data.encode()
+        while buf:
+            buf = buf[os.write(fd, buf):]
+    finally:
+        os.close(fd)
+
+
+def read_records(path):
+    """Yield the records of a jsonl report, skipping blank lines."""
+    with open(path) as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+dts_stats.py
+
+Counters and per-phase timers for auto_fix_dts.py.
+
+A FixStats object is filled in by process_file() and returned on its
+FixResult (result.stats), so callers can collect the numbers without
+parsing any output. It records:
+
+- wall and CPU time per phase (parse, plan, check, edit, dtc, write, ...)
+- every dtc invocation with its duration, exit status and whether it was
+  answered from the dtc cache
+- bytes read and written, and node/change counts
+
+to_dict() gives a JSON-serializable record; merge() folds the stats of
+several files (e.g. from batch workers) into one.
+"""
+import time
+
+
+class _Phase:
+    __slots__ = ('stats', 'name', 'wall', 'cpu')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu)
+
+
+class FixStats:
+    COUNTERS = ('files', 'bytes_read', 'bytes_written', 'nodes', 'unit_nodes', 'changes', 'unresolved')
+
+    def __init__(self):
+        self.phases = {}
+        self.dtc_runs = []
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def phase(self, name):
+        """Context manager timing one phase; repeated phases accumulate."""
+        return _Phase(self, name)
+
+    def add_time(self, name, wall, cpu, calls=1):
+        entry = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        entry['calls'] += calls
+
+    def add_dtc_run(self, seconds, rc, cached=False):
+        self.dtc_runs.append({'seconds': seconds, 'rc': rc, 'cached': cached})
+
+    @property
+    def dtc_invocations(self):
+        """Number of times dtc was actually started (cache hits excluded)."""
+        return sum(1 for r in self.dtc_runs if not r['cached'])
+
+    def merge(self, other):
+        """Add the counters of other (a FixStats or a to_dict() record)."""
+        if isinstance(other, FixStats):
+            other = other.to_dict()
+        for name, entry in other['phases'].items():
+            self.add_time(name, entry['wall'], entry['cpu'], entry['calls'])
+        self.dtc_runs.extend(dict(r) for r in other['dtc_runs'])
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + other['counters'][name])
+        return self
+
+    def to_dict(self):
+        return {
+            'phases': {name: dict(entry) for name, entry in self.phases.items()},
+            'dtc_runs': [dict(r) for r in self.dtc_runs],
+            'dtc_invocations': self.dtc_invocations,
+            'counters': {name: getattr(self, name) for name in self.COUNTERS},
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls().merge(record)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+dts_stream.py
+
+Incremental (streaming) variant of dts_parser.parse() for inputs that
+should not be held in memory as a whole, such as decompiled full board
+trees piped through the fixer on the device.
+
+StreamParser reads a text stream in chunks and yields the same nodes and
+properties parse() would build, as events:
+
+    ('open', node)          after a node's '{'
+    ('prop', node, prop)    a property of node (the node on top of the stack)
+    ('close', node)         after a node's '}' (or at EOF for unclosed nodes)
+    ('delete', node)        /delete-node/ removed node from its parent
+
+Node and Property are dts_parser's classes with absolute offsets into the
+stream. The parser only keeps text from the offset last passed to
+release() onwards, plus the chunk being tokenized. A token is only
+accepted once the buffer holds enough text after it that more input
+cannot change the match. Nodes stay linked to their parents and to the
+children the caller has not pruned, so memory follows what the caller
+keeps rather than the size of the input. The label map (see Label) does
+not keep closed nodes alive either.
+"""
+import weakref
+
+try:
+    from tools import dts_parser
+except ImportError:  # executed as a script from tools/
+    import dts_parser
+
+
+CHUNK = 64 * 1024
+
+# 'other' tokens that open a construct whose end may not have been read yet
+_OPENERS = ('"', "'", '<', '[', '&')
+
+
+class Label:
+    """StreamParser.labels entry. While the labelled node is open it is
+    held here (it is on the parser's stack anyway); when it closes only its
+    own #address-cells/#size-cells are kept, with complete set, and the node
+    is referenced weakly so a subtree the caller dropped can be freed.
+    Property labels are complete at once and have no cells."""
+    __slots__ = ('address_cells', 'size_cells', 'complete', '_node')
+
+    def __init__(self, node=None):
+        self.address_cells = self.size_cells = None
+        self.complete = node is None
+        self._node = node
+
+    def close(self):
+        node = self._node
+        self.address_cells = dts_parser.prop_int(node, '#address-cells')
+        self.size_cells = dts_parser.prop_int(node, '#size-cells')
+        self.complete = True
+        self._node = weakref.ref(node)
+
+    @property
+    def node(self):
+        """The labelled Node; None for a property label or a closed node
+        nothing else keeps."""
+        if self.complete:
+            return self._node() if self._node is not None else None
+        return self._node
+
+    def cells(self):
+        """(#address-cells, #size-cells) declared on the node (either may be None)."""
+        if self.complete:
+            return self.address_cells, self.size_cells
+        return dts_parser.prop_int(self._node, '#address-cells'), dts_parser.prop_int(self._node, '#size-cells')
+
+
+class StreamParser:
+    def __init__(self, fh, chunk_size=CHUNK):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.base = 0          # absolute offset of buf[0]
+        self.pos = 0           # parse position, relative to buf
+        self.keep = 0          # absolute offset the caller still needs
+        self.lines = 0         # newlines in the text dropped from buf
+        self.eof = False
+        self.labels = {}       # label -> Label
+        self.bytes_read = 0
+
+    @property
+    def offset(self):
+        """Absolute parse position."""
+        return self.base + self.pos
+
+    def text(self, start, end):
+        return self.buf[start - self.base:end - self.base]
+
+    def release(self, offset):
+        """The caller no longer needs text before offset."""
+        self.keep = max(self.keep, min(offset, self.offset))
+
+    def line_of(self, offset):
+        """0-based line of an offset that is still buffered."""
+        return self.lines + self.buf.count('\n', 0, offset - self.base)
+
+    def line_start(self, offset):
+        """Offset of the start of offset's line (clamped to the buffer)."""
+        return self.base + self.buf.rfind('\n', 0, offset - self.base) + 1
+
+    def _refill(self):
+        drop = self.keep - self.base
+        if drop > 0:
+            self.lines += self.buf.count('\n', 0, drop)
+            self.buf = self.buf[drop:]
+            self.base += drop
+            self.pos -= drop
+        chunk = self.fh.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return
+        self.bytes_read += len(chunk.encode())
+        self.buf += chunk
+
+    def _final(self, m):
+        """True if more input cannot change the token match m."""
+        end = m.end()
+        if end >= len(self.buf):
+            return False
+        kind = m.lastgroup
+        if kind == 'root':
+            # '/*' of an unterminated comment or the start of a /directive/
+            nxt = self.buf[end]
+            return nxt != '*' and not ('a' <= nxt <= 'z')
+        if kind == 'other':
+            return m.group(kind) not in _OPENERS
+        return True
+
+    def _token(self):
+        match = dts_parser._TOKEN_RE.match
+        while True:
+            m = match(self.buf, self.pos)
+            if self.eof or (m is not None and self._final(m)):
+                return m
+            self._refill()
+
+    def _value_end(self):
+        """Absolute offset of the ';' ending the value starting at pos (or
+        of EOF), consuming it the way parse() does."""
+        match = dts_parser._VALUE_RE.match
+        while True:
+            end = match(self.buf, self.pos).end()
+            if end < len(self.buf) and self.buf[end] == ';':
+                break
+            if not self.eof:
+                self._refill()
+                continue
+            if end >= len(self.buf):
+                break
+            self.pos = end + 1  # stray '<', '[' or quote without its closing pair
+        self.pos = end
+        return self.base + end
+
+    def events(self):
+        stack = []
+        labels = []
+        name = None
+        stmt_start = -1
+        directive = None
+        directive_arg = None
+        closing = None
+        while True:
+            m = self._token()
+            if m is None:
+                break
+            kind = m.lastgroup
+            tok = m.group(kind)
+            tok_start = self.base + m.start(kind)
+            self.pos = m.end()
+            if kind == 'comment' or kind == 'cpp':
+                continue
+
+            if tok == '=' and directive is None:
+                value_start = self.offset
+                value_end = self._value_end()
+                raw = self.text(value_start, value_end)
+                value = raw.strip()
+                vstart = value_start + (len(raw) - len(raw.lstrip()))
+                if self.pos < len(self.buf):
+                    self.pos += 1
+                prop = dts_parser.Property(name, labels, value, stmt_start, self.offset, vstart)
+                if stack:
+                    yield from self._add_prop(stack, prop)
+                labels, name, stmt_start = [], None, -1
+                closing = None
+                continue
+
+            if closing is not None:
+                if tok == ';':
+                    closing.end = self.offset
+                    closing = None
+                    continue
+                closing = None
+
+            if directive is not None:
+                if tok == ';' or (directive == '/include/' and kind == 'string'):
+                    if kind == 'string':
+                        directive_arg = tok
+                    yield from self._finish_directive(stack, directive, directive_arg)
+                    directive = directive_arg = None
+                elif directive_arg is None:
+                    directive_arg = tok
+                continue
+
+            if kind == 'directive':
+                if tok in dts_parser._ARG_DIRECTIVES:
+                    directive = tok
+                continue
+            if kind == 'label':
+                if stmt_start < 0:
+                    stmt_start = tok_start
+                labels.append(tok)
+                continue
+            if kind == 'word' or kind == 'ref' or kind == 'root':
+                if name is None:
+                    name = tok
+                    if stmt_start < 0:
+                        stmt_start = tok_start
+                continue
+            if tok == '{':
+                parent = stack[-1] if stack else None
+                node = dts_parser.Node(name or '', labels, parent, stmt_start if stmt_start >= 0 else tok_start, self.offset)
+                if parent is not None:
+                    parent.children.append(node)
+                for lbl in labels:
+                    self.labels[lbl] = Label(node)
+                stack.append(node)
+                yield ('open', node)
+            elif tok == '}':
+                if stack:
+                    closing = stack.pop()
+                    closing.end = self.offset
+                    self._close_labels(closing)
+                    yield ('close', closing)
+            elif tok == ';' and name is not None:
+                if stack:
+                    yield from self._add_prop(stack, dts_parser.Property(name, labels, None, stmt_start, self.offset, self.offset - 1))
+            labels, name, stmt_start = [], None, -1
+
+        # Tolerate truncated input: close whatever is still open at EOF
+        while stack:
+            node = stack.pop()
+            node.end = self.offset
+            self._close_labels(node)
+            yield ('close', node)
+
+    def _close_labels(self, node):
+        for lbl in node.labels:
+            entry = self.labels.get(lbl)
+            if entry is not None and entry.node is node:
+                entry.close()
+
+    def _add_prop(self, stack, prop):
+        stack[-1].props[prop.name] = prop
+        for lbl in prop.labels:
+            self.labels[lbl] = Label()
+        yield ('prop', stack[-1], prop)
+
+    def _finish_directive(self, stack, directive, arg):
+        if directive == '/delete-property/':
+            if stack and arg:
+                stack[-1].props.pop(arg, None)
+            return
+        if directive != '/delete-node/' or not arg:
+            return
+        if arg.startswith('&'):
+            entry = self.labels.get(arg[1:])
+            target = entry.node if entry is not None else None
+            if target is None:
+                return
+        elif stack:
+            target = stack[-1].child(arg)
+            if target is None:
+                return
+        else:
+            return
+        if target.parent is not None and target in target.parent.children:
+            target.parent.children.remove(target)
+        yield ('delete', target)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+dts_symbols.py
+
+Persistent cross-file index of device-tree labels and references.
+
+For every indexed DTS file (by default overlays/*.dts) the index records:
+
+- defs: labels the file defines (battery: battery@0 { ... })
+- refs: &label and &{/path} references in property values, fragment
+  targets (target = <&i2c1>) and top-level &label { ... } blocks
+- overrides: __overrides__ parameters and the label/property they drive
+- targets: fragment target-path values
+
+Each entry carries the node path and line it came from. The index is kept
+as JSON (default: <dtc cache dir>/symbols.json) with the size, mtime and
+sha256 of every file, so an update only stats unchanged files and only
+reparses files whose content changed. Queries are dictionary lookups on
+maps built once when the index is loaded.
+
+Python API:
+
+    index = SymbolIndex()
+    index.update(collect_files(['overlays']))
+    index.definitions('battery'), index.references('i2c1')
+
+CLI: dts_symbols.py [--index FILE] [--dir DIR ...] COMMAND
+     update | defs LABEL | refs LABEL | overrides [NAME] | targets [PATH] | unresolved
+Every command refreshes the index first. The index may be shared by
+several directory sets, so only `update` forgets indexed files that are
+not in the given directories (or no longer exist).
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+try:
+    from tools import dtc_cache, dts_parser, file_hash
+except ImportError:  # executed as a script from tools/
+    import dtc_cache
+    import dts_parser
+    import file_hash
+
+
+INDEX_VERSION = 2
+DEFAULT_DIR = Path(__file__).resolve().parent.parent / 'overlays'
+
+
+def default_index_path():
+    return dtc_cache.default_cache_dir() / 'symbols.json'
+
+
+def extract(text):
+    """Symbol records for one DTS text: a dict with defs, refs, overrides
+    and targets lists."""
+    tree = dts_parser.parse(text)
+    defs, refs, overrides, targets = [], [], [], []
+    for root in tree.roots:
+        if root.name.startswith('&'):
+            refs.append({'ref': root.name, 'path': root.name, 'prop': None, 'line': tree.line_of(root.start) + 1})
+    for node in tree.walk():
+        path = node.path
+        for label in node.labels:
+            defs.append({'label': label, 'path': path, 'line': tree.line_of(node.start) + 1})
+        if node.name == '__overrides__':
+            for prop in node.props.values():
+                overrides.extend(_override_records(prop, tree))
+            continue
+        for prop in node.props.values():
+            line = tree.line_of(prop.start) + 1
+            for label in prop.labels:
+                defs.append({'label': label, 'path': f"{path}:{prop.name}", 'line': line})
+            if prop.name == 'target-path' and prop.value:
+                targets.append({'target': prop.value.strip('"'), 'path': path, 'line': line})
+            for ref in dts_parser.value_refs(prop.value):
+                refs.append({'ref': ref, 'path': path, 'prop': prop.name, 'line': line})
+    return {'defs': defs, 'refs': refs, 'overrides': overrides, 'targets': targets}
+
+
+def _override_records(prop, tree):
+    """__overrides__ entries: name = <&label>,"property[:offset]", ..."""
+    records = []
+    line = tree.line_of(prop.start) + 1
+    current = None
+    for part in (prop.value or '').split(','):
+        part = part.strip()
+        refs = dts_parser.value_refs(part)
+        if part.startswith('<') and refs:
+            current = refs[0]
+        elif part.startswith('"') and current is not None:
+            records.append({'name': prop.name, 'ref': current, 'prop': part.strip('"'), 'line': line})
+    if not records:
+        records.append({'name': prop.name, 'ref': None, 'prop': None, 'line': line})
+    return records
+
+
+def collect_files(paths):
+    """*.dts files of the directories in paths plus the files themselves."""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(str(f.resolve()) for f in sorted(p.glob('*.dts')) if not f.name.endswith('.fixed.dts'))
+        elif p.exists():
+            files.append(str(p.resolve()))
+    return list(dict.fromkeys(files))
+
+
+class SymbolIndex:
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_index_path()
+        self.files = {}
+        self.parsed = 0
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get('version') == INDEX_VERSION:
+                self.files = data['files']
+        except (OSError, ValueError, KeyError):
+            self.files = {}
+        self._maps = None
+
+    def update(self, files, prune=False):
+        """Reindex files whose content hash changed; files whose size and
+        mtime are unchanged are not read. With prune, forget indexed files
+        that are not in files. Returns True if anything changed (and the
+        index was saved)."""
+        changed = False
+        files = [str(f) for f in files]
+        hasher = file_hash.Hasher(self.files)
+        for f in files:
+            stat = hasher.entry(f)
+            if stat is None:
+                continue
+            entry = self.files.get(f)
+            if entry is not None and entry['sha256'] == stat['sha256']:
+                if entry['stamp'] != stat['stamp']:
+                    entry['stamp'] = stat['stamp']
+                    changed = True
+                continue
+            try:
+                text = Path(f).read_text(errors='replace')
+            except OSError:
+                continue
+            self.parsed += 1
+            self.files[f] = dict(extract(text), sha256=stat['sha256'], stamp=stat['stamp'])
+            changed = True
+        if prune:
+            keep = set(files)
+            for f in [f for f in self.files if f not in keep]:
+                del self.files[f]
+                changed = True
+        if changed:
+            self._maps = None
+            self.save()
+        return changed
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({'version': INDEX_VERSION, 'files': self.files}, sort_keys=True))
+        os.replace(tmp, self.path)
+
+    def _lookup(self):
+        if self._maps is None:
+            defs, refs, overrides, targets = {}, {}, {}, {}
+            for f, entry in self.files.items():
+                for d in entry['defs']:
+                    defs.setdefault(d['label'], []).append(dict(d, file=f))
+                for r in entry['refs']:
+                    refs.setdefault(r['ref'], []).append(dict(r, file=f))
+                for o in entry['overrides']:
+                    overrides.setdefault(o['name'], []).append(dict(o, file=f))
+                for t in entry['targets']:
+                    targets.setdefault(t['target'], []).append(dict(t, file=f))
+            self._maps = (defs, refs, overrides, targets)
+        return self._maps
+
+    def definitions(self, label):
+        return self._lookup()[0].get(label.lstrip('&'), [])
+
+    def references(self, ref):
+        """References to a label (with or without '&') or an &{/path}."""
+        if not ref.startswith('&'):
+            ref = '&' + ref
+        return self._lookup()[1].get(ref, [])
+
+    def overrides(self, name=None):
+        maps = self._lookup()[2]
+        if name is not None:
+            return maps.get(name, [])
+        return [o for entries in maps.values() for o in entries]
+
+    def targets(self, path=None):
+        maps = self._lookup()[3]
+        if path is not None:
+            return maps.get(path, [])
+        return [t for entries in maps.values() for t in entries]
+
+    def unresolved(self):
+        """&label references that no indexed file defines (usually labels
+        of the base board tree)."""
+        defs, refs = self._lookup()[:2]
+        return {ref: entries for ref, entries in refs.items() if not ref.startswith('&{') and ref[1:] not in defs}
+
+
+def _fmt(entry):
+    return f"{entry['file']}:{entry['line']}"
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Query the cross-overlay label and phandle index')
+    p.add_argument('--index', default=None, help='Index file (default: <dtc cache dir>/symbols.json)')
+    p.add_argument('--dir', '-d', action='append', default=[], help=f"DTS directories or files to index (default: {DEFAULT_DIR})")
+    sub = p.add_subparsers(dest='command', required=True)
+    sub.add_parser('update', help='Refresh the index')
+    sub.add_parser('defs', help='Where a label is defined').add_argument('label')
+    sub.add_parser('refs', help='Where a label or &{/path} is referenced').add_argument('label')
+    sub.add_parser('overrides', help='__overrides__ parameters').add_argument('name', nargs='?')
+    sub.add_parser('targets', help='Fragment target-path values').add_argument('path', nargs='?')
+    sub.add_parser('unresolved', help='References with no definition in the indexed files')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    index = SymbolIndex(args.index)
+    index.update(collect_files(args.dir or [DEFAULT_DIR]), prune=args.command == 'update')
+    if args.command == 'update':
+        print(f"{len(index.files)} files indexed, {index.parsed} reparsed")
+        return 0
+    if args.command == 'defs':
+        found = index.definitions(args.label)
+        for d in found:
+            print(f"{_fmt(d)}: {d['label']}: {d['path']}")
+    elif args.command == 'refs':
+        found = index.references(args.label)
+        for r in found:
+            print(f"{_fmt(r)}: {r['path']}{':' + r['prop'] if r['prop'] else ''} -> {r['ref']}")
+    elif args.command == 'overrides':
+        found = index.overrides(args.name)
+        for o in found:
+            print(f"{_fmt(o)}: {o['name']} -> {o['ref']} {o['prop'] or ''}".rstrip())
+    elif args.command == 'targets':
+        found = index.targets(args.path)
+        for t in found:
+            print(f"{_fmt(t)}: {t['path']} -> {t['target']}")
+    else:
+        found = index.unresolved()
+        for ref, entries in sorted(found.items()):
+            print(f"{ref}: {', '.join(_fmt(e) for e in entries)}")
+    return 0 if found else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+dts_watch.py
+
+Long-running watch mode: re-validates overlays as they are saved.
+
+The overlay directories, the include directories (-I, plus
+tools/dtc_stub_includes) and the directories of every header an overlay
+was found to depend on (e.g. dt-bindings/gpio/) are watched with inotify,
+or by polling file stamps where inotify is unavailable (--poll). New
+dependency directories are added to the watch after each check. Bursts of events (editors
+often write, rename and touch in quick succession) are collected until
+nothing happens for --debounce seconds, and then only the affected
+overlays are checked:
+
+- overlays that were saved themselves
+- overlays whose #include / /include/ dependencies (taken from cpp's line
+  markers and the parsed tree) contain a changed header
+
+Each check is auto_fix_dts.process_file() run in this process with warm
+caches: modules are imported once, dtc and cpp results are kept in memory
+in front of the on-disk caches, and every overlay's parsed tree, hash and
+dependency set are kept between checks. A save that does not change a
+file's content (or its headers) is answered without re-checking. With
+--build DIR a successful check is followed by an incremental .dtbo build
+(see build_overlays.py).
+
+Usage: dts_watch.py [--dir overlays] [-I DIR ...] [--apply] [--build DIR]
+                    [--debounce 0.2] [--poll] [--once]
+"""
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+try:
+    from tools import auto_fix_dts, build_overlays, dtc_cache, dts_parser, dts_preprocess, dts_report
+except ImportError:  # executed as a script from tools/
+    import auto_fix_dts
+    import build_overlays
+    import dtc_cache
+    import dts_parser
+    import dts_preprocess
+    import dts_report
+
+
+DEFAULT_DIR = Path(__file__).resolve().parent.parent / 'overlays'
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+
+def _is_source(path):
+    name = os.path.basename(path)
+    return not name.startswith('.') and not name.endswith(('.fixed.dts', '.orig', '.tmp', '~'))
+
+
+class InotifyWatcher:
+    """Directory watcher on inotify(7) through libc; raises OSError when
+    inotify is not available."""
+
+    def __init__(self, dirs):
+        libc_name = ctypes.util.find_library('c')
+        try:
+            self.libc = ctypes.CDLL(libc_name, use_errno=True)
+            init = self.libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify not available: {e}")
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        try:
+            for d in dirs:
+                self._add_watch(d)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, d):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(d), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {d}")
+        self.dirs[wd] = str(d)
+
+    def add(self, dirs):
+        """Also watch dirs; directories that cannot be watched are skipped."""
+        watched = set(self.dirs.values())
+        for d in dirs:
+            if str(d) not in watched:
+                try:
+                    self._add_watch(d)
+                except OSError:
+                    pass
+
+    def read(self, timeout):
+        """Paths changed within timeout seconds (empty set on timeout)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if name and wd in self.dirs:
+                changed.add(os.path.join(self.dirs[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher:
+    """Fallback watcher comparing the (size, mtime) of the files in dirs
+    every interval seconds."""
+
+    def __init__(self, dirs, interval=0.5):
+        self.dirs = [str(d) for d in dirs]
+        self.interval = interval
+        self.stamps = self._scan()
+
+    def add(self, dirs):
+        """Also watch dirs (their current files are not reported as changed)."""
+        new = [str(d) for d in dirs if str(d) not in self.dirs]
+        if new:
+            self.dirs.extend(new)
+            self.stamps.update(self._scan(new))
+
+    def _scan(self, dirs=None):
+        stamps = {}
+        for d in self.dirs if dirs is None else dirs:
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                stamps[entry.path] = (st.st_size, st.st_mtime_ns)
+        return stamps
+
+    def read(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            stamps = self._scan()
+            changed = {p for p in stamps.keys() | self.stamps.keys() if stamps.get(p) != self.stamps.get(p)}
+            self.stamps = stamps
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def make_watcher(dirs, poll=False, interval=0.5):
+    if not poll:
+        try:
+            return InotifyWatcher(dirs)
+        except OSError:
+            pass
+    return PollWatcher(dirs, interval)
+
+
+class Overlay:
+    """What is kept in memory for one overlay between checks."""
+    __slots__ = ('path', 'sha', 'tree', 'deps', 'stamps', 'result')
+
+    def __init__(self, path):
+        self.path = path
+        self.sha = None
+        self.tree = None
+        self.deps = ()
+        self.stamps = {}
+        self.result = None
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Session:
+    """Warm state shared by every check of a watch run."""
+
+    def __init__(self, dirs, cpp_inc=(), apply=False, build_dir=None, cache_dir=None, use_cache=True, dtc_inc=None):
+        self.dirs = [Path(d).resolve() for d in dirs]
+        self.cpp_inc = [str(Path(d).resolve()) for d in cpp_inc]
+        self.apply = apply
+        self.build_dir = build_dir
+        self.dtc_inc = dtc_inc
+        root = Path(cache_dir) if cache_dir else dtc_cache.default_cache_dir()
+        self.cache = dtc_cache.MemoryCache(root) if use_cache else None
+        self.cpp_cache = dts_preprocess.PreprocessCache(store=dtc_cache.MemoryCache(root / 'cpp'))
+        self.overlays = {}
+        self.checks = 0
+
+    def watch_dirs(self):
+        """Overlay and include directories plus the directory of every
+        dependency recorded so far (headers are often in subdirectories
+        such as dt-bindings/gpio/)."""
+        dirs = list(self.dirs) + [Path(d) for d in self.cpp_inc] + [dts_preprocess.STUB_INCLUDES]
+        for overlay in self.overlays.values():
+            dirs.extend(Path(dep).parent for dep in overlay.deps)
+        return [str(d) for d in dict.fromkeys(dirs) if d.is_dir()]
+
+    def sources(self):
+        return auto_fix_dts.collect_dts_files(dirs=[str(d) for d in self.dirs])
+
+    def affected(self, changed):
+        """Overlays to re-check for a set of changed paths."""
+        changed = {str(Path(p).resolve()) for p in changed if _is_source(p)}
+        sources = {str(Path(s).resolve()) for s in self.sources()}
+        out = sources & changed
+        for path, overlay in self.overlays.items():
+            if path in sources and changed.intersection(overlay.deps):
+                out.add(path)
+        # forget overlays that were deleted or renamed away
+        for path in [p for p in self.overlays if p not in sources]:
+            del self.overlays[path]
+        return sorted(out)
+
+    def _deps(self, path, tree, record):
+        dirs = dts_preprocess.include_dirs_for(path, self.cpp_inc)
+        deps = set(record.get('deps') or ())
+        for inc in tree.includes:
+            for d in dirs:
+                candidate = os.path.join(d, inc)
+                if os.path.exists(candidate):
+                    deps.add(str(Path(candidate).resolve()))
+                    break
+        return sorted(deps)
+
+    def check(self, path):
+        """Check one overlay; returns a result dict (skipped=True when
+        neither the overlay nor its dependencies changed)."""
+        t0 = time.perf_counter()
+        path = str(Path(path).resolve())
+        overlay = self.overlays.get(path) or Overlay(path)
+        self.overlays[path] = overlay
+        try:
+            data = Path(path).read_bytes()
+        except OSError as e:
+            return {'file': path, 'status': 'error', 'error': str(e), 'seconds': time.perf_counter() - t0}
+        sha = hashlib.sha256(data).hexdigest()
+        if (sha == overlay.sha and overlay.result is not None
+                and all(_stamp(dep) == stamp for dep, stamp in overlay.stamps.items())):
+            return dict(overlay.result, skipped=True, seconds=time.perf_counter() - t0)
+        self.checks += 1
+        report = dts_report.ReportWriter(None, 'jsonl')
+        try:
+            result = auto_fix_dts.process_file(path, apply=self.apply, report=report, dtc_inc=self.dtc_inc,
+                                               cache=self.cache, cpp_inc=self.cpp_inc, cpp_cache=self.cpp_cache)
+            ok, error = result.ok, None
+        except (Exception, SystemExit) as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        records = [json.loads(line) for line in report.entries]
+        record = next((r for r in records if r.get('type') == 'file'), {})
+        if self.apply and ok:
+            # the fix rewrote the file; remember what is on disk now
+            data = Path(path).read_bytes()
+            sha = hashlib.sha256(data).hexdigest()
+        overlay.sha = sha
+        overlay.tree = dts_parser.parse(data.decode(errors='replace'))
+        overlay.deps = self._deps(path, overlay.tree, record)
+        overlay.stamps = {dep: _stamp(dep) for dep in overlay.deps}
+        out = {'file': path, 'status': record.get('status', 'error'), 'ok': ok, 'error': error,
+               'changes': record.get('changes', 0), 'unresolved': len(record.get('unresolved') or ()),
+               'dtc': record.get('dtc'), 'skipped': False}
+        if ok and self.build_dir:
+            built = build_overlays.build([path], self.build_dir, flags=None, cpp_inc=self.cpp_inc)
+            out['build'] = built[0][1:]
+        overlay.result = {k: v for k, v in out.items() if k != 'seconds'}
+        out['seconds'] = time.perf_counter() - t0
+        return out
+
+    def check_all(self, paths=None):
+        return [self.check(p) for p in (self.sources() if paths is None else paths)]
+
+
+def format_result(r):
+    name = Path(r['file']).name
+    if r.get('error'):
+        return f"{name}: FAILED {r['error']}"
+    parts = [r['status']]
+    if r.get('changes'):
+        parts.append(f"{r['changes']} changes")
+    if r.get('unresolved'):
+        parts.append(f"{r['unresolved']} unresolved")
+    dtc = r.get('dtc')
+    if dtc:
+        parts.append(f"dtc rc={dtc['rc']}{' (cached)' if dtc.get('cached') else ''}")
+    if r.get('build'):
+        status, sha, msg = r['build']
+        parts.append(f"dtbo {status}" + (f": {msg}" if status == 'failed' else ''))
+    if r.get('skipped'):
+        parts.append('unchanged')
+    return f"{name}: {', '.join(parts)} in {r['seconds'] * 1000:.1f} ms"
+
+
+def collect_burst(watcher, debounce, timeout=None):
+    """Block until something changes (or timeout), then keep collecting
+    until the watcher has been quiet for debounce seconds."""
+    changed = watcher.read(timeout if timeout is not None else 3600)
+    if not changed:
+        return changed
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+
+def watch(session, watcher, debounce=0.2, out=sys.stdout, max_bursts=None):
+    """Check affected overlays after every burst of changes."""
+    bursts = 0
+    watcher.add(session.watch_dirs())
+    while max_bursts is None or bursts < max_bursts:
+        changed = collect_burst(watcher, debounce)
+        if not changed:
+            continue
+        bursts += 1
+        for r in session.check_all(session.affected(changed)):
+            print(format_result(r), file=out, flush=True)
+        # checks may have found headers in directories not watched yet
+        watcher.add(session.watch_dirs())
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Re-validate overlays whenever they or their headers are saved')
+    p.add_argument('--dir', '-d', action='append', default=[], help=f"Overlay directory to watch (default: {DEFAULT_DIR})")
+    p.add_argument('--cpp-include', '-I', action='append', default=[], help='Include directory to watch and pass to cpp')
+    p.add_argument('--dtc-inc', help='Pass-through DTC -i include flags (as a single string)')
+    p.add_argument('--apply', action='store_true', help='Apply fixes in place (default: write .fixed.dts proposals)')
+    p.add_argument('--build', metavar='DIR', default=None, help='Build .dtbo files into DIR after each successful check')
+    p.add_argument('--debounce', type=float, default=0.2, help='Quiet time in seconds that ends a burst of saves')
+    p.add_argument('--poll', action='store_true', help='Poll file stamps instead of using inotify')
+    p.add_argument('--interval', type=float, default=0.5, help='Polling interval in seconds')
+    p.add_argument('--cache-dir', default=None, help='dtc/cpp cache directory (default: ~/.cache/uconsole-dtc)')
+    p.add_argument('--no-cache', action='store_true', help='Do not use cached dtc results')
+    p.add_argument('--once', action='store_true', help='Check every overlay once and exit')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    session = Session(args.dir or [DEFAULT_DIR], args.cpp_include, args.apply, args.build, args.cache_dir,
+                      not args.no_cache, args.dtc_inc)
+    results = session.check_all()
+    for r in results:
+        print(format_result(r), flush=True)
+    if args.once:
+        return 1 if any(not r.get('ok') for r in results) else 0
+    watcher = make_watcher(session.watch_dirs(), args.poll, args.interval)
+    print(f"watching {', '.join(session.watch_dirs())} ({type(watcher).__name__})", flush=True)
+    try:
+        watch(session, watcher, args.debounce)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
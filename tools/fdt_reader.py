@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+fdt_reader.py
+
+Pure-Python reader for flattened device trees (.dtb/.dtbo) and the
+reg_format check on compiled blobs.
+
+A file is mapped with mmap and read through a memoryview: the structure
+block is walked once with struct.unpack_from, and properties only record
+the offset and length of their value, so nothing but node and property
+names is ever copied out of the mapping. Property names are decoded once
+per strings-table offset.
+
+Fdt exposes the node tree plus the overlay metadata that dtc -@ emits:
+
+- symbols: __symbols__ (label -> path)
+- fixups: __fixups__ (label -> [(path, property, offset)]), references to
+  labels outside the overlay
+- local_fixups: __local_fixups__ ({(path, property): [offsets]}), phandle
+  cells that point inside the overlay
+
+check_reg_format() runs the same reg/#address-cells check as dts_check.py
+does on sources (the walk is shared), so a directory of .dtbo files from
+the EFI partition can be validated in one pass without starting dtc:
+
+    fdt_reader.py /boot/efi/overlays [--base bcm2712-rpi-cm5.dtb]
+
+--base resolves overlay targets (&label and target-path) against a board
+blob's __symbols__ and nodes instead of assuming dtc's default cells.
+Exit status: 0 if every blob is valid, 1 on reg_format mismatches, 2 if a
+file is not a valid FDT.
+"""
+import argparse
+import mmap
+import struct
+import sys
+from pathlib import Path
+
+try:
+    from tools import dts_check
+except ImportError:  # executed as a script from tools/
+    import dts_check
+
+
+FDT_MAGIC = 0xd00dfeed
+FDT_BEGIN_NODE = 1
+FDT_END_NODE = 2
+FDT_PROP = 3
+FDT_NOP = 4
+FDT_END = 9
+HEADER = struct.Struct('>10I')
+
+
+class FdtError(ValueError):
+    pass
+
+
+class FdtProperty:
+    """A property; the value stays in the mapping (see Fdt.value())."""
+    __slots__ = ('name', 'offset', 'length')
+
+    def __init__(self, name, offset, length):
+        self.name = name
+        self.offset = offset
+        self.length = length
+
+    def __repr__(self):
+        return f"FdtProperty({self.name!r}, {self.length} bytes)"
+
+
+class FdtNode:
+    __slots__ = ('name', 'parent', 'children', 'props')
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.props = {}
+
+    @property
+    def path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return '/' + '/'.join(reversed(parts))
+
+    def child(self, name):
+        for c in self.children:
+            if c.name == name:
+                return c
+        return None
+
+    def iter(self):
+        """Yield this node and all of its descendants in blob order."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def __repr__(self):
+        return f"FdtNode({self.path!r})"
+
+
+class Fdt:
+    """A parsed flattened device tree over a bytes, bytearray or mmap buffer."""
+
+    def __init__(self, buf, name=None):
+        self.name = name
+        self._buf = buf
+        self._mmap = None
+        self._phandles = None
+        if len(buf) < HEADER.size:
+            raise FdtError('truncated header')
+        (magic, self.totalsize, self.off_struct, self.off_strings, self.off_rsvmap, self.version,
+         self.last_comp_version, self.boot_cpuid, self.size_strings, self.size_struct) = HEADER.unpack_from(buf, 0)
+        if magic != FDT_MAGIC:
+            raise FdtError(f"bad magic 0x{magic:08x}")
+        if self.totalsize > len(buf) or self.off_strings + self.size_strings > self.totalsize:
+            raise FdtError('blob is truncated')
+        if self.version < 17:
+            # size_struct only exists from v17 on
+            self.size_struct = self.off_strings - self.off_struct
+        if self.off_struct + self.size_struct > self.totalsize:
+            raise FdtError('structure block is truncated')
+        self._mv = memoryview(buf)
+        try:
+            self.root = self._parse()
+        except struct.error as e:
+            self._mv.release()
+            raise FdtError(f"structure block is truncated: {e}")
+        except Exception:
+            self._mv.release()
+            raise
+
+    @classmethod
+    def open(cls, path):
+        """Map path read-only and parse it; use as a context manager."""
+        with open(path, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            fdt = cls(mm, str(path))
+        except Exception:
+            mm.close()
+            raise
+        fdt._mmap = mm
+        return fdt
+
+    def close(self):
+        """Release the mapping. Memoryviews from value() must be released first."""
+        self._mv.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _cstr(self, start, limit):
+        end = self._buf.find(b'\0', start, limit)
+        if end < 0:
+            raise FdtError(f"unterminated string at offset {start}")
+        return bytes(self._mv[start:end]).decode('utf-8', 'replace'), end
+
+    def _parse(self):
+        unpack = struct.unpack_from
+        buf = self._buf
+        off = self.off_struct
+        end = off + self.size_struct
+        strings = self.off_strings
+        str_end = strings + self.size_strings
+        names = {}
+        root = None
+        node = None
+        while off < end:
+            token, = unpack('>I', buf, off)
+            off += 4
+            if token == FDT_BEGIN_NODE:
+                name, name_end = self._cstr(off, end)
+                off = (name_end + 4) & ~3
+                child = FdtNode(name, node)
+                if node is None:
+                    if root is not None:
+                        raise FdtError('more than one root node')
+                    root = child
+                else:
+                    node.children.append(child)
+                node = child
+            elif token == FDT_END_NODE:
+                if node is None:
+                    raise FdtError(f"unbalanced END_NODE at offset {off - 4}")
+                node = node.parent
+            elif token == FDT_PROP:
+                length, nameoff = unpack('>II', buf, off)
+                off += 8
+                if node is None or off + length > end:
+                    raise FdtError(f"bad property at offset {off - 12}")
+                name = names.get(nameoff)
+                if name is None:
+                    name = names[nameoff] = self._cstr(strings + nameoff, str_end)[0]
+                node.props[name] = FdtProperty(name, off, length)
+                off = (off + length + 3) & ~3
+            elif token == FDT_NOP:
+                continue
+            elif token == FDT_END:
+                break
+            else:
+                raise FdtError(f"unknown token 0x{token:x} at offset {off - 4}")
+        if root is None or node is not None:
+            raise FdtError('structure block is not a single closed tree')
+        return root
+
+    # values
+
+    def value(self, prop):
+        """The raw value as a memoryview into the blob (no copy)."""
+        return self._mv[prop.offset:prop.offset + prop.length]
+
+    def u32(self, prop, index=0):
+        if prop.length < 4 * (index + 1):
+            return None
+        return struct.unpack_from('>I', self._buf, prop.offset + 4 * index)[0]
+
+    def cells(self, prop):
+        return list(struct.unpack_from(f">{prop.length // 4}I", self._buf, prop.offset))
+
+    def string(self, prop):
+        return self.strings(prop)[0] if prop.length else ''
+
+    def strings(self, prop):
+        raw = bytes(self.value(prop))
+        return [s.decode('utf-8', 'replace') for s in raw.rstrip(b'\0').split(b'\0')] if raw else []
+
+    def prop_u32(self, node, name):
+        prop = node.props.get(name)
+        return None if prop is None else self.u32(prop)
+
+    # tree
+
+    def walk(self):
+        return self.root.iter()
+
+    def node(self, path):
+        """The node at an absolute path, or None."""
+        node = self.root
+        for part in path.strip('/').split('/'):
+            if not part:
+                continue
+            node = node.child(part)
+            if node is None:
+                return None
+        return node
+
+    @property
+    def phandles(self):
+        if self._phandles is None:
+            self._phandles = {}
+            for node in self.walk():
+                for name in ('phandle', 'linux,phandle'):
+                    ph = self.prop_u32(node, name)
+                    if ph is not None:
+                        self._phandles.setdefault(ph, node)
+        return self._phandles
+
+    def is_overlay(self):
+        return any(c.name == '__fixups__' or c.child('__overlay__') is not None for c in self.root.children)
+
+    # overlay metadata
+
+    @property
+    def symbols(self):
+        node = self.root.child('__symbols__')
+        return {} if node is None else {name: self.string(p) for name, p in node.props.items()}
+
+    @property
+    def fixups(self):
+        node = self.root.child('__fixups__')
+        result = {}
+        if node is None:
+            return result
+        for label, prop in node.props.items():
+            refs = []
+            for ref in self.strings(prop):
+                path, _, rest = ref.partition(':')
+                name, _, offset = rest.rpartition(':')
+                refs.append((path, name, int(offset) if offset.isdigit() else None))
+            result[label] = refs
+        return result
+
+    @property
+    def local_fixups(self):
+        node = self.root.child('__local_fixups__')
+        result = {}
+        if node is None:
+            return result
+        stack = [(node, '')]
+        while stack:
+            fix, path = stack.pop()
+            for name, prop in fix.props.items():
+                result[(path or '/', name)] = self.cells(prop)
+            for child in fix.children:
+                stack.append((child, f"{path}/{child.name}"))
+        return result
+
+
+def own_cells(fdt, node):
+    return fdt.prop_u32(node, '#address-cells'), fdt.prop_u32(node, '#size-cells')
+
+
+def target_key(fdt, fragment, fixups=None):
+    """'&label', '/path' or a local FdtNode that an overlay fragment targets."""
+    fixups = fdt.fixups if fixups is None else fixups
+    target = fragment.props.get('target')
+    if target is not None:
+        where = (fragment.path, 'target', 0)
+        for label, refs in fixups.items():
+            if where in refs:
+                return '&' + label
+        local = fdt.phandles.get(fdt.u32(target))
+        if local is not None:
+            return local
+        return None
+    target_path = fragment.props.get('target-path')
+    if target_path is not None:
+        return fdt.string(target_path)
+    return None
+
+
+def target_cells_from_base(base):
+    """A target_cells mapping ('&label' and '/path' -> cells) built from a
+    board Fdt, for checking overlays that target it."""
+    cells = {}
+    for node in base.walk():
+        addr, size = own_cells(base, node)
+        if addr is not None or size is not None:
+            cells[node.path] = (dts_check.DEFAULT_ADDRESS_CELLS if addr is None else addr,
+                                dts_check.DEFAULT_SIZE_CELLS if size is None else size)
+    for label, path in base.symbols.items():
+        if path in cells:
+            cells['&' + label] = cells[path]
+    return cells
+
+
+def check_reg_format(fdt, target_cells=None):
+    """dts_check.check_reg_format() for a compiled blob: a RegMismatch for
+    every reg whose length is not a multiple of the inherited cells."""
+    fixups = fdt.fixups
+    skip = {'__symbols__', '__fixups__', '__local_fixups__'}
+    roots = [fdt.root]
+
+    def cells_of(node):
+        return own_cells(fdt, node)
+
+    def reg_cells_of(node):
+        reg = node.props.get('reg')
+        return None if reg is None else reg.length // 4
+
+    def inherit(node):
+        if node.name != '__overlay__' or node.parent is None:
+            return None
+        key = target_key(fdt, node.parent, fixups)
+        if isinstance(key, FdtNode):
+            addr, size = own_cells(fdt, key)
+            if addr is None and size is None:
+                return None
+            return (dts_check.DEFAULT_ADDRESS_CELLS if addr is None else addr,
+                    dts_check.DEFAULT_SIZE_CELLS if size is None else size)
+        if key is not None and target_cells:
+            return target_cells.get(key)
+        return None
+
+    return [mm for mm in dts_check.walk_reg_format(roots, cells_of, reg_cells_of, inherit)
+            if mm.path.split('/')[1] not in skip]
+
+
+def collect_blobs(paths):
+    """Expand directories to their *.dtb/*.dtbo files."""
+    blobs = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            blobs.extend(sorted(f for f in p.iterdir() if f.suffix in ('.dtb', '.dtbo')))
+        else:
+            blobs.append(p)
+    return blobs
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Validate .dtb/.dtbo files without dtc')
+    p.add_argument('paths', nargs='+', help='Blob files or directories of *.dtb/*.dtbo')
+    p.add_argument('--base', default=None, help='Board .dtb used to resolve overlay targets')
+    p.add_argument('--symbols', action='store_true', help='Also list each blob\'s __symbols__ and __fixups__')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    target_cells = None
+    if args.base:
+        with Fdt.open(args.base) as base:
+            target_cells = target_cells_from_base(base)
+    status = 0
+    blobs = collect_blobs(args.paths)
+    for path in blobs:
+        try:
+            fdt = Fdt.open(path)
+        except (OSError, ValueError) as e:
+            print(f"{path}: ERROR: {e}")
+            status = 2
+            continue
+        with fdt:
+            mismatches = check_reg_format(fdt, target_cells)
+            for mm in mismatches:
+                note = ' (assumed cells)' if mm.assumed else ''
+                print(f"{path}: Warning (reg_format): {mm.message()}{note}")
+            if mismatches and status == 0:
+                status = 1
+            if args.symbols:
+                for label, target in sorted(fdt.symbols.items()):
+                    print(f"{path}: symbol {label} = {target}")
+                for label, refs in sorted(fdt.fixups.items()):
+                    print(f"{path}: fixup {label} -> {', '.join(f'{p}:{n}:{o}' for p, n, o in refs)}")
+    print(f"{len(blobs)} blobs checked")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
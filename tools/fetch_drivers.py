@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+fetch_drivers.py
+
+Concurrent, content-addressed fetcher for the GPL driver sources that
+scripts/fetch-drivers.sh downloads into extracted-drivers/.
+
+The files come from a manifest (tools/driver_manifest.json) listing, per
+driver directory, the upstream tree, the paths to fetch (with fallbacks)
+and the Makefile to generate. Downloads run in a bounded thread pool
+(--jobs) and land in a content-addressed store keyed by sha256 (by default
+~/.cache/uconsole-drivers, or $UCONSOLE_DRIVER_STORE):
+
+    <store>/objects/<sha[:2]>/<sha>     read-only file contents
+    <store>/index.json                  <tree url>@<ref>:<path> -> sha256
+
+Files are hardlinked (copied across filesystems) from the store into the
+output directory. A file whose source is already in the index, or that
+carries a sha256 pin in the manifest, is linked without touching the
+network, so a warm re-fetch only stats files; --refresh re-resolves the
+moving branch refs. Downloaded content is checked against pins. A file
+that patch_engine.py patched from the same store object (its pre- and
+post-image hashes are in <out-dir>/.patch-state.json) is kept as is, so
+the patches are not undone and reapplied on every run.
+
+--mirror replaces the upstream URLs with a mirror laid out as
+<mirror>/<tree>/<ref>/<path>; it may be a directory, a file:// URL or an
+http(s) URL. --export-mirror DIR writes such a mirror from the store, for
+air-gapped builders and tests.
+
+Usage: fetch_drivers.py [--out-dir extracted-drivers] [--manifest FILE]
+                        [--store DIR] [--mirror DIR|URL] [--jobs N]
+                        [--refresh] [--offline] [--clean]
+                        [--export-mirror DIR]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from tools import file_hash, patch_engine
+except ImportError:  # executed as a script from tools/
+    import file_hash
+    import patch_engine
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MANIFEST = Path(__file__).resolve().parent / 'driver_manifest.json'
+DEFAULT_OUT_DIR = REPO_ROOT / 'extracted-drivers'
+MANIFEST_VERSION = 1
+INDEX_VERSION = 1
+CHUNK = 64 * 1024
+TIMEOUT = 60
+
+MAKEFILE_TAIL = """KERNELDIR ?= /lib/modules/$(shell uname -r)/build
+PWD := $(shell pwd)
+
+all:
+\t$(MAKE) -C $(KERNELDIR) M=$(PWD) modules
+
+clean:
+\t$(MAKE) -C $(KERNELDIR) M=$(PWD) clean
+"""
+
+
+def default_store_dir():
+    env = os.environ.get('UCONSOLE_DRIVER_STORE')
+    if env:
+        return Path(env)
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'uconsole-drivers'
+
+
+def _write_atomic(path, text):
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+class Store:
+    """Content-addressed file store with an index of fetched sources."""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else default_store_dir()
+        self.objects = self.root / 'objects'
+        self.index_path = self.root / 'index.json'
+        self.lock = threading.Lock()
+        self.index = {}
+        self.dirty = False
+        try:
+            data = json.loads(self.index_path.read_text())
+            if data.get('version') == INDEX_VERSION:
+                self.index = data['sources']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def path(self, sha):
+        return self.objects / sha[:2] / sha
+
+    def has(self, sha):
+        return self.path(sha).is_file()
+
+    def add(self, fh):
+        """Copy a binary stream into the store; returns its sha256."""
+        h = hashlib.sha256()
+        tmp_dir = self.root / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp = tmp_dir / f"{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp, 'wb') as out:
+                for chunk in iter(lambda: fh.read(CHUNK), b''):
+                    h.update(chunk)
+                    out.write(chunk)
+            sha = h.hexdigest()
+            dest = self.path(sha)
+            if not dest.exists():
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.chmod(tmp, 0o444)
+                os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return sha
+
+    def lookup(self, source):
+        sha = self.index.get(source)
+        return sha if sha and self.has(sha) else None
+
+    def known_missing(self, source):
+        return self.index.get(source) == ''
+
+    def remember(self, source, sha):
+        """Record source's content; sha '' records that it does not exist."""
+        with self.lock:
+            if self.index.get(source) != sha:
+                self.index[source] = sha
+                self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self.index_path, json.dumps({'version': INDEX_VERSION, 'sources': self.index},
+                                                  indent=2, sort_keys=True) + '\n')
+        self.dirty = False
+
+
+def load_manifest(path=None):
+    manifest = json.loads(Path(path or DEFAULT_MANIFEST).read_text())
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"unsupported driver manifest version {manifest.get('version')!r}")
+    return manifest
+
+
+def makefile_text(spec):
+    """Out-of-tree kbuild Makefile for a manifest 'makefile' entry."""
+    obj = spec['obj']
+    lines = [f"obj-m := {obj}.o"]
+    if spec.get('objs'):
+        lines.append(f"{obj}-y := {' '.join(spec['objs'])}")
+    if spec.get('ccflags'):
+        lines += ['', f"ccflags-y += {spec['ccflags']}"]
+    return '\n'.join(lines) + '\n\n' + MAKEFILE_TAIL
+
+
+def entries(manifest):
+    """One dict per file to fetch: dest (relative to the output dir), tree,
+    ref, candidate paths, optional flag and sha256 pin."""
+    out = []
+    for driver in manifest['drivers']:
+        tree = manifest['trees'][driver['tree']]
+        for f in driver['files']:
+            paths = f['path'] if isinstance(f['path'], list) else [f['path']]
+            out.append({'dest': f"{driver['name']}/{f.get('dest') or paths[0].rsplit('/', 1)[-1]}",
+                        'tree': driver['tree'], 'url': tree['url'], 'ref': tree['ref'], 'paths': paths,
+                        'optional': f.get('optional', False), 'sha256': f.get('sha256')})
+    return out
+
+
+def source_id(entry, path):
+    return f"{entry['url']}@{entry['ref']}:{path}"
+
+
+def source_url(entry, path, mirror=None):
+    if mirror is None:
+        return f"{entry['url'].rstrip('/')}/{entry['ref']}/{path}"
+    if '://' not in mirror:
+        mirror = Path(mirror).resolve().as_uri()
+    return f"{mirror.rstrip('/')}/{entry['tree']}/{entry['ref']}/{path}"
+
+
+def link(src, dest):
+    """Hardlink src to dest (copying across filesystems); False if dest
+    already is src or a copy of it."""
+    dest = Path(dest)
+    try:
+        if os.path.samefile(src, dest):
+            return False
+        if os.path.getsize(src) == os.path.getsize(dest) and Path(src).read_bytes() == dest.read_bytes():
+            return False
+    except OSError:
+        pass
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+    return True
+
+
+class PatchedFiles:
+    """The files patch_engine.py patched in out_dir, read from its state
+    file: resolved path -> (state path, pre-image sha256, post-image sha256)."""
+
+    def __init__(self, out_dir):
+        state = patch_engine.load_state(Path(out_dir) / patch_engine.STATE_NAME)
+        self.hasher = file_hash.Hasher(state['files'])
+        self.targets = {}
+        root = state.get('root')
+        if root:
+            for target, rec in state['targets'].items():
+                path = str(Path(root) / target)
+                self.targets[os.path.realpath(path)] = (path, rec.get('pre'), rec.get('post'))
+
+    def keeps(self, dest, sha):
+        """True if dest is the recorded patched form of the store object sha."""
+        rec = self.targets.get(os.path.realpath(dest))
+        if rec is None or rec[1] != sha:
+            return False
+        entry = self.hasher.entry(rec[0])
+        return entry is not None and entry['sha256'] == rec[2]
+
+
+def _not_found(error):
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 404
+    return isinstance(getattr(error, 'reason', None), FileNotFoundError)
+
+
+def fetch_entry(entry, out_dir, store, mirror=None, refresh=False, offline=False, patched=None):
+    """Fetch one manifest file into out_dir. Returns (dest, status, sha256,
+    message) with status up-to-date, linked, fetched, missing (optional
+    file not found upstream) or failed. Files in patched (PatchedFiles)
+    that were patched from the same content are left alone."""
+    dest = Path(out_dir) / entry['dest']
+    pin = entry['sha256']
+    sha = pin if pin and store.has(pin) else None
+    if sha is None and not refresh:
+        sha = next(filter(None, (store.lookup(source_id(entry, p)) for p in entry['paths'])), None)
+    if sha is not None:
+        if patched is not None and patched.keeps(dest, sha):
+            return entry['dest'], 'up-to-date', sha, 'patched'
+        return entry['dest'], 'linked' if link(store.path(sha), dest) else 'up-to-date', sha, ''
+    if not refresh and all(store.known_missing(source_id(entry, p)) for p in entry['paths']):
+        return entry['dest'], 'missing' if entry['optional'] else 'failed', None, 'not found upstream (cached, use --refresh)'
+    if offline:
+        return entry['dest'], 'missing' if entry['optional'] else 'failed', None, 'not in the store (offline)'
+    errors = []
+    for path in entry['paths']:
+        url = source_url(entry, path, mirror)
+        try:
+            with urllib.request.urlopen(url, timeout=TIMEOUT) as fh:
+                sha = store.add(fh)
+        except OSError as e:
+            if _not_found(e):
+                store.remember(source_id(entry, path), '')
+            errors.append(f"{url}: {e}")
+            continue
+        if pin and sha != pin:
+            return entry['dest'], 'failed', sha, f"{url}: sha256 {sha} does not match the manifest pin {pin}"
+        store.remember(source_id(entry, path), sha)
+        if patched is None or not patched.keeps(dest, sha):
+            link(store.path(sha), dest)
+        return entry['dest'], 'fetched', sha, url
+    return entry['dest'], 'missing' if entry['optional'] else 'failed', None, '; '.join(errors)
+
+
+def write_makefiles(manifest, out_dir):
+    """Write each driver's Makefile unless it already has that content."""
+    written = 0
+    for driver in manifest['drivers']:
+        if 'makefile' not in driver:
+            continue
+        path = Path(out_dir) / driver['name'] / 'Makefile'
+        text = makefile_text(driver['makefile'])
+        try:
+            if path.read_text() == text:
+                continue
+        except OSError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(path, text)
+        written += 1
+    return written
+
+
+def fetch(manifest, out_dir, store, mirror=None, jobs=8, refresh=False, offline=False):
+    """Fetch every manifest file into out_dir concurrently and write the
+    Makefiles. Returns fetch_entry() results in manifest order."""
+    todo = entries(manifest)
+    jobs = max(1, min(jobs, len(todo) or 1))
+    patched = PatchedFiles(out_dir)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(lambda e: fetch_entry(e, out_dir, store, mirror, refresh, offline, patched), todo))
+    store.save()
+    write_makefiles(manifest, out_dir)
+    return results
+
+
+def export_mirror(manifest, store, mirror_dir):
+    """Lay out the store's copy of every manifest file as a mirror
+    (<mirror>/<tree>/<ref>/<path>). Returns the number of files exported."""
+    count = 0
+    for entry in entries(manifest):
+        for path in entry['paths']:
+            sha = store.lookup(source_id(entry, path))
+            if sha is None and entry['sha256'] and store.has(entry['sha256']):
+                sha = entry['sha256']
+            if sha is None:
+                continue
+            link(store.path(sha), Path(mirror_dir) / entry['tree'] / entry['ref'] / path)
+            count += 1
+            break
+    return count
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Fetch the GPL driver sources into extracted-drivers/')
+    p.add_argument('--manifest', default=str(DEFAULT_MANIFEST), help='Driver manifest (JSON)')
+    p.add_argument('--out-dir', default=str(DEFAULT_OUT_DIR), help='Output directory')
+    p.add_argument('--store', default=None, help='Content-addressed store (default: ~/.cache/uconsole-drivers)')
+    p.add_argument('--mirror', default=None, help='Fetch from a mirror directory or URL instead of upstream')
+    p.add_argument('--jobs', '-j', type=int, default=8, help='Number of concurrent downloads')
+    p.add_argument('--refresh', action='store_true', help='Re-resolve branch refs instead of using the store index')
+    p.add_argument('--offline', action='store_true', help='Only use files already in the store')
+    p.add_argument('--clean', action='store_true', help='Remove the output directory and exit')
+    p.add_argument('--export-mirror', metavar='DIR', default=None, help='Write a mirror of the stored files and exit')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.clean:
+        shutil.rmtree(args.out_dir, ignore_errors=True)
+        print(f"Removed {args.out_dir}")
+        return 0
+    try:
+        manifest = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Error: cannot read manifest {args.manifest}: {e}", file=sys.stderr)
+        return 2
+    store = Store(args.store)
+    if args.export_mirror:
+        count = export_mirror(manifest, store, args.export_mirror)
+        print(f"Exported {count} files to {args.export_mirror}")
+        return 0
+    results = fetch(manifest, args.out_dir, store, args.mirror, args.jobs, args.refresh, args.offline)
+    counts = {'fetched': 0, 'linked': 0, 'up-to-date': 0, 'missing': 0, 'failed': 0}
+    for dest, status, sha, msg in results:
+        counts[status] += 1
+        if status == 'fetched':
+            print(f"{sha}  {dest}")
+        elif status == 'missing':
+            print(f"Warning: {dest} not found ({msg})")
+        elif status == 'failed':
+            print(f"FAILED {dest}: {msg}")
+    print(', '.join(f"{n} {k.replace('-', ' ')}" for k, n in counts.items()))
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
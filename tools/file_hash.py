@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+file_hash.py
+
+File hashing and JSON state helpers shared by the build tools
+(build_overlays.py, build_modules.py, patch_engine.py, fetch_drivers.py,
+dts_symbols.py).
+
+A Hasher is seeded with the hashes a tool recorded on its previous run and
+only reads a file again when its size or mtime changed, so an up-to-date
+check is a stat() per file.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+CHUNK = 64 * 1024
+
+
+def stamp(path):
+    """[size, mtime_ns] of path; raises OSError like os.stat()."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Hasher:
+    """sha256 of files, reusing a previously recorded hash when the file's
+    size and mtime are unchanged."""
+
+    def __init__(self, known=None):
+        # path -> {'stamp': [size, mtime_ns], 'sha256': ...}
+        self.known = dict(known or {})
+        self.hashed = 0
+
+    def entry(self, path):
+        path = str(path)
+        try:
+            st = stamp(path)
+        except OSError:
+            return None
+        old = self.known.get(path)
+        if old is not None and old['stamp'] == st:
+            return old
+        self.hashed += 1
+        entry = {'stamp': st, 'sha256': file_sha256(path)}
+        self.known[path] = entry
+        return entry
+
+
+def write_manifest(path, manifest):
+    """Write manifest as JSON to path atomically (temporary file + rename)."""
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+    os.replace(tmp, path)
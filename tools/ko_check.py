@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+ko_check.py
+
+Pre-flash check of built kernel modules (.ko) against the target kernel,
+without modinfo, readelf or modprobe.
+
+Each module is mapped with mmap and its ELF section headers are read with
+struct.unpack_from (32/64-bit, either byte order). Only two sections are
+looked at:
+
+- .modinfo: the key=value strings (vermagic, name, depends, ...)
+- __versions: the symbols the module imports with the CRC it was built
+  against (CONFIG_MODVERSIONS); the newer __version_ext_crcs and
+  __version_ext_names pair is read as well
+
+and compared with the target kernel's Module.symvers and vermagic. The
+result names the exact mismatches modprobe would otherwise only report on
+the device ("disagrees about version of symbol ...", "Unknown symbol ...",
+"version magic ... should be ..."). Symbols exported by another module in
+the checked set are accepted with any CRC. Modules are checked
+concurrently (--jobs).
+
+Usage: ko_check.py [PATH ...] [--kernel-dir DIR] [--symvers FILE]
+                   [--vermagic STRING | --release RELEASE] [--json]
+
+PATH defaults to /var/lib/modules-overlay; directories are searched for
+*.ko. --kernel-dir reads DIR/Module.symvers and the release from
+DIR/include/config/kernel.release. Exit status: 0 if every module matches,
+1 on mismatches, 2 if a file is not a readable module.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+DEFAULT_PATH = '/var/lib/modules-overlay'
+ELF_MAGIC = b'\x7fELF'
+SHT_NOBITS = 8
+MODVERSION_SIZE = 64    # struct modversion_info: unsigned long crc + name[64 - sizeof(long)]
+
+_EHDR = {1: struct.Struct('HHIIIIIHHHHHH'), 2: struct.Struct('HHIQQQIHHHHHH')}
+_SHDR = {1: struct.Struct('IIIIIIIIII'), 2: struct.Struct('IIQQQQIIQQ')}
+
+
+class KoError(ValueError):
+    pass
+
+
+class KoModule:
+    """The parts of a .ko that decide whether it loads: modinfo, imported
+    symbol CRCs and exported symbol names."""
+    __slots__ = ('path', 'modinfo', 'versions', 'exports')
+
+    def __init__(self, path, modinfo, versions, exports):
+        self.path = path
+        self.modinfo = modinfo      # key -> [values]
+        self.versions = versions    # [(symbol, crc)]
+        self.exports = exports      # exported symbol names
+
+    @property
+    def name(self):
+        return (self.modinfo.get('name') or [Path(self.path).name[:-3].replace('-', '_')])[0]
+
+    @property
+    def vermagic(self):
+        values = self.modinfo.get('vermagic')
+        return values[0] if values else None
+
+
+def _sections(buf):
+    """{name: (offset, size)} of the sections stored in an ELF file."""
+    if len(buf) < 52 or buf[:4] != ELF_MAGIC:
+        raise KoError('not an ELF file')
+    cls, data = buf[4], buf[5]
+    if cls not in (1, 2) or data not in (1, 2):
+        raise KoError(f"unsupported ELF class {cls} / data encoding {data}")
+    order = '<' if data == 1 else '>'
+    ehdr = struct.Struct(order + _EHDR[cls].format)
+    shdr = struct.Struct(order + _SHDR[cls].format)
+    fields = ehdr.unpack_from(buf, 16)
+    shoff, shentsize, shnum, shstrndx = fields[5], fields[10], fields[11], fields[12]
+    if shoff == 0 or shnum == 0:
+        raise KoError('no section headers')
+    if shentsize < shdr.size or shoff + shnum * shentsize > len(buf) or shstrndx >= shnum:
+        raise KoError('section headers are truncated')
+    headers = [shdr.unpack_from(buf, shoff + i * shentsize) for i in range(shnum)]
+    # (name, type, flags, addr, offset, size, ...)
+    strtab_off, strtab_size = headers[shstrndx][4], headers[shstrndx][5]
+    sections = {}
+    for h in headers[1:]:
+        if h[1] == SHT_NOBITS or h[4] + h[5] > len(buf):
+            continue
+        start = strtab_off + h[0]
+        end = buf.find(b'\0', start, strtab_off + strtab_size)
+        if end < 0:
+            continue
+        sections[bytes(buf[start:end]).decode('ascii', 'replace')] = (h[4], h[5])
+    return sections, cls, order
+
+
+def _strings(buf, offset, size):
+    return [s.decode('utf-8', 'replace') for s in bytes(buf[offset:offset + size]).split(b'\0') if s]
+
+
+def parse_ko(buf, path=None):
+    """KoModule of a module image in buf (bytes or an mmap)."""
+    sections, cls, order = _sections(buf)
+    modinfo = {}
+    if '.modinfo' in sections:
+        for item in _strings(buf, *sections['.modinfo']):
+            key, sep, value = item.partition('=')
+            if sep:
+                modinfo.setdefault(key, []).append(value)
+    versions = []
+    if '__versions' in sections:
+        offset, size = sections['__versions']
+        crc = struct.Struct(order + ('I' if cls == 1 else 'Q'))
+        for pos in range(offset, offset + size - MODVERSION_SIZE + 1, MODVERSION_SIZE):
+            start = pos + crc.size
+            end = buf.find(b'\0', start, pos + MODVERSION_SIZE)
+            name = bytes(buf[start:end if end >= 0 else pos + MODVERSION_SIZE]).decode('ascii', 'replace')
+            versions.append((name, crc.unpack_from(buf, pos)[0] & 0xffffffff))
+    if '__version_ext_names' in sections and '__version_ext_crcs' in sections:
+        names = _strings(buf, *sections['__version_ext_names'])
+        offset, size = sections['__version_ext_crcs']
+        crcs = struct.unpack_from(f"{order}{size // 4}I", buf, offset)
+        versions.extend(zip(names, crcs))
+    exports = []
+    if '__ksymtab_strings' in sections:
+        exports = _strings(buf, *sections['__ksymtab_strings'])
+    return KoModule(str(path) if path else None, modinfo, versions, exports)
+
+
+def read_ko(path):
+    """Map path read-only and parse it."""
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            raise KoError('empty file')
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return parse_ko(mm, path)
+    finally:
+        mm.close()
+
+
+def load_symvers(path):
+    """{symbol: crc} of a Module.symvers file."""
+    crcs = {}
+    with open(path, 'rb') as fh:
+        for line in fh:
+            fields = line.split(b'\t', 2)
+            if len(fields) >= 2:
+                try:
+                    crcs[fields[1].decode('ascii', 'replace')] = int(fields[0], 16)
+                except ValueError:
+                    continue
+    return crcs
+
+
+class Target:
+    """What the target kernel expects; any part may be unknown (None)."""
+
+    def __init__(self, symvers=None, vermagic=None, release=None):
+        self.symvers = symvers
+        self.vermagic = ' '.join(vermagic.split()) if vermagic else None
+        self.release = release or (self.vermagic.split()[0] if self.vermagic else None)
+
+    @property
+    def modversions(self):
+        """True if the kernel was built with CONFIG_MODVERSIONS (its
+        Module.symvers has CRCs)."""
+        return bool(self.symvers) and any(self.symvers.values())
+
+    @classmethod
+    def from_kernel_dir(cls, kernel_dir, vermagic=None, release=None):
+        kernel_dir = Path(kernel_dir)
+        symvers = None
+        if (kernel_dir / 'Module.symvers').is_file():
+            symvers = load_symvers(kernel_dir / 'Module.symvers')
+        if release is None:
+            try:
+                release = (kernel_dir / 'include/config/kernel.release').read_text().strip() or None
+            except OSError:
+                pass
+        return cls(symvers, vermagic, release)
+
+
+def check_module(module, target, provided=()):
+    """Problems of one module as (kind, symbol or None, message); kinds are
+    vermagic, crc, unknown-symbol and no-modversions."""
+    problems = []
+    vermagic = module.vermagic
+    if vermagic is None:
+        problems.append(('vermagic', None, 'no vermagic in .modinfo'))
+    elif target.vermagic and ' '.join(vermagic.split()) != target.vermagic:
+        problems.append(('vermagic', None, f"version magic '{vermagic}' should be '{target.vermagic}'"))
+    elif target.release and vermagic.split()[0] != target.release:
+        problems.append(('vermagic', None, f"built for {vermagic.split()[0]}, target kernel is {target.release}"))
+    if target.symvers is None:
+        return problems
+    if not module.versions and target.modversions:
+        problems.append(('no-modversions', None, 'no __versions section (built without CONFIG_MODVERSIONS?)'))
+    for symbol, crc in module.versions:
+        expected = target.symvers.get(symbol)
+        if expected is None:
+            if symbol not in provided and symbol != 'module_layout':
+                problems.append(('unknown-symbol', symbol, f"Unknown symbol {symbol}"))
+        elif expected != crc:
+            problems.append(('crc', symbol, f"disagrees about version of symbol {symbol}"
+                                            f" (module 0x{crc:08x}, kernel 0x{expected:08x})"))
+    return problems
+
+
+def collect_modules(paths):
+    """Expand directories to the *.ko files below them."""
+    out = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            out.extend(sorted(p.rglob('*.ko')))
+        else:
+            out.append(p)
+    return out
+
+
+def check_paths(paths, target, jobs=None):
+    """Check every module in paths. Returns [(path, KoModule or None,
+    problems, error)] in path order."""
+    files = collect_modules(paths)
+
+    def load(path):
+        try:
+            return read_ko(path), None
+        except (OSError, ValueError, struct.error) as e:
+            return None, str(e)
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(files) or 1))
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        loaded = list(pool.map(load, files))
+    provided = {sym for module, _ in loaded if module for sym in module.exports}
+    results = []
+    for path, (module, error) in zip(files, loaded):
+        problems = check_module(module, target, provided) if module else []
+        results.append((str(path), module, problems, error))
+    return results
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Check .ko vermagic and symbol CRCs against a target kernel')
+    p.add_argument('paths', nargs='*', default=[DEFAULT_PATH], help=f"Modules or directories (default: {DEFAULT_PATH})")
+    p.add_argument('--kernel-dir', default=None, help='Kernel build tree with Module.symvers')
+    p.add_argument('--symvers', default=None, help='Module.symvers of the target kernel')
+    p.add_argument('--vermagic', default=None, help='Expected vermagic string')
+    p.add_argument('--release', default=None, help='Expected kernel release (first vermagic field)')
+    p.add_argument('--jobs', '-j', type=int, default=None, help='Modules read concurrently')
+    p.add_argument('--json', action='store_true', help='Print one JSON record per module')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.kernel_dir:
+        target = Target.from_kernel_dir(args.kernel_dir, args.vermagic, args.release)
+    else:
+        target = Target(None, args.vermagic, args.release)
+    if args.symvers:
+        try:
+            target.symvers = load_symvers(args.symvers)
+        except OSError as e:
+            print(f"Error: cannot read {args.symvers}: {e}", file=sys.stderr)
+            return 2
+    if target.symvers is None and target.vermagic is None and target.release is None:
+        print('Warning: no Module.symvers, vermagic or release given; only reading the modules', file=sys.stderr)
+    results = check_paths(args.paths, target, args.jobs)
+    status = 0
+    for path, module, problems, error in results:
+        if args.json:
+            print(json.dumps({'file': path, 'module': module.name if module else None,
+                              'vermagic': module.vermagic if module else None,
+                              'imports': len(module.versions) if module else 0, 'error': error,
+                              'problems': [{'kind': k, 'symbol': s, 'message': m} for k, s, m in problems]},
+                             sort_keys=True))
+        elif error:
+            print(f"{path}: ERROR: {error}")
+        elif problems:
+            for kind, symbol, message in problems:
+                print(f"{path}: {module.name}: {message}")
+        else:
+            print(f"{path}: OK ({len(module.versions)} symbols)")
+        if error:
+            status = 2
+        elif problems and status == 0:
+            status = 1
+    if not args.json:
+        bad = sum(1 for _, _, problems, error in results if problems or error)
+        print(f"{len(results)} modules checked, {bad} with problems")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
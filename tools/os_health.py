@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+os_health.py
+
+Offline health inspector for a flashed uConsole CM5 image: the EFI (boot)
+partition and the root partition, mounted or extracted to directories.
+
+The independent checks run concurrently in one pass over both trees:
+
+- config.txt, extraconfig.txt and files they `include`: dtoverlay= lines
+  (with the [section] they are in), cmdline= and other settings
+- every referenced overlay must exist as overlays/<name>.dtbo on the boot
+  partition with a valid FDT header
+- cmdline.txt: the root= device (UUID, PARTUUID, LABEL or path)
+- etc/fstab: the / entry, which should name the same device as root=
+- etc/os-release
+- (usr/)lib/modules: installed kernel versions and their modules.dep, and
+  the vermagic of the modules in var/lib/modules-overlay against them
+  (see ko_check.py)
+
+I/O is lazy and bounded for slow USB-attached eMMC: directories are listed
+once without stat(), text files are read up to MAX_READ bytes, overlays
+only have their 40-byte header read and modules are mapped, so only the
+pages holding their section headers and metadata are read.
+
+Findings have a severity (ok, warning or error). The exit status is 0 when
+everything is ok, 2 when there are warnings or errors, and 1 when the
+partitions cannot be inspected at all.
+
+Usage: os_health.py --boot DIR --root DIR [--json] [--jobs N]
+"""
+import argparse
+import json
+import os
+import re
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from tools import ko_check
+except ImportError:  # executed as a script from tools/
+    import ko_check
+
+
+MAX_READ = 256 * 1024
+FDT_MAGIC = 0xd00dfeed
+BOOT_CONFIGS = ('config.txt', 'extraconfig.txt')
+MODULE_DIRS = ('usr/lib/modules', 'lib/modules')
+MODULES_OVERLAY = 'var/lib/modules-overlay'
+
+_ROOT_RE = re.compile(r'(?:^|\s)root=(\S+)')
+
+
+class Finding:
+    __slots__ = ('severity', 'check', 'message')
+
+    def __init__(self, severity, check, message):
+        self.severity = severity
+        self.check = check
+        self.message = message
+
+    def to_dict(self):
+        return {'severity': self.severity, 'check': self.check, 'message': self.message}
+
+
+def read_text(path, limit=MAX_READ):
+    """Up to limit bytes of a text file, or None if it cannot be read."""
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read(limit).decode('utf-8', 'replace')
+    except OSError:
+        return None
+
+
+def list_dir(path):
+    """Entry names of a directory (no stat), or None if it is missing."""
+    try:
+        with os.scandir(path) as it:
+            return sorted(e.name for e in it)
+    except OSError:
+        return None
+
+
+def parse_boot_config(boot):
+    """Settings of config.txt/extraconfig.txt and their includes. Returns
+    {'files': [...], 'overlays': [(name, params, file, line, section)],
+    'cmdline': [...], 'settings': {key: value}}."""
+    facts = {'files': [], 'overlays': [], 'cmdline': [], 'settings': {}}
+    queue = list(BOOT_CONFIGS)
+    seen = set()
+    while queue:
+        name = queue.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        text = read_text(Path(boot) / name)
+        if text is None:
+            continue
+        facts['files'].append(name)
+        section = 'all'
+        for number, raw in enumerate(text.splitlines(), 1):
+            line = raw.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                section = line[1:-1]
+                continue
+            if line.startswith('include '):
+                queue.append(line.split(None, 1)[1])
+                continue
+            key, sep, value = line.partition('=')
+            if not sep:
+                continue
+            key = key.strip()
+            value = value.strip()
+            if key == 'dtoverlay':
+                if value:
+                    overlay, _, params = value.partition(',')
+                    facts['overlays'].append((overlay.strip(), params, name, number, section))
+            elif key == 'cmdline':
+                facts['cmdline'].append(value)
+            else:
+                facts['settings'][key] = value
+    return facts
+
+
+def check_dtbo(path):
+    """None if path starts with a valid FDT header, else the problem."""
+    try:
+        with open(path, 'rb') as fh:
+            header = fh.read(40)
+            size = os.fstat(fh.fileno()).st_size
+    except OSError:
+        return 'missing'
+    if len(header) < 40:
+        return 'truncated header'
+    magic, totalsize = struct.unpack_from('>II', header, 0)
+    if magic != FDT_MAGIC:
+        return f"bad magic 0x{magic:08x}"
+    if totalsize > size:
+        return f"truncated ({size} of {totalsize} bytes)"
+    return None
+
+
+def parse_cmdline(boot):
+    text = read_text(Path(boot) / 'cmdline.txt')
+    if text is None:
+        return None
+    line = text.strip()
+    m = _ROOT_RE.search(line)
+    return {'cmdline': line, 'root': m.group(1) if m else None, 'lines': len(text.strip().splitlines())}
+
+
+def parse_fstab(root):
+    text = read_text(Path(root) / 'etc/fstab')
+    if text is None:
+        return None
+    entries = []
+    for line in text.splitlines():
+        fields = line.split('#', 1)[0].split()
+        if len(fields) >= 3:
+            entries.append({'device': fields[0], 'mountpoint': fields[1], 'type': fields[2],
+                            'options': fields[3] if len(fields) > 3 else 'defaults'})
+    return entries
+
+
+def parse_os_release(root):
+    for rel in ('etc/os-release', 'usr/lib/os-release'):
+        text = read_text(Path(root) / rel)
+        if text is None:
+            continue
+        info = {}
+        for line in text.splitlines():
+            key, sep, value = line.partition('=')
+            if sep and key.strip() and not key.startswith('#'):
+                info[key.strip()] = value.strip().strip('"\'')
+        return info
+    return None
+
+
+def scan_modules(root):
+    """{'dirs': [...], 'kernels': {version: has modules.dep}, 'overlay':
+    [(module file, vermagic)]}."""
+    facts = {'dirs': [], 'kernels': {}, 'overlay': []}
+    for rel in MODULE_DIRS:
+        names = list_dir(Path(root) / rel)
+        if names is None:
+            continue
+        facts['dirs'].append(rel)
+        for version in names:
+            if version not in facts['kernels']:
+                facts['kernels'][version] = os.path.exists(Path(root) / rel / version / 'modules.dep')
+    overlay = Path(root) / MODULES_OVERLAY
+    for name in list_dir(overlay) or ():
+        if name.endswith('.ko'):
+            try:
+                facts['overlay'].append((name, ko_check.read_ko(overlay / name).vermagic))
+            except (OSError, ValueError, struct.error):
+                facts['overlay'].append((name, None))
+    return facts
+
+
+def same_device(a, b):
+    """True if two fstab/cmdline device specs name the same device."""
+    def norm(spec):
+        spec = spec.strip()
+        for prefix in ('UUID=', 'PARTUUID='):
+            if spec.upper().startswith(prefix):
+                return prefix + spec[len(prefix):].lower()
+        return spec
+    return norm(a) == norm(b)
+
+
+def inspect(boot, root, jobs=None):
+    """Inspect a boot and a root tree. Returns (facts, findings)."""
+    tasks = {
+        'config': (parse_boot_config, boot),
+        'overlay_files': (list_dir, Path(boot) / 'overlays'),
+        'cmdline': (parse_cmdline, boot),
+        'fstab': (parse_fstab, root),
+        'os_release': (parse_os_release, root),
+        'modules': (scan_modules, root),
+    }
+    with ThreadPoolExecutor(max_workers=jobs or len(tasks)) as pool:
+        futures = {key: pool.submit(fn, arg) for key, (fn, arg) in tasks.items()}
+        facts = {key: f.result() for key, f in futures.items()}
+
+    findings = []
+
+    def add(severity, check, message):
+        findings.append(Finding(severity, check, message))
+
+    config = facts['config']
+    if not config['files']:
+        add('error', 'config', f"no {' or '.join(BOOT_CONFIGS)} on the boot partition")
+    else:
+        add('ok', 'config', f"{', '.join(config['files'])}: {len(config['overlays'])} overlays")
+    present = set(facts['overlay_files'] or ())
+    missing = [o for o in config['overlays'] if f"{o[0]}.dtbo" not in present]
+    with ThreadPoolExecutor(max_workers=jobs or 8) as pool:
+        found = [o for o in config['overlays'] if f"{o[0]}.dtbo" in present]
+        problems = list(pool.map(lambda o: check_dtbo(Path(boot) / 'overlays' / f"{o[0]}.dtbo"), found))
+    for name, _, cfg, line, section in missing:
+        add('warning', 'overlays', f"{cfg}:{line}: dtoverlay={name} [{section}]: overlays/{name}.dtbo not found")
+    for (name, _, cfg, line, section), problem in zip(found, problems):
+        if problem:
+            add('error', 'overlays', f"{cfg}:{line}: overlays/{name}.dtbo: {problem}")
+    if config['overlays'] and not missing and not any(problems):
+        add('ok', 'overlays', f"all {len(config['overlays'])} referenced overlays present")
+
+    cmdline = facts['cmdline']
+    if cmdline is None:
+        add('warning', 'cmdline', 'no cmdline.txt on the boot partition')
+    elif cmdline['root'] is None:
+        add('warning', 'cmdline', 'cmdline.txt has no root= argument')
+    else:
+        if cmdline['lines'] > 1:
+            add('warning', 'cmdline', 'cmdline.txt has more than one line; the firmware only reads the first')
+        add('ok', 'cmdline', f"root={cmdline['root']}")
+
+    fstab = facts['fstab']
+    if fstab is None:
+        add('error', 'fstab', 'no etc/fstab on the root partition')
+    else:
+        root_entry = next((e for e in fstab if e['mountpoint'] == '/'), None)
+        if root_entry is None:
+            add('warning', 'fstab', 'etc/fstab has no / entry')
+        elif cmdline and cmdline['root'] and not same_device(root_entry['device'], cmdline['root']):
+            add('error', 'fstab', f"/ is {root_entry['device']} in etc/fstab but root={cmdline['root']} in cmdline.txt")
+        else:
+            add('ok', 'fstab', f"/ on {root_entry['device']} ({root_entry['type']})")
+
+    release = facts['os_release']
+    if release is None:
+        add('error', 'os-release', 'no etc/os-release on the root partition')
+    else:
+        add('ok', 'os-release', release.get('PRETTY_NAME') or release.get('NAME') or 'unnamed')
+
+    modules = facts['modules']
+    if not modules['dirs']:
+        add('error', 'modules', 'no lib/modules directory on the root partition')
+    elif not modules['kernels']:
+        add('warning', 'modules', f"no kernel modules installed in {', '.join(modules['dirs'])}")
+    else:
+        for version, has_dep in sorted(modules['kernels'].items()):
+            if not has_dep:
+                add('warning', 'modules', f"{version}: modules.dep missing (depmod not run)")
+        add('ok', 'modules', f"kernels: {', '.join(sorted(modules['kernels']))}")
+        for name, vermagic in modules['overlay']:
+            if vermagic is None:
+                add('error', 'modules-overlay', f"{name}: not a readable kernel module")
+            elif vermagic.split()[0] not in modules['kernels']:
+                add('warning', 'modules-overlay', f"{name}: built for {vermagic.split()[0]}, "
+                                                  f"installed kernels: {', '.join(sorted(modules['kernels']))}")
+    return facts, findings
+
+
+def status_of(findings):
+    return 2 if any(f.severity != 'ok' for f in findings) else 0
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Inspect a flashed image\'s boot and root partitions')
+    p.add_argument('--boot', required=True, help='Mounted or extracted EFI/boot partition')
+    p.add_argument('--root', required=True, help='Mounted or extracted root partition')
+    p.add_argument('--json', action='store_true', help='Print the facts and findings as JSON')
+    p.add_argument('--jobs', '-j', type=int, default=None, help='Concurrent checks')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for label, path in (('boot', args.boot), ('root', args.root)):
+        if not os.path.isdir(path):
+            print(f"Error: {label} partition {path} is not a directory", file=sys.stderr)
+            return 1
+    facts, findings = inspect(args.boot, args.root, args.jobs)
+    if args.json:
+        facts['config']['overlays'] = [{'name': n, 'params': p, 'file': f, 'line': l, 'section': s}
+                                       for n, p, f, l, s in facts['config']['overlays']]
+        print(json.dumps({'facts': facts, 'findings': [f.to_dict() for f in findings]}, indent=2, sort_keys=True))
+    else:
+        for f in findings:
+            print(f"[{f.severity.upper()}] {f.check}: {f.message}")
+        bad = sum(f.severity != 'ok' for f in findings)
+        print(f"{len(findings)} checks, {bad} problems")
+    return status_of(findings)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
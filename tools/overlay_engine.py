@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+overlay_engine.py
+
+Apply device-tree overlays to a base board tree in memory and report what
+the combination does, without flashing and booting it.
+
+The base tree (a decompiled board .dts, e.g. from
+`dtc -I dtb -O dts bcm2712-rpi-cm5-cm5io.dtb`) is parsed once with
+dts_parser and turned into a mutable tree of nodes and properties. That
+tree is flattened into plain lists (node table, properties, labels) and
+cached in memory and as versioned JSON under the dtc cache dir, keyed by
+the base content and BASE_CACHE_VERSION. Trying another overlay
+combination rebuilds a copy from the flat form instead of reparsing the
+board; a cache file that cannot be read is rebuilt from the source.
+
+Overlays are applied in order (the dtoverlay= lines of a config.txt, or
+the files given on the command line). Every fragment@N/__overlay__ block
+and every top-level &label { ... } block is merged into its target,
+resolved by target = <&label>, target = <&{/path}> or target-path. The
+report lists:
+
+- override: an overlay changes a property the base tree already set
+- conflict: two overlays set the same property to different values, or
+  define the same label for different nodes
+- dangling: a phandle reference (&label or &{/path}) in an overlay that
+  nothing defines at the point the overlay is applied
+- unresolved-target: a fragment whose target does not exist
+- missing-overlay: a dtoverlay= entry with no matching .dts (e.g. firmware
+  overlays such as dwc2); reported but not an error
+
+Usage: overlay_engine.py --base board.dts [--config config.txt]
+                         [--overlay-dir overlays] [overlay.dts ...] [--dump out.dts]
+Exit status is 1 if there are conflicts, dangling references or
+unresolved targets.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+try:
+    from tools import dtc_cache, dts_parser
+except ImportError:  # executed as a script from tools/
+    import dtc_cache
+    import dts_parser
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_OVERLAY_DIR = REPO_ROOT / 'overlays'
+ERROR_KINDS = ('conflict', 'dangling', 'unresolved-target')
+
+_DTOVERLAY_RE = re.compile(r'^\s*dtoverlay\s*=\s*([^,\s#]*)')
+
+# Bump when the flat base tree format or build_base() output changes
+BASE_CACHE_VERSION = 1
+
+# Base trees parsed in this process: cache key -> flat tree (see _flatten)
+_BASE_CACHE = {}
+
+
+class EProp:
+    __slots__ = ('name', 'value', 'origin')
+
+    def __init__(self, name, value, origin):
+        self.name = name
+        self.value = value
+        self.origin = origin
+
+
+class ENode:
+    """A node of the effective tree. origin is 'file:line' of the source
+    that created it; props map names to EProp."""
+    __slots__ = ('name', 'parent', 'children', 'props', 'labels', 'origin')
+
+    def __init__(self, name, parent=None, origin=''):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.props = {}
+        self.labels = []
+        self.origin = origin
+
+    @property
+    def path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return '/' + '/'.join(reversed(parts))
+
+    def iter(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(list(node.children.values())))
+
+
+class EffectiveTree:
+    def __init__(self):
+        self.root = ENode('/')
+        self.labels = {}
+        # (path, prop) -> overlay file that last set it
+        self.set_by = {}
+
+    def node(self, path):
+        node = self.root
+        for part in path.strip('/').split('/'):
+            if not part:
+                continue
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def resolve(self, ref):
+        """The node a &label or &{/path} reference points at, or None."""
+        if ref.startswith('&{'):
+            return self.node(ref[2:-1])
+        return self.labels.get(ref.lstrip('&'))
+
+
+class Finding:
+    __slots__ = ('kind', 'path', 'message', 'origin')
+
+    def __init__(self, kind, path, message, origin=''):
+        self.kind = kind
+        self.path = path
+        self.message = message
+        self.origin = origin
+
+    def __str__(self):
+        where = f" ({self.origin})" if self.origin else ''
+        return f"{self.kind}: {self.path}: {self.message}{where}"
+
+    def __repr__(self):
+        return f"Finding({str(self)!r})"
+
+
+def _norm(value):
+    return None if value is None else ' '.join(value.split())
+
+
+def _origin(tree, name, offset):
+    return f"{name}:{tree.line_of(offset) + 1}"
+
+
+def _merge(dst, src, tree, name, etree, findings, overlay):
+    """Merge the parsed node src (from tree, file name) into the ENode dst.
+    overlay=False while building the base tree (no findings)."""
+    stack = [(dst, src)]
+    while stack:
+        dnode, snode = stack.pop()
+        for label in snode.labels:
+            existing = etree.labels.get(label)
+            if overlay and existing is not None and existing is not dnode:
+                findings.append(Finding('conflict', dnode.path, f"label {label} already defined for {existing.path}",
+                                        _origin(tree, name, snode.start)))
+            etree.labels[label] = dnode
+            if label not in dnode.labels:
+                dnode.labels.append(label)
+        for prop in snode.props.values():
+            origin = _origin(tree, name, prop.start)
+            old = dnode.props.get(prop.name)
+            if overlay and old is not None and _norm(old.value) != _norm(prop.value):
+                key = (dnode.path, prop.name)
+                previous = etree.set_by.get(key)
+                if previous is not None and previous != name:
+                    findings.append(Finding('conflict', f"{dnode.path}:{prop.name}",
+                                            f"{_norm(old.value)} ({old.origin}) vs {_norm(prop.value)}", origin))
+                else:
+                    findings.append(Finding('override', f"{dnode.path}:{prop.name}",
+                                            f"{_norm(old.value)} -> {_norm(prop.value)}", origin))
+            dnode.props[prop.name] = EProp(prop.name, prop.value, origin)
+            if overlay:
+                etree.set_by[(dnode.path, prop.name)] = name
+        for child in snode.children:
+            dchild = dnode.children.get(child.name)
+            if dchild is None:
+                dchild = dnode.children[child.name] = ENode(child.name, dnode, _origin(tree, name, child.start))
+            stack.append((dchild, child))
+
+
+def build_base(text, name='base'):
+    """EffectiveTree for a base board DTS text."""
+    tree = dts_parser.parse(text)
+    etree = EffectiveTree()
+    refs = []
+    for root in tree.roots:
+        if root.name == '/':
+            _merge(etree.root, root, tree, name, etree, [], False)
+        elif root.name.startswith('&'):
+            refs.append(root)
+    # &label { ... } blocks can refer to labels from any '/' block
+    for root in refs:
+        target = etree.resolve(root.name)
+        if target is not None:
+            _merge(target, root, tree, name, etree, [], False)
+    return etree
+
+
+def _flatten(etree):
+    """Plain, JSON-serialisable form of an EffectiveTree: nodes as
+    [parent index, name, origin, labels, [[prop, value, origin], ...]] in
+    pre-order, and the label map as label -> node index."""
+    index = {}
+    nodes = []
+    for node in etree.root.iter():
+        index[id(node)] = len(nodes)
+        parent = index[id(node.parent)] if node.parent is not None else -1
+        nodes.append([parent, node.name, node.origin, list(node.labels),
+                      [[p.name, p.value, p.origin] for p in node.props.values()]])
+    labels = {label: index[id(node)] for label, node in etree.labels.items()}
+    return {'version': BASE_CACHE_VERSION, 'nodes': nodes, 'labels': labels}
+
+
+def _unflatten(flat):
+    """EffectiveTree from _flatten() output; raises ValueError if malformed."""
+    if not isinstance(flat, dict) or flat.get('version') != BASE_CACHE_VERSION:
+        raise ValueError('unsupported base cache version')
+    etree = EffectiveTree()
+    built = []
+    try:
+        for parent, name, origin, labels, props in flat['nodes']:
+            if parent < 0:
+                node = etree.root
+                node.origin = origin
+            else:
+                owner = built[parent]
+                node = owner.children[name] = ENode(name, owner, origin)
+            node.labels = list(labels)
+            node.props = {n: EProp(n, v, o) for n, v, o in props}
+            built.append(node)
+        etree.labels = {label: built[i] for label, i in flat['labels'].items()}
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"malformed base cache: {e}") from None
+    return etree
+
+
+def load_base(path, cache_dir=None, use_disk=True):
+    """A fresh copy of the base tree at path, parsed at most once per
+    content (cached in memory and, with use_disk, under cache_dir)."""
+    data = Path(path).read_bytes()
+    key = hashlib.sha256(f"v{BASE_CACHE_VERSION}\0".encode() + data).hexdigest()
+    disk = (Path(cache_dir) if cache_dir else dtc_cache.default_cache_dir() / 'base') / f"{key}.json"
+    # building nodes creates many small linked objects; skip the cyclic GC passes
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        flat = _BASE_CACHE.get(key)
+        if flat is not None:
+            return _unflatten(flat)
+        if use_disk:
+            try:
+                flat = json.loads(disk.read_text())
+                etree = _unflatten(flat)
+                _BASE_CACHE[key] = flat
+                return etree
+            except (OSError, ValueError):
+                pass
+        etree = build_base(data.decode(), Path(path).name)
+        flat = _BASE_CACHE[key] = _flatten(etree)
+        if use_disk:
+            try:
+                disk.parent.mkdir(parents=True, exist_ok=True)
+                tmp = disk.with_name(f"{disk.name}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(flat, separators=(',', ':')))
+                tmp.replace(disk)
+            except OSError:
+                pass
+        return etree
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _fragments(tree):
+    """(target reference, overlay body node, fragment node) for each
+    fragment and top-level &label block of a parsed overlay."""
+    out = []
+    for root in tree.roots:
+        if root.name.startswith('&'):
+            out.append((root.name, root, root))
+            continue
+        for frag in root.children:
+            body = frag.child('__overlay__')
+            if body is None:
+                continue
+            target = None
+            if 'target' in frag.props:
+                groups = dts_parser.cell_groups(frag.props['target'].value)
+                if groups and groups[0]:
+                    target = groups[0][0]
+            elif 'target-path' in frag.props:
+                target = '&{' + frag.props['target-path'].value.strip('"') + '}'
+            out.append((target, body, frag))
+    return out
+
+
+def apply_overlay(etree, text, name):
+    """Apply one overlay (DTS text) to etree in place; returns findings."""
+    findings = []
+    tree = dts_parser.parse(text)
+    fragments = _fragments(tree)
+    # labels the overlay defines itself are valid targets for its references
+    local_labels = set(tree.labels)
+    for target, body, frag in fragments:
+        dst = etree.resolve(target) if target else None
+        if dst is None:
+            findings.append(Finding('unresolved-target', frag.path, f"target {target or '(none)'} not found",
+                                    _origin(tree, name, frag.start)))
+            continue
+        _merge(dst, body, tree, name, etree, findings, True)
+    for node in tree.walk():
+        for prop in node.props.values():
+            if prop.name in ('target', 'target-path') and node.child('__overlay__') is not None:
+                continue
+            for ref in dts_parser.value_refs(prop.value):
+                if ref.lstrip('&') in local_labels or etree.resolve(ref) is not None:
+                    continue
+                findings.append(Finding('dangling', f"{node.path}:{prop.name}", f"reference {ref} is not defined",
+                                        _origin(tree, name, prop.start)))
+    return findings
+
+
+def read_config_overlays(config_path):
+    """dtoverlay= names from a config.txt, in order."""
+    names = []
+    for line in Path(config_path).read_text().splitlines():
+        m = _DTOVERLAY_RE.match(line)
+        if m and m.group(1):
+            names.append(m.group(1))
+    return names
+
+
+def find_overlay(name, dirs):
+    for d in dirs:
+        for candidate in (Path(d) / f"{name}.dts", Path(d) / f"{name}-overlay.dts"):
+            if candidate.exists():
+                return candidate
+    return None
+
+
+def apply_all(base_path, overlays, overlay_dirs=(DEFAULT_OVERLAY_DIR,), cache_dir=None, use_disk=True):
+    """Apply overlays (names or .dts paths) to the base in order. Returns
+    (EffectiveTree, findings)."""
+    etree = load_base(base_path, cache_dir, use_disk)
+    findings = []
+    for entry in overlays:
+        path = Path(entry) if str(entry).endswith('.dts') else find_overlay(entry, overlay_dirs)
+        if path is None or not path.exists():
+            findings.append(Finding('missing-overlay', str(entry), 'no matching .dts found'))
+            continue
+        findings.extend(apply_overlay(etree, path.read_text(), path.name))
+    return etree, findings
+
+
+def to_dts(etree):
+    """Render the effective tree as DTS text."""
+    out = ['/dts-v1/;', '']
+
+    def emit(node, indent):
+        labels = ''.join(f"{lbl}: " for lbl in node.labels)
+        out.append(f"{indent}{labels}{node.name} {{")
+        for prop in node.props.values():
+            out.append(f"{indent}\t{prop.name};" if prop.value is None else f"{indent}\t{prop.name} = {prop.value};")
+        for child in node.children.values():
+            emit(child, indent + '\t')
+        out.append(f"{indent}}};")
+
+    emit(etree.root, '')
+    return '\n'.join(out) + '\n'
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Apply overlays to a base device tree in memory and report conflicts')
+    p.add_argument('overlays', nargs='*', help='Overlay names or .dts files, applied after those from --config')
+    p.add_argument('--base', required=True, help='Base board tree (.dts)')
+    p.add_argument('--config', default=None, help='config.txt whose dtoverlay= lines give the overlay order')
+    p.add_argument('--overlay-dir', action='append', default=[], help=f"Where to look up overlay names (default: {DEFAULT_OVERLAY_DIR})")
+    p.add_argument('--cache-dir', default=None, help='Cache directory for the parsed base tree')
+    p.add_argument('--no-cache', action='store_true', help='Do not read or write the on-disk base cache')
+    p.add_argument('--dump', default=None, help='Write the effective tree as DTS to this file')
+    p.add_argument('--quiet', '-q', action='store_true', help='Only print errors')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = read_config_overlays(args.config) if args.config else []
+    names.extend(args.overlays)
+    dirs = args.overlay_dir or [DEFAULT_OVERLAY_DIR]
+    etree, findings = apply_all(args.base, names, dirs, args.cache_dir, not args.no_cache)
+    for f in findings:
+        if not args.quiet or f.kind in ERROR_KINDS:
+            print(f)
+    if args.dump:
+        Path(args.dump).write_text(to_dts(etree))
+    errors = sum(1 for f in findings if f.kind in ERROR_KINDS)
+    print(f"{len(names)} overlays applied, {errors} errors, "
+          f"{sum(1 for f in findings if f.kind == 'override')} overrides")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
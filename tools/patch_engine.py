@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+patch_engine.py
+
+Stateful application of the unified diffs in patches/ to the fetched driver
+sources, replacing the `patch --dry-run` + `patch` pair fetch-drivers.sh
+ran for every patch on every fetch.
+
+Patches are parsed once per run in Python and applied in memory. All the
+patches that touch a file are applied in order and the file is written
+once, atomically. A hunk is first looked for at its recorded line and then
+at growing offsets from it; when the context does not match exactly, up to
+--fuzz context lines are dropped from each end of the hunk (like patch(1)).
+The offset and fuzz used are reported per hunk. A file with a conflicting
+hunk is left untouched. A patch whose hunks are all already present is
+reported as already applied.
+
+A state file (JSON, by default extracted-drivers/.patch-state.json)
+records the sha256 of every patch and, per target file, the patches
+applied to it and its pre- and post-image hashes. Hashes are reused while a
+file's size and mtime are unchanged (see file_hash.Hasher), so when a
+target still has its recorded post-image the patch is skipped after a
+couple of stat() calls without reading any file. The state also records
+the root the targets are relative to, so that fetch_drivers.py can keep
+patched files instead of relinking their unpatched store objects.
+
+Usage: patch_engine.py [--root REPO] [--patches-dir patches] [--state FILE]
+                       [-p 1] [--fuzz 2] [--dry-run] [PATCH ...]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+try:
+    from tools import file_hash
+except ImportError:  # executed as a script from tools/
+    import file_hash
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PATCHES_DIR = REPO_ROOT / 'patches'
+STATE_NAME = '.patch-state.json'
+STATE_VERSION = 1
+DEV_NULL = '/dev/null'
+
+_HUNK_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+class Hunk:
+    __slots__ = ('old_start', 'old_len', 'new_start', 'new_len', 'lines')
+
+    def __init__(self, old_start, old_len, new_start, new_len):
+        self.old_start = old_start
+        self.old_len = old_len
+        self.new_start = new_start
+        self.new_len = new_len
+        self.lines = []     # (tag, text) with tag ' ', '-' or '+'; text keeps its '\n'
+
+    def images(self, fuzz=0):
+        """(old lines, new lines) with up to fuzz context lines dropped
+        from each end."""
+        lines = self.lines
+        lead = 0
+        while lead < fuzz and lead < len(lines) and lines[lead][0] == ' ':
+            lead += 1
+        trail = 0
+        while trail < fuzz and trail < len(lines) - lead and lines[len(lines) - 1 - trail][0] == ' ':
+            trail += 1
+        lines = lines[lead:len(lines) - trail]
+        return ([t for tag, t in lines if tag != '+'], [t for tag, t in lines if tag != '-'], lead)
+
+
+class FilePatch:
+    __slots__ = ('old_path', 'new_path', 'hunks')
+
+    def __init__(self, old_path, new_path):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks = []
+
+    def target(self, strip=1):
+        path = self.new_path if self.new_path != DEV_NULL else self.old_path
+        parts = path.split('/')
+        return '/'.join(parts[strip:]) if len(parts) > strip else parts[-1]
+
+
+def _header_path(line):
+    # '--- a/path<TAB>timestamp'
+    return line[4:].split('\t', 1)[0].strip()
+
+
+def parse_patch(text):
+    """FilePatches of a unified diff. Raises ValueError on a malformed
+    hunk."""
+    files = []
+    lines = text.splitlines(keepends=True)
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith('--- ') and i + 1 < len(lines) and lines[i + 1].startswith('+++ '):
+            files.append(FilePatch(_header_path(line), _header_path(lines[i + 1])))
+            i += 2
+            continue
+        m = _HUNK_RE.match(line)
+        if m is None:
+            i += 1
+            continue
+        if not files:
+            raise ValueError(f"line {i + 1}: hunk without file header")
+        old_len = int(m.group(2)) if m.group(2) is not None else 1
+        new_len = int(m.group(4)) if m.group(4) is not None else 1
+        hunk = Hunk(int(m.group(1)), old_len, int(m.group(3)), new_len)
+        i += 1
+        old_left, new_left = old_len, new_len
+        while old_left or new_left:
+            if i >= len(lines):
+                raise ValueError(f"truncated hunk {line.strip()}")
+            body = lines[i]
+            tag = body[:1]
+            if body in ('\n', '\r\n'):
+                tag, body = ' ', ' ' + body  # blank context line with its space stripped
+            if tag not in (' ', '-', '+'):
+                raise ValueError(f"line {i + 1}: unexpected {body.rstrip()!r} in hunk {line.strip()}")
+            hunk.lines.append((tag, body[1:]))
+            if tag != '+':
+                old_left -= 1
+            if tag != '-':
+                new_left -= 1
+            i += 1
+            if old_left < 0 or new_left < 0:
+                raise ValueError(f"hunk {line.strip()} is longer than its header says")
+            if i < len(lines) and lines[i].startswith('\\'):
+                # '\ No newline at end of file' refers to the line before it
+                tag, t = hunk.lines[-1]
+                hunk.lines[-1] = (tag, t.rstrip('\n'))
+                i += 1
+        files[-1].hunks.append(hunk)
+    return files
+
+
+def _find(lines, image, expected, lo):
+    """Index >= lo of image in lines, searching outwards from expected."""
+    n = len(image)
+    last = len(lines) - n
+    if last < lo:
+        return None
+    expected = min(max(expected, lo), last)
+    if n == 0:
+        return expected
+    first = image[0]
+    for d in range(0, max(expected - lo, last - expected) + 1):
+        for pos in (expected + d, expected - d) if d else (expected,):
+            if lo <= pos <= last and lines[pos] == first and lines[pos:pos + n] == image:
+                return pos
+    return None
+
+
+def apply_file_patch(lines, fp, fuzz=2):
+    """Apply fp to lines (a list of lines keeping their '\\n') in memory.
+    Returns (status, new lines, notes) where status is applied,
+    already-applied or conflict; notes describe offsets, fuzz and the
+    failing hunks."""
+    out = list(lines)
+    notes = []
+    shift = 0       # where the previous hunk landed relative to its line numbers
+    grown = 0       # lines added minus lines removed by the previous hunks
+    lo = 0
+    reversed_hunks = 0
+    failed = []
+    for number, hunk in enumerate(fp.hunks, 1):
+        pos = None
+        for f in range(0, fuzz + 1):
+            old, new, lead = hunk.images(f)
+            expected = hunk.old_start - 1 + lead + shift if hunk.old_len else hunk.old_start + shift
+            pos = _find(out, old, expected, lo)
+            if pos is not None:
+                break
+            if f == 0 and new and _find(out, new, expected, 0) is not None:
+                # the exact post-image is there: do not fuzz it into a false match
+                break
+        if pos is None:
+            old, new, _ = hunk.images()
+            if new and _find(out, new, hunk.new_start - 1, 0) is not None:
+                reversed_hunks += 1
+            else:
+                failed.append(number)
+                notes.append(f"hunk #{number} FAILED at line {hunk.old_start}")
+            continue
+        # like patch(1), relative to the hunk's own line numbers rather than
+        # to where the previous hunk's offset suggested
+        offset = pos - grown - (hunk.old_start - 1 + lead if hunk.old_len else hunk.old_start)
+        if offset:
+            notes.append(f"hunk #{number} at line {pos + 1 - lead} (offset {offset:+d})")
+        if f:
+            notes.append(f"hunk #{number} with fuzz {f}")
+        out[pos:pos + len(old)] = new
+        grown += len(new) - len(old)
+        shift = offset + grown
+        lo = pos + len(new)
+    if reversed_hunks == len(fp.hunks):
+        return 'already-applied', list(lines), []
+    if failed or reversed_hunks:
+        if reversed_hunks:
+            notes.append(f"{reversed_hunks} hunk(s) already applied")
+        return 'conflict', list(lines), notes
+    return 'applied', out, notes
+
+
+def load_state(path):
+    try:
+        state = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        state = {}
+    if state.get('version') != STATE_VERSION:
+        state = {'version': STATE_VERSION, 'files': {}, 'patches': {}, 'targets': {}}
+    return state
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_once(path, data):
+    """Atomically replace path, breaking any hardlink into the fetch store."""
+    path = Path(path)
+    try:
+        mode = (os.stat(path).st_mode & 0o777) | 0o200
+    except OSError:
+        mode = 0o644
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.chmod(tmp, mode)
+    os.replace(tmp, path)
+
+
+def apply_patches(patches, root=REPO_ROOT, state_path=None, strip=1, fuzz=2, dry_run=False):
+    """Apply patch files (in the given order) below root. Returns a list of
+    (patch name, target, status, notes) with status up-to-date, applied,
+    already-applied, conflict, missing or invalid."""
+    root = Path(root)
+    state_path = Path(state_path) if state_path else root / 'extracted-drivers' / STATE_NAME
+    state = load_state(state_path)
+    hasher = file_hash.Hasher(state['files'])
+    results = []
+    chains = {}     # target -> [(name, patch sha, parsed FilePatch or None)]
+    parsed = {}
+
+    for patch in patches:
+        patch = Path(patch)
+        name = patch.name
+        entry = hasher.entry(patch)
+        if entry is None:
+            results.append((name, None, 'missing', [f"{patch}: not found"]))
+            continue
+        known = state['patches'].get(name)
+        if known and known['sha256'] == entry['sha256']:
+            targets = known['targets']
+        else:
+            try:
+                parsed[name] = {fp.target(strip): fp for fp in parse_patch(patch.read_text(errors='replace'))}
+            except ValueError as e:
+                results.append((name, None, 'invalid', [str(e)]))
+                continue
+            targets = list(parsed[name])
+            state['patches'][name] = {'sha256': entry['sha256'], 'targets': targets}
+        for target in targets:
+            chains.setdefault(target, []).append((name, entry['sha256'], patch))
+
+    for target, chain in chains.items():
+        path = root / target
+        ids = [[name, sha] for name, sha, _ in chain]
+        recorded = state['targets'].get(target)
+        current = hasher.entry(path)
+        if recorded and recorded['patches'] == ids and current and current['sha256'] == recorded['post']:
+            results.extend((name, target, 'up-to-date', []) for name, _, _ in chain)
+            continue
+        try:
+            data = path.read_bytes()
+            lines = data.decode(errors='surrogateescape').splitlines(keepends=True)
+        except OSError:
+            data, lines = None, None
+        file_results = []
+        for name, _, patch in chain:
+            if name not in parsed:
+                parsed[name] = {fp.target(strip): fp for fp in parse_patch(patch.read_text(errors='replace'))}
+            fp = parsed[name][target]
+            if lines is None and fp.old_path != DEV_NULL:
+                file_results.append((name, target, 'missing', [f"{path}: not found"]))
+                continue
+            status, lines, notes = apply_file_patch(lines or [], fp, fuzz)
+            file_results.append((name, target, status, notes))
+        results.extend(file_results)
+        if any(status in ('conflict', 'missing') for _, _, status, _ in file_results):
+            continue
+        new = ''.join(lines).encode(errors='surrogateescape')
+        if dry_run:
+            continue
+        if new != data:
+            _write_once(path, new)
+        state['targets'][target] = {'patches': ids, 'pre': _sha256(data) if data is not None else None,
+                                    'post': _sha256(new)}
+        hasher.entry(path)
+
+    if not dry_run:
+        live = {str(Path(p)) for p in patches} | {str(root / t) for t in state['targets']}
+        state['files'] = {p: e for p, e in hasher.known.items() if p in live}
+        state['root'] = str(root)
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        file_hash.write_manifest(state_path, state)
+    return results
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Apply patches/ to the fetched driver sources, skipping applied ones')
+    p.add_argument('patches', nargs='*', help='Patch files (default: every *.patch in --patches-dir, sorted)')
+    p.add_argument('--root', default=str(REPO_ROOT), help='Directory the patch paths are relative to')
+    p.add_argument('--patches-dir', default=str(DEFAULT_PATCHES_DIR), help='Directory with the patches')
+    p.add_argument('--state', default=None, help=f"State file (default: <root>/extracted-drivers/{STATE_NAME})")
+    p.add_argument('-p', '--strip', type=int, default=1, help='Leading path components to strip')
+    p.add_argument('--fuzz', '-F', type=int, default=2, help='Context lines that may be ignored per hunk end')
+    p.add_argument('--dry-run', action='store_true', help='Report what would happen without writing files')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    patches = args.patches or sorted(str(p) for p in Path(args.patches_dir).glob('*.patch'))
+    if not patches:
+        print('No patches found')
+        return 0
+    results = apply_patches(patches, args.root, args.state, args.strip, args.fuzz, args.dry_run)
+    counts = {}
+    for name, target, status, notes in results:
+        counts[status] = counts.get(status, 0) + 1
+        if status != 'up-to-date':
+            print(f"{name}: {target or '-'}: {status}")
+        for note in notes:
+            print(f"  {note}")
+    print(', '.join(f"{n} {status}" for status, n in sorted(counts.items())))
+    return 1 if any(s in ('conflict', 'missing', 'invalid') for _, _, s, _ in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())